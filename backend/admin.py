@@ -1,11 +1,11 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Shop, ShopProduct, OrderProduct, Order, ProductCategory, Product
+from .models import Shop, ShopProduct, OrderProduct, Order, ProductCategory, Product, OrderNotification
 
 
 # Register your models here.
 class ShopProductAdmin(admin.ModelAdmin):
-    list_display = ['user', 'shop', 'product', 'quantity']
+    list_display = ['user', 'shop', 'product', 'quantity', 'reserved']
     list_filter = ['shop', 'product']
 
 admin.site.register(ShopProduct, ShopProductAdmin)
@@ -28,12 +28,13 @@ admin.site.register(Product, ProductAdmin)
 
 class OrderProductInline(admin.TabularInline):
     model = OrderProduct
+    fk_name = 'order'
     extra = 0
-    readonly_fields = ('product', 'quantity')
+    readonly_fields = ('product', 'product_name', 'shop_name', 'unit_price', 'quantity')
 
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'status_choice', 'updated_at', 'created_at', 'total_price']
+    list_display = ['id', 'user', 'status_choice', 'updated_at', 'created_at', 'total_price', 'parent', 'shop']
     list_filter = ['user', 'status_choice']
     inlines = [OrderProductInline]
 
@@ -79,4 +80,11 @@ class OrderProductAdmin(admin.ModelAdmin):
             obj.order
         )
 
-admin.site.register(OrderProduct, OrderProductAdmin)
\ No newline at end of file
+admin.site.register(OrderProduct, OrderProductAdmin)
+
+class OrderNotificationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'recipient', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+
+
+admin.site.register(OrderNotification, OrderNotificationAdmin)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from . import image_storage  # noqa: F401 (подключает обработчики сигналов изображений)
+        from . import catalog_cache  # noqa: F401 (подключает сброс кеша каталога)
+        from . import db_router  # noqa: F401 (подключает чтение из основной БД в задачах Celery)
+        from . import profiling  # noqa: F401 (подключает учет SQL-запросов к соединениям с БД)
@@ -0,0 +1,213 @@
+from contextlib import nullcontext
+from functools import reduce, wraps
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from .catalog_cache import get_cached_response, set_cached_response
+from .db_router import use_primary
+from .models import Product, ProductCategory, Shop
+from .serializers import (ImageRenditionSerializer, ProductCategorySerializer, ProductDetailSerializer,
+                          ProductListSerializer, ShopSerializer)
+from .views import ProductCategoryViewSet, ProductsViewSet, ShopViewSet, annotate_price
+
+
+def check_policies(sync_view, request, **kwargs):
+    """
+        Выполняет проверки DRF синхронного ViewSet для запроса: те же классы аутентификации,
+        разрешений и ограничения частоты (DEFAULT_THROTTLE_CLASSES со счетчиками в общем кеше),
+        что и у синхронных запросов к тем же URL, поэтому лимиты у них общие.
+
+        Аргументы:
+            - sync_view (Callable): Представление ViewSet (результат as_view).
+            - request (HttpRequest): Запрос.
+            - **kwargs: Параметры URL.
+
+        Возвращает:
+            - Optional[Response]: Готовый ответ DRF с ошибкой (401, 403, 429 и т.п.) или None, если проверки пройдены.
+    """
+    view = sync_view.cls(**sync_view.initkwargs)
+    view.action_map = sync_view.actions
+    view.args, view.kwargs = (), kwargs
+    view.headers = view.default_response_headers
+    request = view.initialize_request(request, **kwargs)
+    view.request = request
+    try:
+        view.initial(request, **kwargs)
+    except Exception as exc:
+        return view.finalize_response(request, view.handle_exception(exc), **kwargs).render()
+    return None
+
+
+def filter_queryset(queryset, params, filterset_fields=(), search_fields=(), ordering_fields=()):
+    """
+        Применяет параметры запроса так же, как фильтры синхронных ViewSet: точное совпадение
+        по filterset_fields (DjangoFilterBackend), поиск 'search' (SearchFilter) и сортировку
+        'ordering' (OrderingFilter).
+
+        Аргументы:
+            - queryset (QuerySet): Исходный набор объектов.
+            - params (QueryDict): Параметры запроса.
+            - filterset_fields (Iterable[str]): Поля фильтрации.
+            - search_fields (Iterable[str]): Поля поиска.
+            - ordering_fields (Iterable[str]): Поля, по которым разрешена сортировка.
+
+        Возвращает:
+            - QuerySet: Отфильтрованный набор объектов (запрос еще не выполнен).
+
+        Исключения:
+            - ValidationError: Если значение фильтра не подходит к типу поля.
+    """
+    for field in filterset_fields:
+        if params.get(field):
+            try:
+                queryset = queryset.filter(**{field: params[field]})
+            except (TypeError, ValueError) as e:
+                raise ValidationError({field: [str(e)]})
+    if search_fields:
+        for term in params.get('search', '').replace(',', ' ').split():
+            queryset = queryset.filter(reduce(or_, (Q(**{f'{field}__icontains': term}) for field in search_fields)))
+    ordering = [term.strip() for term in params.get('ordering', '').split(',')
+                if term.strip().lstrip('-') in ordering_fields]
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    return queryset
+
+
+def render(data, status: int = 200, headers: dict = None) -> HttpResponse:
+    """
+        Аргументы:
+            - data: Данные ответа.
+            - status (int): HTTP-статус.
+            - headers (Optional[dict]): Дополнительные заголовки.
+
+        Возвращает:
+            - HttpResponse: JSON-ответ в том же формате, что и у JSONRenderer DRF.
+    """
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status, headers=headers)
+
+
+def catalog_view(sync_view):
+    """
+        Декоратор асинхронного эндпоинта чтения каталога.
+
+        GET-запросы обрабатываются в цикле событий (ASGI, uvicorn) без отдельного потока
+        на запрос: кеш ответов в Redis читается асинхронным клиентом, данные - асинхронным ORM.
+        Аутентификация, разрешения и ограничение частоты выполняются классами DRF синхронного
+        ViewSet (check_policies). Ответы кешируются по полному URL запроса (вместе с хостом,
+        так как содержат абсолютные ссылки) до изменения каталога (catalog_cache); сразу после
+        изменения ответ для кеша читается из основной БД, а не из отстающей реплики. Остальные методы,
+        а также запросы Browsable API (Accept: text/html или ?format=) передаются синхронному ViewSet.
+
+        Аргументы:
+            - sync_view (Callable): Представление ViewSet для тех же URL.
+
+        Возвращает:
+            - Callable: Декоратор асинхронной функции, возвращающей данные ответа.
+    """
+    dispatch = sync_to_async(sync_view)
+    check = sync_to_async(check_policies)
+
+    def decorator(read):
+        @csrf_exempt
+        @wraps(read)
+        async def view(request, **kwargs):
+            if (request.method != 'GET' or 'format' in request.GET
+                    or 'text/html' in request.headers.get('Accept', '')):
+                return await dispatch(request, **kwargs)
+            error = await check(sync_view, request, **kwargs)
+            if error is not None:
+                return error
+            try:
+                key, content, changed = await get_cached_response(request.build_absolute_uri())
+                if content is None:
+                    with use_primary() if changed else nullcontext():
+                        content = JSONRenderer().render(await read(request, **kwargs))
+                    await set_cached_response(key, content)
+            except APIException as e:
+                data = e.detail if isinstance(e.detail, (list, dict)) else {'detail': e.detail}
+                return render(data, e.status_code)
+            return HttpResponse(content, content_type='application/json')
+        return view
+    return decorator
+
+
+@catalog_view(ProductsViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def product_list(request) -> list:
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - list[dict]: Товары в представлении ProductListSerializer.
+    """
+    queryset = filter_queryset(
+        annotate_price(Product.objects.all()), request.GET,
+        ProductsViewSet.filterset_fields, ProductsViewSet.search_fields, ProductsViewSet.ordering_fields,
+    )
+    products = [product async for product in queryset]
+    return ProductListSerializer(products, many=True, context={'request': request}).data
+
+
+@catalog_view(ProductsViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+                                       'delete': 'destroy'}))
+async def product_detail(request, pk: int) -> dict:
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+            - pk (int): Идентификатор товара.
+
+        Возвращает:
+            - dict: Товар в представлении ProductDetailSerializer.
+
+        Исключения:
+            - NotFound: Если товара нет.
+    """
+    product = await Product.objects.prefetch_related(
+        'product_info__info_parameters__dynamic_fields'
+    ).filter(pk=pk).afirst()
+    if product is None:
+        raise NotFound('No Product matches the given query.')
+    # Product.renditions - новый запрос при каждом обращении (ContentType может потребовать запрос к БД),
+    # поэтому версии загружаются заранее, а сериализатор выводит остальные поля по уже загруженным данным.
+    renditions = await sync_to_async(lambda: list(product.renditions))()
+    context = {'request': request}
+    serializer = ProductDetailSerializer(product, context=context)
+    serializer.fields.pop('renditions')
+    data = serializer.data
+    data['renditions'] = ImageRenditionSerializer(renditions, many=True, context=context).data
+    return data
+
+
+@catalog_view(ProductCategoryViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def category_list(request) -> list:
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - list[dict]: Категории в представлении ProductCategorySerializer.
+    """
+    queryset = filter_queryset(
+        ProductCategory.objects.all(), request.GET,
+        ProductCategoryViewSet.filterset_fields, ProductCategoryViewSet.search_fields,
+    )
+    return ProductCategorySerializer([category async for category in queryset], many=True).data
+
+
+@catalog_view(ShopViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def shop_list(request) -> list:
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - list[dict]: Магазины в представлении ShopSerializer.
+    """
+    queryset = filter_queryset(Shop.objects.all(), request.GET, ShopViewSet.filterset_fields, ShopViewSet.search_fields)
+    return ShopSerializer([shop async for shop in queryset], many=True).data
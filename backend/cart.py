@@ -0,0 +1,242 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import Order, OrderProduct, ShopProduct
+
+
+class RedisCart:
+    """
+        Корзина пользователя в Redis для заказов, которые еще не оформлены.
+
+        Позиции корзины хранятся в двух хешах:
+            - cart:<user_id>:quantities — id продукта -> количество (изменяется атомарным HINCRBY);
+            - cart:<user_id>:items — id продукта -> JSON со снимком id продукта магазина, цены и названий.
+        Оба ключа живут CART_TTL секунд с момента последнего изменения, поэтому брошенные корзины
+        удаляются самим Redis. Строки Order/OrderProduct создаются только при оформлении заказа.
+
+        Атрибуты:
+            - user_id (int): Идентификатор владельца корзины.
+            - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+        Методы:
+            - lines() -> list[dict]:
+                Возвращает позиции корзины.
+
+            - total_price(lines: Optional[list[dict]] = None) -> Decimal:
+                Возвращает общую стоимость корзины по сохраненным ценам.
+
+            - add(shop_product: ShopProduct, quantity: int) -> int:
+                Добавляет продукт в корзину и возвращает его количество в корзине.
+
+            - remove(product_id: int, quantity: int) -> int:
+                Уменьшает количество продукта в корзине и возвращает остаток.
+
+            - apply_lines(lines: dict[int, int], shop_products: dict[int, ShopProduct]) -> None:
+                Пакетно добавляет и удаляет продукты в корзине одной транзакцией Redis.
+
+            - clear() -> None:
+                Очищает корзину.
+
+            - materialize() -> Optional[Order]:
+                Переносит корзину в заказ и резервирует товары на складе в одной транзакции.
+    """
+    key_prefix = 'cart'
+
+    def __init__(self, user_id: int, client=None):
+        self.user_id = user_id
+        self.client = client or get_redis_connection('default')
+        self.quantities_key = f'{self.key_prefix}:{user_id}:quantities'
+        self.items_key = f'{self.key_prefix}:{user_id}:items'
+
+    def lines(self) -> list[dict]:
+        """
+            Возвращает:
+                - list[dict]: Позиции корзины с полями product_id, quantity, shop_product_id,
+                              unit_price, product_name и shop_name.
+        """
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.quantities_key)
+        pipe.hgetall(self.items_key)
+        quantities, items = pipe.execute()
+        lines = []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if item is None:
+                continue
+            lines.append({'product_id': int(product_id), 'quantity': int(quantity), **json.loads(item)})
+        return sorted(lines, key=lambda line: line['product_id'])
+
+    def total_price(self, lines=None) -> Decimal:
+        """
+            Аргументы:
+                - lines (Optional[list[dict]]): Уже прочитанные позиции корзины.
+                    По умолчанию позиции читаются из Redis.
+
+            Возвращает:
+                - Decimal: Сумма quantity * unit_price по всем позициям корзины.
+        """
+        lines = self.lines() if lines is None else lines
+        return sum((Decimal(line['unit_price']) * line['quantity'] for line in lines), Decimal(0))
+
+    @staticmethod
+    def _item(shop_product: ShopProduct) -> str:
+        """
+            Аргументы:
+                - shop_product (ShopProduct): Продукт магазина с загруженными shop и product.
+
+            Возвращает:
+                - str: JSON со снимком id продукта магазина, цены и названий для хеша items.
+        """
+        snapshot = OrderProduct.snapshot(shop_product)
+        return json.dumps({
+            'shop_product_id': shop_product.id,
+            'unit_price': str(snapshot['unit_price']),
+            'product_name': snapshot['product_name'],
+            'shop_name': snapshot['shop_name'],
+        })
+
+    def add(self, shop_product: ShopProduct, quantity: int) -> int:
+        """
+            Аргументы:
+                - shop_product (ShopProduct): Продукт магазина с загруженными shop и product.
+                - quantity (int): Количество продукта.
+
+            Возвращает:
+                - int: Количество продукта в корзине после добавления.
+
+            Исключения:
+                - ValueError: Если количество меньше 1.
+        """
+        if quantity < 1:
+            raise ValueError("Количество товара должно быть больше нуля")
+        pipe = self.client.pipeline()
+        pipe.hsetnx(self.items_key, shop_product.product_id, self._item(shop_product))
+        pipe.hincrby(self.quantities_key, shop_product.product_id, quantity)
+        pipe.expire(self.items_key, settings.CART_TTL)
+        pipe.expire(self.quantities_key, settings.CART_TTL)
+        return pipe.execute()[1]
+
+    def remove(self, product_id: int, quantity: int) -> int:
+        """
+            Аргументы:
+                - product_id (int): Идентификатор продукта.
+                - quantity (int): Количество, на которое нужно уменьшить позицию.
+
+            Возвращает:
+                - int: Количество продукта, оставшееся в корзине.
+
+            Исключения:
+                - KeyError: Если продукта нет в корзине.
+                - ValueError: Если количество меньше 1 или в корзине меньше продукта, чем нужно удалить.
+        """
+        if quantity < 1:
+            raise ValueError("Количество товара должно быть больше нуля")
+
+        def decrement(pipe) -> int:
+            current = pipe.hget(self.quantities_key, product_id)
+            if current is None:
+                raise KeyError("Продукт не найден в корзине")
+            remaining = int(current) - quantity
+            if remaining < 0:
+                raise ValueError("Количество продуктов в корзине меньше указанного количества")
+            pipe.multi()
+            if remaining:
+                pipe.hset(self.quantities_key, product_id, remaining)
+            else:
+                pipe.hdel(self.quantities_key, product_id)
+                pipe.hdel(self.items_key, product_id)
+            return remaining
+
+        return self.client.transaction(decrement, self.quantities_key, value_from_callable=True)
+
+    def apply_lines(self, lines: dict, shop_products: dict) -> None:
+        """
+            Применяет пакет изменений к корзине одной транзакцией Redis (WATCH/MULTI):
+            если хотя бы одну позицию применить нельзя, корзина не изменяется.
+
+            Аргументы:
+                - lines (dict[int, int]): id продукта -> изменение количества.
+                    Положительное значение добавляет продукт, отрицательное — уменьшает позицию.
+                - shop_products (dict[int, ShopProduct]): id продукта -> продукт магазина
+                    с загруженными shop и product для каждой добавляемой позиции.
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - ValueError: Если в корзине меньше какого-либо продукта, чем нужно удалить.
+        """
+        items = {product_id: self._item(shop_products[product_id])
+                 for product_id, quantity in lines.items() if quantity > 0}
+        product_ids = list(lines)
+
+        def apply(pipe) -> None:
+            current = {product_id: int(quantity or 0) for product_id, quantity
+                       in zip(product_ids, pipe.hmget(self.quantities_key, product_ids))}
+            errors = [f"Количество продукта {product_id} в корзине меньше указанного"
+                      for product_id, quantity in lines.items() if current[product_id] + quantity < 0]
+            if errors:
+                raise ValueError("; ".join(errors))
+            pipe.multi()
+            for product_id, quantity in lines.items():
+                remaining = current[product_id] + quantity
+                if remaining:
+                    pipe.hset(self.quantities_key, product_id, remaining)
+                    if product_id in items:
+                        pipe.hsetnx(self.items_key, product_id, items[product_id])
+                else:
+                    pipe.hdel(self.quantities_key, product_id)
+                    pipe.hdel(self.items_key, product_id)
+            pipe.expire(self.items_key, settings.CART_TTL)
+            pipe.expire(self.quantities_key, settings.CART_TTL)
+
+        self.client.transaction(apply, self.quantities_key)
+
+    def clear(self) -> None:
+        """
+            Возвращает:
+                - None
+        """
+        self.client.delete(self.quantities_key, self.items_key)
+
+    def materialize(self):
+        """
+            Создает (или дополняет) черновой заказ пользователя позициями корзины
+            по сохраненным в корзине ценам. Все резервы на складе создаются в одной транзакции,
+            корзина очищается только после ее фиксации (transaction.on_commit), поэтому при вызове
+            внутри внешней транзакции (place_an_order) корзина сохраняется, если та откатится.
+
+            Возвращает:
+                - Optional[Order]: Заказ со статусом 'new' или None, если корзина пуста.
+
+            Исключения:
+                - ValueError: Если какого-либо товара недостаточно на складе.
+                              В этом случае ни заказ, ни корзина не изменяются.
+        """
+        lines = self.lines()
+        if not lines:
+            return None
+
+        shop_products = ShopProduct.objects.in_bulk([line['shop_product_id'] for line in lines])
+        with transaction.atomic():
+            order = (
+                Order.objects.filter(user_id=self.user_id, status_choice__in=['empty', 'new']).first()
+                or Order.objects.create(user_id=self.user_id)
+            )
+            for line in lines:
+                if line['shop_product_id'] not in shop_products:
+                    raise ValueError(f"Товар {line['product_name']} больше не продается")
+                order.add_line(
+                    shop_products[line['shop_product_id']],
+                    line['quantity'],
+                    unit_price=Decimal(line['unit_price']),
+                    product_name=line['product_name'],
+                    shop_name=line['shop_name'],
+                )
+            order.update_totals()
+            transaction.on_commit(self.clear)
+        return order
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import weakref
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django_redis import get_redis_connection
+
+from .models import DynamicField, ImageRendition, Parameters, Product, ProductCategory, ProductInfo, Shop
+
+VERSION_KEY = 'catalog:version'
+# Флаг недавнего изменения каталога: пока он есть, ответы для кеша читаются из основной БД.
+CHANGED_KEY = 'catalog:changed'
+ENTRY_KEY = 'catalog:{version}:{digest}'
+# Модели, данные которых входят в ответы асинхронных эндпоинтов каталога (async_views).
+CATALOG_MODELS = (Shop, ProductCategory, Product, ProductInfo, Parameters, DynamicField, ImageRendition)
+
+# Асинхронный клиент Redis привязан к циклу событий, в котором создан, поэтому хранится отдельно для каждого цикла.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+        Возвращает асинхронный клиент Redis кеша 'default' для текущего цикла событий.
+
+        Возвращает:
+            - redis.asyncio.Redis: Клиент с общим пулом соединений цикла.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        location = settings.CACHES['default']['LOCATION']
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        client = _clients[loop] = aioredis.Redis.from_url(location)
+    return client
+
+
+def bump_catalog_version(client=None) -> None:
+    """
+        Увеличивает версию каталога: все ранее закешированные ответы перестают использоваться
+        и удаляются Redis по истечении CATALOG_CACHE_TTL.
+
+        Если настроены реплики, вместе с версией на REPLICA_MAX_LAG + REPLICA_LAG_CHECK_INTERVAL
+        секунд выставляется флаг CHANGED_KEY: реплика в это время может еще не содержать изменений,
+        и прочитанный из нее устаревший ответ попал бы в кеш новой версии.
+
+        Аргументы:
+            - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+        Возвращает:
+            - None
+    """
+    client = client or get_redis_connection('default')
+    if not settings.DATABASE_REPLICAS:
+        client.incr(VERSION_KEY)
+        return
+    pipe = client.pipeline()
+    pipe.incr(VERSION_KEY)
+    pipe.set(CHANGED_KEY, 1, px=int((settings.REPLICA_MAX_LAG + settings.REPLICA_LAG_CHECK_INTERVAL) * 1000))
+    pipe.execute()
+
+
+def invalidate_catalog(sender, **kwargs) -> None:
+    """
+        Сбрасывает кеш каталога после фиксации транзакции, в которой изменились данные каталога.
+        Версия увеличивается только после фиксации, поэтому ответ, прочитанный до нее,
+        не попадет в кеш новой версии.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+m2m_changed.connect(invalidate_catalog, sender=Parameters.dynamic_fields.through, dispatch_uid='catalog_m2m')
+
+
+def entry_key(version: bytes, url: str) -> str:
+    """
+        Аргументы:
+            - version (Optional[bytes]): Версия каталога из Redis.
+            - url (str): Полный URL запроса (схема, хост, путь и строка параметров): ответы содержат
+              абсолютные ссылки, поэтому для разных хостов кешируются отдельно.
+
+        Возвращает:
+            - str: Ключ закешированного ответа.
+    """
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    return ENTRY_KEY.format(version=int(version or 0), digest=digest)
+
+
+async def get_cached_response(url: str) -> tuple:
+    """
+        Читает закешированный ответ текущей версии каталога.
+
+        Аргументы:
+            - url (str): Полный URL запроса (request.build_absolute_uri()).
+
+        Возвращает:
+            - tuple[str, Optional[bytes], bool]: Ключ ответа (для set_cached_response), тело ответа
+              или None, если ответа нет в кеше, и признак недавнего изменения каталога
+              (ответ для кеша нужно читать из основной БД).
+    """
+    client = get_async_redis()
+    version, changed = await client.mget(VERSION_KEY, CHANGED_KEY)
+    key = entry_key(version, url)
+    return key, await client.get(key), changed is not None
+
+
+async def set_cached_response(key: str, content: bytes) -> None:
+    """
+        Аргументы:
+            - key (str): Ключ, полученный из get_cached_response.
+            - content (bytes): Тело ответа.
+
+        Возвращает:
+            - None
+    """
+    await get_async_redis().set(key, content, ex=settings.CATALOG_CACHE_TTL)
@@ -0,0 +1,135 @@
+import copy
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DatabaseError, connections
+from django.db.utils import load_backend
+
+# Режимы управления соединениями для benchmark_connections: новое соединение на каждый запрос,
+# постоянное соединение (CONN_MAX_AGE) и пул psycopg.
+BENCHMARK_MODES = ('new', 'persistent', 'pool')
+
+
+def database_status(alias: str = 'default') -> dict:
+    """
+        Проверяет соединение с БД запросом SELECT 1 и собирает статистику соединений
+        текущего процесса.
+
+        Аргументы:
+            - alias (str): Псевдоним БД из DATABASES.
+
+        Возвращает:
+            - dict: healthy и latency_ms - результат проверки, conn_max_age и health_checks -
+              настройки постоянных соединений, pool - статистика пула psycopg
+              (psycopg_pool.ConnectionPool.get_stats()) или None, если пул не используется.
+    """
+    connection = connections[alias]
+    started = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        healthy = True
+    except DatabaseError:
+        healthy = False
+    pool = getattr(connection, 'pool', None)
+    return {
+        'alias': alias,
+        'healthy': healthy,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+        'pool': pool.get_stats() if pool is not None else None,
+    }
+
+
+def benchmark_settings(mode: str, alias: str = 'default') -> dict:
+    """
+        Аргументы:
+            - mode (str): Режим из BENCHMARK_MODES.
+            - alias (str): Псевдоним БД, настройки которой берутся за основу.
+
+        Возвращает:
+            - dict: Настройки БД для режима. Для 'pool' используются параметры пула из DATABASES
+              или параметры psycopg_pool по умолчанию.
+    """
+    settings_dict = copy.deepcopy(connections[alias].settings_dict)
+    pool = settings_dict['OPTIONS'].pop('pool', None)
+    settings_dict['CONN_MAX_AGE'] = None if mode == 'persistent' else 0
+    if mode == 'pool':
+        settings_dict['OPTIONS']['pool'] = pool or True
+    return settings_dict
+
+
+def run_requests(settings_dict: dict, alias: str, requests: int, query: str) -> list[float]:
+    """
+        Выполняет запросы в текущем потоке через собственное соединение Django
+        (соединения привязаны к потоку; пул общий для всех соединений с одним псевдонимом).
+
+        Аргументы:
+            - settings_dict (dict): Настройки БД из benchmark_settings.
+            - alias (str): Псевдоним соединения.
+            - requests (int): Количество запросов.
+            - query (str): SQL-запрос.
+
+        Возвращает:
+            - list[float]: Задержка каждого запроса в миллисекундах.
+    """
+    connection = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+    timings = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            # Как обработчики request_started и request_finished: закрывают устаревшее соединение
+            # (или возвращают его в пул) и включают проверку перед повторным использованием.
+            connection.close_if_unusable_or_obsolete()
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                cursor.fetchall()
+            connection.close_if_unusable_or_obsolete()
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+    return timings
+
+
+def benchmark_connections(mode: str, requests: int = 500, threads: int = 1, query: str = 'SELECT 1',
+                          alias: str = 'default') -> dict:
+    """
+        Измеряет задержку запросов к БД с учетом открытия соединений так, как их открывает
+        обработка HTTP-запросов Django в выбранном режиме.
+
+        Аргументы:
+            - mode (str): Режим из BENCHMARK_MODES.
+            - requests (int): Общее количество запросов.
+            - threads (int): Количество потоков, выполняющих запросы одновременно.
+            - query (str): SQL-запрос, выполняемый в каждом запросе.
+            - alias (str): Псевдоним БД.
+
+        Возвращает:
+            - dict: p50_ms и p99_ms - медиана и 99-й процентиль задержки в миллисекундах,
+              requests - количество запросов, pool - статистика пула (для режима 'pool').
+
+        Исключения:
+            - ImproperlyConfigured: Если для режима 'pool' не установлен psycopg[pool].
+    """
+    settings_dict = benchmark_settings(mode, alias)
+    benchmark_alias = f'{alias}_benchmark_{mode}'
+    per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        timings = [timing for chunk in executor.map(
+            lambda count: run_requests(settings_dict, benchmark_alias, count, query), per_thread
+        ) for timing in chunk]
+
+    pool_stats = None
+    if mode == 'pool':
+        connection = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, benchmark_alias)
+        pool_stats = connection.pool.get_stats()
+        connection.close_pool()
+    quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'requests': len(timings),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(quantiles[98], 3),
+        'pool': pool_stats,
+    }
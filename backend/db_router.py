@@ -0,0 +1,188 @@
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+
+# Задержка репликации в секундах; 0, если реплика догнала основную БД (или БД не является репликой).
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+# Записи этих приложений (профилирование запросов, сессии) не закрепляют чтение за основной БД.
+STICKY_IGNORED_APPS = ('silk', 'sessions')
+STICKY_COOKIE = 'db_primary_until'
+STICKY_KEY = 'db:primary:{digest}'
+
+# Состояние маршрутизации текущего запроса или задачи: {'primary': bool, 'wrote': bool}.
+_routing = ContextVar('db_routing', default=None)
+# Псевдоним реплики -> (время проверки по time.monotonic(), задержка в секундах или None, если реплика недоступна).
+_replica_lag = {}
+
+
+def replica_lag(alias: str):
+    """
+        Возвращает задержку реплики, проверяя ее не чаще раза в REPLICA_LAG_CHECK_INTERVAL секунд
+        (результат хранится в памяти процесса).
+
+        Аргументы:
+            - alias (str): Псевдоним реплики из DATABASES.
+
+        Возвращает:
+            - Optional[float]: Задержка в секундах или None, если реплика недоступна.
+    """
+    now = time.monotonic()
+    checked_at, lag = _replica_lag.get(alias, (None, None))
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    connection = connections[alias]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        else:
+            connection.ensure_connection()
+            lag = 0.0
+    except DatabaseError:
+        lag = None
+    _replica_lag[alias] = (now, lag)
+    return lag
+
+
+@contextmanager
+def use_primary():
+    """
+        Направляет все чтения внутри блока в основную БД.
+
+        Возвращает:
+            - ContextManager[dict]: Состояние маршрутизации блока.
+    """
+    token = _routing.set({'primary': True, 'wrote': False})
+    try:
+        yield _routing.get()
+    finally:
+        _routing.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+        Маршрутизатор БД: запись - в основную БД, чтение - в реплики из DATABASE_REPLICAS.
+
+        Чтение выполняется в основной БД, если:
+            - оно идет внутри транзакции основной БД (transaction.atomic), чтобы видеть свои записи;
+            - запрос изменяет данные (POST, PUT, PATCH, DELETE) или пользователь недавно изменял
+              данные (PrimaryStickinessMiddleware, PRIMARY_STICKY_SECONDS);
+            - выполняется задача Celery;
+            - задержка всех реплик больше REPLICA_MAX_LAG секунд или реплики недоступны.
+
+        Методы:
+            - db_for_read(model, **hints) -> str:
+                Выбирает случайную реплику с допустимой задержкой или основную БД.
+
+            - db_for_write(model, **hints) -> str:
+                Всегда возвращает основную БД и отмечает запись в состоянии запроса.
+    """
+    def db_for_read(self, model, **hints) -> str:
+        state = _routing.get()
+        if not settings.DATABASE_REPLICAS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state is not None and (state['primary'] or state['wrote']):
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS
+                    if (lag := replica_lag(alias)) is not None and lag <= settings.REPLICA_MAX_LAG]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in STICKY_IGNORED_APPS:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+        return db not in settings.DATABASE_REPLICAS
+
+
+def sticky_key(request):
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - Optional[str]: Ключ кеша для клиентов с заголовком Authorization (токен), иначе None.
+    """
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return STICKY_KEY.format(digest=hashlib.sha256(authorization.encode()).hexdigest())
+
+
+class PrimaryStickinessMiddleware(MiddlewareMixin):
+    """
+        Закрепляет чтение за основной БД на PRIMARY_STICKY_SECONDS секунд после того,
+        как клиент изменил данные, чтобы он не получил из отстающей реплики устаревшие данные.
+
+        Срок хранится в cookie (для браузеров) и в кеше по заголовку Authorization (для клиентов API
+        с токеном). Запросы, изменяющие данные, целиком выполняются в основной БД.
+    """
+    def process_request(self, request):
+        key = sticky_key(request)
+        try:
+            pinned_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        primary = (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or pinned_until > time.time()
+            or bool(settings.DATABASE_REPLICAS and key and cache.get(key))
+        )
+        _routing.set({'primary': primary, 'wrote': False})
+
+    def process_response(self, request, response):
+        state = _routing.get()
+        if state is not None and state['wrote']:
+            seconds = settings.PRIMARY_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                                httponly=True, samesite='Lax')
+            key = sticky_key(request)
+            if key:
+                cache.set(key, 1, seconds)
+        _routing.set(None)
+        return response
+
+
+_task_routing = {}
+
+
+@task_prerun.connect
+def route_task_to_primary(task_id=None, **kwargs) -> None:
+    """
+        Задачи Celery читают из основной БД: они обрабатывают только что сохраненные объекты,
+        которых в отстающей реплике еще может не быть.
+    """
+    _task_routing[task_id] = _routing.set({'primary': True, 'wrote': False})
+
+
+@task_postrun.connect
+def restore_task_routing(task_id=None, **kwargs) -> None:
+    """
+        Восстанавливает состояние маршрутизации после задачи (задача, выполненная синхронно,
+        не должна менять маршрутизацию вызвавшего ее кода).
+    """
+    token = _task_routing.pop(task_id, None)
+    if token is not None:
+        _routing.reset(token)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class IdempotencyStore:
+    """
+        Хранилище ключей идемпотентности в Redis.
+
+        Для каждого ключа хранится JSON-запись: сначала {'state': 'in_flight'} с коротким сроком
+        жизни (IDEMPOTENCY_LOCK_TTL), затем {'state': 'done'} с кодом и телом ответа на
+        IDEMPOTENCY_KEY_TTL секунд. Запись также содержит отпечаток запроса (request_fingerprint),
+        чтобы один ключ нельзя было использовать для разных операций.
+
+        Атрибуты:
+            - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+        Методы:
+            - begin(key: str, fingerprint: str) -> Optional[dict]:
+                Занимает ключ; если ключ уже занят, возвращает сохраненную запись.
+
+            - finish(key: str, fingerprint: str, response: Response) -> None:
+                Сохраняет ответ для повторов.
+
+            - discard(key: str) -> None:
+                Освобождает ключ, чтобы запрос можно было повторить.
+    """
+    key_prefix = 'idempotency'
+
+    def __init__(self, client=None):
+        self.client = client or get_redis_connection('default')
+
+    def _key(self, key: str) -> str:
+        return f'{self.key_prefix}:{key}'
+
+    def begin(self, key: str, fingerprint: str):
+        """
+            Аргументы:
+                - key (str): Ключ идемпотентности с учетом пользователя.
+                - fingerprint (str): Отпечаток запроса.
+
+            Возвращает:
+                - Optional[dict]: None, если ключ занят этим запросом, иначе ранее сохраненная запись.
+        """
+        record = json.dumps({'state': 'in_flight', 'fingerprint': fingerprint})
+        if self.client.set(self._key(key), record, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL):
+            return None
+        stored = self.client.get(self._key(key))
+        if stored is None:
+            return self.begin(key, fingerprint)
+        return json.loads(stored)
+
+    def finish(self, key: str, fingerprint: str, response: Response) -> None:
+        """
+            Аргументы:
+                - key (str): Ключ идемпотентности с учетом пользователя.
+                - fingerprint (str): Отпечаток запроса.
+                - response (Response): Ответ, который нужно вернуть при повторе.
+
+            Возвращает:
+                - None
+        """
+        record = json.dumps(
+            {'state': 'done', 'fingerprint': fingerprint, 'status': response.status_code, 'data': response.data},
+            cls=JSONEncoder,
+        )
+        self.client.set(self._key(key), record, ex=settings.IDEMPOTENCY_KEY_TTL)
+
+    def discard(self, key: str) -> None:
+        """
+            Аргументы:
+                - key (str): Ключ идемпотентности с учетом пользователя.
+
+            Возвращает:
+                - None
+        """
+        self.client.delete(self._key(key))
+
+
+def request_fingerprint(request) -> str:
+    """
+        Аргументы:
+            - request (Request): Запрос DRF.
+
+        Возвращает:
+            - str: Метод, путь и SHA-256 тела запроса, приведенного к JSON с упорядоченными ключами
+              (одинаковые данные с другим порядком полей дают тот же отпечаток).
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {key: values if len(values) > 1 else values[0] for key, values in data.lists()}
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'), default=str)
+    return f'{request.method} {request.path} {hashlib.sha256(body.encode()).hexdigest()}'
+
+
+class IdempotentReplay(Exception):
+    """
+        Исключение, которым IdempotentViewMixin.initial прерывает обработку запроса
+        и возвращает готовый ответ без вызова обработчика.
+
+        Атрибуты:
+            - response (Response): Ответ, который нужно вернуть клиенту.
+    """
+    def __init__(self, response: Response):
+        super().__init__()
+        self.response = response
+
+
+class IdempotentViewMixin:
+    """
+        Примесь для ViewSet, которая поддерживает заголовок Idempotency-Key для изменяющих запросов.
+
+        Первый запрос с ключом выполняется и его ответ (кроме ответов 5xx) сохраняется в Redis.
+        Повторы с тем же ключом получают сохраненный ответ с заголовком Idempotent-Replayed
+        и не обращаются к базе данных. Пока первый запрос выполняется, повторы получают 409,
+        а повторное использование ключа для другого метода, пути или тела запроса — 422.
+        Запросы без заголовка обрабатываются как обычно.
+
+        Атрибуты:
+            - idempotent_methods (tuple[str]): HTTP-методы, для которых учитывается ключ.
+    """
+    idempotent_methods = ('POST', 'PUT', 'PATCH', 'DELETE')
+    idempotency_key = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get('Idempotency-Key')
+        if not key or request.method not in self.idempotent_methods:
+            return
+
+        store = IdempotencyStore()
+        user_key = f'{request.user.pk}:{key}'
+        fingerprint = request_fingerprint(request)
+        stored = store.begin(user_key, fingerprint)
+        if stored is None:
+            self.idempotency_key = user_key
+            self.idempotency_fingerprint = fingerprint
+        elif stored['fingerprint'] != fingerprint:
+            raise IdempotentReplay(Response(
+                {"status": "Ключ идемпотентности уже использован для другого запроса"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ))
+        elif stored['state'] == 'in_flight':
+            raise IdempotentReplay(Response(
+                {"status": "Запрос с этим ключом идемпотентности еще выполняется"},
+                status=status.HTTP_409_CONFLICT,
+            ))
+        else:
+            raise IdempotentReplay(Response(
+                stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'}
+            ))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            if self.idempotency_key:
+                IdempotencyStore().discard(self.idempotency_key)
+                self.idempotency_key = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency_key:
+            store = IdempotencyStore()
+            if response.status_code >= 500:
+                store.discard(self.idempotency_key)
+            else:
+                store.finish(self.idempotency_key, self.idempotency_fingerprint, response)
+            self.idempotency_key = None
+        return response
@@ -0,0 +1,181 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ImageBlob, Product, UserProfile
+
+# Поле изображения и поле ссылки на ImageBlob для моделей с загружаемыми изображениями.
+IMAGE_FIELDS = {
+    Product: ('image', 'image_blob'),
+    UserProfile: ('avatar', 'avatar_blob'),
+}
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_sha256(file) -> str:
+    """
+        Считает SHA-256 файла, читая его по частям, чтобы не загружать файл в память целиком.
+
+        Аргументы:
+            - file (File): Файл Django (загруженный или из хранилища).
+
+        Возвращает:
+            - str: Шестнадцатеричный хеш содержимого.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_image(file) -> ImageBlob:
+    """
+        Сохраняет загруженное изображение по хешу содержимого и увеличивает счетчик ссылок.
+
+        Если изображение с таким хешем уже сохранено, файл повторно не записывается.
+        Строка ImageBlob блокируется (SELECT ... FOR UPDATE), поэтому сборщик мусора
+        не удалит изображение, пока на него добавляется ссылка.
+
+        Аргументы:
+            - file (File): Загруженный файл.
+
+        Возвращает:
+            - ImageBlob: Сохраненное изображение.
+    """
+    sha256 = file_sha256(file)
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            extension = os.path.splitext(file.name)[1].lower()
+            name = default_storage.save(f"images/{sha256[:2]}/{sha256}{extension}", file)
+            blob, created = ImageBlob.objects.get_or_create(
+                sha256=sha256, defaults={'file': name, 'size': file.size}
+            )
+            if not created:
+                default_storage.delete(name)
+        ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def adopt_image(instance) -> ImageBlob:
+    """
+        Связывает с ImageBlob изображение, сохраненное до появления хранения по хешу
+        (или указанное по имени файла). Если такое содержимое уже сохранено, объект
+        начинает ссылаться на существующий файл; иначе файл регистрируется без копирования.
+
+        Аргументы:
+            - instance (Product | UserProfile): Объект с изображением.
+
+        Возвращает:
+            - ImageBlob: Изображение объекта.
+    """
+    source_field, blob_field = IMAGE_FIELDS[type(instance)]
+    source = getattr(instance, source_field)
+    sha256 = file_sha256(source)
+    with transaction.atomic():
+        blob, _ = ImageBlob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'file': source.name, 'size': source.size}
+        )
+        ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        source.name = blob.file.name
+        setattr(instance, blob_field, blob)
+        instance.save(update_fields=[source_field, blob_field])
+    return blob
+
+
+def release_image(blob_id: int) -> None:
+    """
+        Уменьшает счетчик ссылок изображения.
+
+        Аргументы:
+            - blob_id (int): Идентификатор ImageBlob.
+
+        Возвращает:
+            - None
+    """
+    ImageBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=UserProfile)
+def attach_image(sender, instance, **kwargs) -> None:
+    """
+        Перед сохранением товара или профиля заменяет новый загруженный файл ссылкой на ImageBlob
+        и обновляет счетчики ссылок старого и нового изображения.
+
+        Если изображение удалено или указано по имени файла, не совпадающему с ImageBlob,
+        ссылка снимается; изображение, указанное по имени, связывается с ImageBlob
+        задачей создания миниатюр (adopt_image). Повторная загрузка того же содержимого
+        не меняет счетчик: ссылка, добавленная store_image, снимается со старого изображения.
+        Product.save и UserProfile.save выполняются в transaction.atomic, поэтому при
+        неудачном сохранении изменения счетчиков откатываются.
+    """
+    source_field, blob_field = IMAGE_FIELDS[sender]
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and source_field not in update_fields:
+        return
+    source = getattr(instance, source_field)
+    old_blob_id = getattr(instance, f'{blob_field}_id')
+    stored = source and not source._committed
+    if stored:
+        blob = store_image(source.file)
+        source.name = blob.file.name
+        source._committed = True
+        setattr(instance, blob_field, blob)
+    elif not source or (old_blob_id and getattr(instance, blob_field).file.name != source.name):
+        setattr(instance, blob_field, None)
+
+    if old_blob_id and (stored or old_blob_id != getattr(instance, f'{blob_field}_id')):
+        release_image(old_blob_id)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=UserProfile)
+def detach_image(sender, instance, **kwargs) -> None:
+    """
+        После удаления товара или профиля уменьшает счетчик ссылок его изображения.
+    """
+    blob_id = getattr(instance, f'{IMAGE_FIELDS[sender][1]}_id')
+    if blob_id:
+        release_image(blob_id)
+
+
+def collect_image_garbage(grace_period: int, batch_size: int = 500) -> int:
+    """
+        Удаляет изображения без ссылок вместе с их адаптивными версиями.
+
+        Изображение удаляется, только если счетчик ссылок равен нулю, на него действительно
+        не ссылается ни один товар или профиль и оно загружено раньше grace_period секунд назад
+        (чтобы не удалить файл, ссылка на который еще сохраняется). Строки блокируются
+        через SELECT ... FOR UPDATE SKIP LOCKED, поэтому изображение, на которое в этот момент
+        добавляется ссылка (store_image), пропускается.
+
+        Аргументы:
+            - grace_period (int): Минимальный возраст удаляемого изображения в секундах.
+            - batch_size (int): Максимальное количество изображений, удаляемых за один вызов.
+
+        Возвращает:
+            - int: Количество удаленных изображений.
+    """
+    with transaction.atomic():
+        blobs = list(
+            ImageBlob.objects.select_for_update(skip_locked=True)
+            .filter(ref_count=0, created_at__lt=timezone.now() - timedelta(seconds=grace_period))
+            .exclude(pk__in=Product.objects.filter(image_blob__isnull=False).values('image_blob'))
+            .exclude(pk__in=UserProfile.objects.filter(avatar_blob__isnull=False).values('avatar_blob'))
+            .order_by('pk')[:batch_size]
+        )
+        for blob in blobs:
+            for rendition in blob.renditions.all():
+                rendition.file.delete(save=False)
+            blob.renditions.all().delete()
+            blob.file.delete(save=False)
+        ImageBlob.objects.filter(pk__in=[blob.pk for blob in blobs]).delete()
+    return len(blobs)
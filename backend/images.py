@@ -0,0 +1,230 @@
+import math
+import os
+from io import BytesIO
+
+from PIL import Image
+
+# Ограничения на декодирование загруженных изображений: количество пикселей исходного файла
+# и оценка памяти, которую займут декодированные пиксели.
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 40_000_000))
+MAX_IMAGE_MEMORY = int(os.getenv('MAX_IMAGE_MEMORY', 256 * 1024 * 1024))
+
+# Режимы, которые Pillow хранит по одному байту на пиксель; остальные занимают четыре.
+ONE_BYTE_MODES = ('1', 'L', 'P')
+# Режимы, которые поддерживает Image.reduce().
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F')
+
+# Ширины адаптивных версий изображения (в пикселях, по большей стороне) и форматы, в которых они сохраняются.
+RENDITION_WIDTHS = (1200, 600, 300, 150)
+RENDITION_FORMATS = ('JPEG', 'WEBP')
+RENDITION_SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+
+class ImageTooLarge(ValueError):
+    """
+        Исключение, которое выбрасывается, если изображение превышает MAX_IMAGE_PIXELS
+        или для его декодирования потребуется больше MAX_IMAGE_MEMORY байт.
+    """
+
+
+def decoded_size(size: tuple, mode: str) -> int:
+    """
+        Оценивает объем памяти, который займет декодированное изображение.
+
+        Аргументы:
+            - size (tuple[int, int]): Ширина и высота изображения.
+            - mode (str): Режим изображения Pillow.
+
+        Возвращает:
+            - int: Количество байт.
+    """
+    width, height = size
+    return width * height * (1 if mode in ONE_BYTE_MODES else 4)
+
+
+def check_image(img: Image.Image, box: int, max_pixels: int = MAX_IMAGE_PIXELS,
+                max_memory: int = MAX_IMAGE_MEMORY) -> None:
+    """
+        Проверяет изображение по заголовку файла, не декодируя пиксели. Для JPEG заранее
+        включает draft(), поэтому оценка памяти учитывает декодирование в уменьшенном масштабе.
+
+        Аргументы:
+            - img (Image.Image): Открытое, но еще не загруженное изображение.
+            - box (int): Размер большей стороны, для которого будет декодироваться изображение.
+            - max_pixels (int): Максимальное количество пикселей исходного изображения.
+            - max_memory (int): Максимальный объем памяти под декодированные пиксели в байтах.
+
+        Возвращает:
+            - None
+
+        Исключения:
+            - ImageTooLarge: Если изображение превышает max_pixels или max_memory.
+    """
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge(
+            f"Изображение {img.width}x{img.height} превышает допустимые {max_pixels} пикселей"
+        )
+    scale = min(1, box / max(img.width, img.height))
+    img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    # Декодированные пиксели плюс копия при переводе в RGB или уменьшении.
+    memory = decoded_size(img.size, img.mode) + decoded_size(img.size, 'RGB')
+    if memory > max_memory:
+        raise ImageTooLarge(
+            f"Для декодирования изображения {img.width}x{img.height} нужно {memory} байт, "
+            f"допустимо {max_memory}"
+        )
+
+
+def open_image(image_path, box: int, max_pixels: int = MAX_IMAGE_PIXELS,
+               max_memory: int = MAX_IMAGE_MEMORY) -> Image.Image:
+    """
+        Декодирует изображение в RGB с ограничением по памяти.
+
+        До декодирования изображение проверяется check_image, поэтому слишком большой файл
+        отклоняется сразу, не занимая память воркера. JPEG декодируется через draft() сразу
+        в уменьшенном масштабе, достаточном для box. Остальные форматы (PNG и др.) Pillow
+        декодирует только целиком, поэтому большое изображение сразу уменьшается в целое
+        число раз reduce() и только затем переводится в RGB.
+
+        Аргументы:
+            - image_path (str | file): Путь к изображению или файловый объект.
+            - box (int): Размер большей стороны, для которого нужно изображение.
+            - max_pixels (int): Максимальное количество пикселей исходного изображения.
+            - max_memory (int): Максимальный объем памяти под декодированные пиксели в байтах.
+
+        Возвращает:
+            - Image.Image: Изображение в режиме RGB, большая сторона которого не меньше
+              min(box, исходный размер).
+
+        Исключения:
+            - ImageTooLarge: Если изображение превышает max_pixels или max_memory.
+    """
+    with Image.open(image_path) as img:
+        check_image(img, box, max_pixels, max_memory)
+        if img.mode not in REDUCIBLE_MODES:
+            img = img.convert('RGB')
+        factor = int(max(img.width, img.height) / box / 2)
+        if factor >= 2:
+            img = img.reduce(factor)
+        return img.convert('RGB')
+
+
+def make_thumbnail(image_path: str, size: tuple = (300, 300)) -> bytes:
+    """
+        Создает JPEG-миниатюру изображения, вписанную в size с сохранением пропорций.
+        Изображение декодируется через open_image с ограничением по памяти.
+
+        Аргументы:
+            - image_path (str): Путь к исходному изображению.
+            - size (tuple[int, int]): Максимальные ширина и высота миниатюры.
+
+        Возвращает:
+            - bytes: Содержимое JPEG-файла миниатюры.
+
+        Исключения:
+            - ImageTooLarge: Если изображение превышает ограничения на размер.
+    """
+    img = open_image(image_path, max(size))
+    img.thumbnail(size)
+    thumb_io = BytesIO()
+    img.save(thumb_io, format='JPEG')
+    return thumb_io.getvalue()
+
+
+def fit(img: Image.Image, box: int) -> Image.Image:
+    """
+        Уменьшает изображение так, чтобы большая сторона не превышала box. Сначала изображение
+        уменьшается в целое число раз быстрым reduce() (с запасом не меньше 2x), затем
+        доводится до точного размера фильтром LANCZOS. Изображения меньше box не увеличиваются.
+
+        Аргументы:
+            - img (Image.Image): Декодированное изображение.
+            - box (int): Максимальный размер большей стороны.
+
+        Возвращает:
+            - Image.Image: Уменьшенное изображение (или исходное, если уменьшать не нужно).
+    """
+    scale = min(box / img.width, box / img.height)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    factor = int(1 / scale / 2)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize(size, Image.LANCZOS)
+
+
+def make_renditions(image_path: str, widths: tuple = RENDITION_WIDTHS, formats: tuple = RENDITION_FORMATS) -> dict:
+    """
+        Создает версии изображения всех размеров из widths во всех форматах из formats.
+
+        Исходный файл декодируется один раз через open_image: для JPEG draft() сразу декодирует
+        его в уменьшенном масштабе, достаточном для самой большой версии. Каждая следующая версия получается
+        из предыдущей (большей), а не из исходного изображения.
+
+        Аргументы:
+            - image_path (str): Путь к исходному изображению.
+            - widths (tuple[int]): Размеры версий по большей стороне.
+            - formats (tuple[str]): Форматы версий ('JPEG', 'WEBP').
+
+        Возвращает:
+            - dict[tuple[int, str], bytes]: (размер, формат) -> содержимое файла версии.
+
+        Исключения:
+            - ImageTooLarge: Если изображение превышает ограничения на размер.
+    """
+    current = open_image(image_path, max(widths))
+
+    renditions = {}
+    for width in sorted(widths, reverse=True):
+        current = fit(current, width)
+        for image_format in formats:
+            output = BytesIO()
+            current.save(output, format=image_format, **RENDITION_SAVE_OPTIONS[image_format])
+            renditions[(width, image_format)] = output.getvalue()
+    return renditions
+
+
+def make_renditions_job(job: tuple) -> tuple:
+    """
+        Обертка make_renditions для Executor.map: ошибка одного изображения
+        не прерывает обработку остальных. Модуль не зависит от Django, поэтому функцию можно
+        выполнять в отдельных процессах (ProcessPoolExecutor в команде regenerate_thumbnails).
+
+        Аргументы:
+            - job (tuple[str, tuple[int]]): Путь к изображению и размеры версий.
+
+        Возвращает:
+            - tuple[Optional[dict], Optional[str]]: Результат make_renditions или текст ошибки.
+    """
+    image_path, widths = job
+    try:
+        return make_renditions(image_path, widths), None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return None, str(e)
+
+
+def make_rendition(image_path: str, size: tuple, image_format: str = 'JPEG') -> bytes:
+    """
+        Создает одну версию изображения, вписанную в size с сохранением пропорций
+        (для версий, создаваемых по запросу, см. views.rendition).
+
+        Аргументы:
+            - image_path (str): Путь к исходному изображению.
+            - size (tuple[int, int]): Максимальные ширина и высота версии.
+            - image_format (str): Формат версии ('JPEG' или 'WEBP').
+
+        Возвращает:
+            - bytes: Содержимое файла версии.
+
+        Исключения:
+            - ImageTooLarge: Если изображение превышает ограничения на размер.
+    """
+    img = open_image(image_path, max(size))
+    img.thumbnail(size, Image.LANCZOS)
+    output = BytesIO()
+    img.save(output, format=image_format, **RENDITION_SAVE_OPTIONS[image_format])
+    return output.getvalue()
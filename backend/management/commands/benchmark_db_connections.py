@@ -0,0 +1,42 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+
+from backend.db_connections import BENCHMARK_MODES, benchmark_connections
+
+
+class Command(BaseCommand):
+    """
+    Команда для сравнения задержки запросов к БД без пула и с пулом соединений.
+
+    Для каждого режима выполняется заданное количество запросов так, как их выполняет
+    обработка HTTP-запросов Django: 'new' - новое соединение на каждый запрос (CONN_MAX_AGE=0),
+    'persistent' - постоянное соединение с проверкой перед повторным использованием,
+    'pool' - пул psycopg. Выводятся медиана (p50) и 99-й процентиль (p99) задержки.
+
+    Пример:
+        python manage.py benchmark_db_connections --requests 2000 --threads 8
+    """
+
+    help = "Сравнивает p50 и p99 задержки запросов к БД без пула и с пулом соединений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=BENCHMARK_MODES, action="append",
+                            help="Режим управления соединениями. По умолчанию все режимы")
+        parser.add_argument("--requests", type=int, default=500, help="Количество запросов в каждом режиме")
+        parser.add_argument("--threads", type=int, default=1, help="Количество одновременных потоков")
+        parser.add_argument("--query", default="SELECT 1", help="SQL-запрос, выполняемый в каждом запросе")
+        parser.add_argument("--database", default="default", help="Псевдоним БД")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'режим':<12}{'запросов':>10}{'p50, мс':>10}{'p99, мс':>10}")
+        for mode in options["mode"] or BENCHMARK_MODES:
+            try:
+                result = benchmark_connections(
+                    mode, options["requests"], options["threads"], options["query"], options["database"]
+                )
+            except ImproperlyConfigured as e:
+                self.stdout.write(self.style.WARNING(f"{mode:<12}пропущен: {e}"))
+                continue
+            self.stdout.write(f"{mode:<12}{result['requests']:>10}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+            if result["pool"]:
+                self.stdout.write(f"{'':<12}статистика пула: {result['pool']}")
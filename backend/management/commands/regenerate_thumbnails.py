@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from backend.tasks import THUMBNAIL_TARGETS, regenerate_thumbnail_chunk, thumbnail_checkpoint_key, thumbnail_chunks
+
+
+class Command(BaseCommand):
+    """
+    Команда для массового пересоздания миниатюр товаров и аватаров.
+
+    Объекты обходятся пачками в порядке id, изображения каждой пачки уменьшаются
+    в пуле процессов (по умолчанию по одному процессу на ядро). После каждой пачки
+    ее последний id сохраняется в кеше как контрольная точка, поэтому запуск с --resume
+    продолжается с места остановки. По каждой пачке и по итогам выводится скорость в изображениях в секунду.
+
+    Пример:
+        python manage.py regenerate_thumbnails --kind product --chunk-size 500 --resume
+    """
+
+    help = "Пересоздает миниатюры товаров и аватаров в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=list(THUMBNAIL_TARGETS), action="append",
+                            help="Вид изображений. По умолчанию все виды")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Количество объектов в пачке")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Количество процессов")
+        parser.add_argument("--resume", action="store_true", help="Продолжить с контрольной точки")
+
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            map_func = partial(executor.map, chunksize=max(1, options["chunk_size"] // (options["workers"] * 4)))
+            for kind in options["kind"] or THUMBNAIL_TARGETS:
+                after_id = cache.get(thumbnail_checkpoint_key(kind), 0) if options["resume"] else 0
+                for ids in thumbnail_chunks(kind, options["chunk_size"], after_id):
+                    chunk_started = time.monotonic()
+                    done, failed = regenerate_thumbnail_chunk(kind, ids, map_func)
+                    cache.set(thumbnail_checkpoint_key(kind), ids[-1], None)
+                    total_done += done
+                    total_failed += failed
+                    self.stdout.write(
+                        f"{kind}: id {ids[0]}-{ids[-1]}, готово {done}, ошибок {failed}, "
+                        f"{done / max(time.monotonic() - chunk_started, 1e-6):.1f} изобр./с"
+                    )
+                cache.delete(thumbnail_checkpoint_key(kind))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересоздано миниатюр: {total_done}, ошибок: {total_failed}, "
+            f"{total_done / max(elapsed, 1e-6):.1f} изобр./с"
+        ))
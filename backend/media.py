@@ -0,0 +1,112 @@
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
+
+from .models import ImageBlob, Product, UserProfile
+
+# Имена файлов, содержащие SHA-256 содержимого (ImageBlob и его версии), никогда не меняют содержимое.
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{64})[._]')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PUBLIC_CACHE_CONTROL = 'public, max-age=3600'
+PRIVATE_CACHE_CONTROL = 'private, max-age=3600'
+
+
+def is_hashed_name(name: str) -> bool:
+    """
+        Аргументы:
+            - name (str): Имя файла в хранилище.
+
+        Возвращает:
+            - bool: True, если имя содержит хеш содержимого и файл можно кешировать бессрочно.
+    """
+    return bool(HASHED_NAME.search(name))
+
+
+def media_access(user, name: str):
+    """
+        Определяет, может ли пользователь получить медиафайл.
+
+        Изображения товаров доступны всем. Аватары (ImageBlob, на который ссылаются только
+        профили, или файлы аватаров, сохраненные до хранения по хешу) доступны владельцу профиля
+        и персоналу. Файлы, на которые не ссылается ни один объект, не отдаются.
+
+        Аргументы:
+            - user (User): Пользователь запроса (может быть анонимным).
+            - name (str): Имя файла относительно MEDIA_ROOT.
+
+        Возвращает:
+            - Optional[bool]: True - файл публичный, False - файл доступен пользователю лично,
+              None - доступ запрещен или файла нет.
+    """
+    match = HASHED_NAME.search(name)
+    blob = ImageBlob.objects.filter(sha256=match.group(1)).first() if match else None
+    if blob is not None and blob.file.name != name and not blob.renditions.filter(file=name).exists():
+        blob = None
+    if blob is not None:
+        products = blob.products.all()
+        profiles = blob.profiles.all()
+    else:
+        products = Product.objects.filter(Q(image=name) | Q(thumbnail=name))
+        profiles = UserProfile.objects.filter(Q(avatar=name) | Q(avatar_thumbnail=name))
+
+    if products.exists():
+        return True
+    if user.is_authenticated and (user.is_staff or profiles.filter(user=user).exists()):
+        return False
+    return None
+
+
+def media_cache_control(response, access: bool, name: str) -> None:
+    """
+        Устанавливает заголовки кеширования медиафайла: файлы с хешем содержимого в имени
+        кешируются бессрочно (immutable), остальные публичные файлы — на час, личные файлы
+        (аватары) — только в браузере пользователя.
+
+        Аргументы:
+            - response (HttpResponse): Ответ с файлом.
+            - access (bool): Результат media_access: True - файл публичный, False - личный.
+            - name (str): Имя исходного файла относительно MEDIA_ROOT.
+
+        Возвращает:
+            - None
+    """
+    if not access:
+        response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+    elif is_hashed_name(name):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = PUBLIC_CACHE_CONTROL
+
+
+def sendfile_response(path: str, internal_url: str, content_type: str = None, file=None):
+    """
+        Формирует ответ с файлом. Если задан MEDIA_SENDFILE_BACKEND, тело ответа пустое,
+        а передачу файла выполняет фронтенд-прокси: nginx по заголовку X-Accel-Redirect
+        (internal_url должен указывать на internal-location с этим файлом) или Apache/lighttpd
+        по заголовку X-Sendfile (абсолютный путь). Иначе файл отдает Django.
+
+        Аргументы:
+            - path (str): Абсолютный путь к файлу.
+            - internal_url (str): Адрес файла во внутреннем location nginx.
+            - content_type (Optional[str]): MIME-тип. По умолчанию определяется по расширению.
+            - file (Optional[BinaryIO]): Уже открытый файл. Если файл отдает прокси, он закрывается.
+
+        Возвращает:
+            - HttpResponse: Ответ с файлом или с заголовком для прокси.
+    """
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if not backend:
+        return FileResponse(file or open(path, 'rb'), content_type=content_type)
+    if file is not None:
+        file.close()
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        response['X-Accel-Redirect'] = quote(internal_url)
+    else:
+        response['X-Sendfile'] = path
+    return response
@@ -1,5 +1,18 @@
-from django.db import models
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
+
+from .validators import validate_image_size
 
 
 # Create your models here.
@@ -59,21 +72,39 @@ class Product(models.Model):
             - is_available (BooleanField): Флаг доступности продукта. По умолчанию True.
             - user (ForeignKey): Связь с пользователем, который создал продукт.
                                  При удалении пользователя продукт также удаляется.
+            - image_blob (ForeignKey): Хранимый по хешу файл изображения (ImageBlob).
+                                       Заполняется автоматически при сохранении загруженного изображения.
+            - renditions (QuerySet): Адаптивные версии изображения продукта.
 
         Методы:
             - __str__() -> str:
                 Возвращает строковое представление объекта продукта (его название).
+
+            - save() -> None:
+                Сохраняет продукт и счетчики ссылок его изображения в одной транзакции.
     """
     name = models.CharField(max_length=100)
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='category')
     is_available = models.BooleanField(default=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/', null=True, blank=True)
+    image = models.ImageField(upload_to='products/', null=True, blank=True, validators=[validate_image_size])
+    image_blob = models.ForeignKey('ImageBlob', on_delete=models.SET_NULL, related_name='products',
+                                   null=True, blank=True, editable=False)
     thumbnail = models.ImageField(upload_to='products/thumbnails/', null=True, blank=True)
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs) -> None:
+        # Счетчики ссылок ImageBlob меняются в pre_save (image_storage.attach_image)
+        # и откатываются вместе с неудачным сохранением.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def renditions(self):
+        return ImageRendition.objects.for_blob(self.image_blob_id)
+
 
 class ShopProduct(models.Model):
     """
@@ -87,17 +118,25 @@ class ShopProduct(models.Model):
                                     При удалении продукта запись также удаляется.
                                     Используется related_name='product' для обратной связи.
             - quantity (IntegerField): Количество продукта в магазине.
+            - reserved (IntegerField): Количество продукта, зарезервированного в неоформленных заказах
+                                       (сумма действующих StockReservation). По умолчанию 0.
             - user (ForeignKey): Связь с пользователем, который создал запись.
                                  При удалении пользователя запись также удаляется.
 
-        Методы:
-            не определены
+        Свойства:
+            - available -> int:
+                Количество продукта, доступного для резервирования (quantity - reserved).
     """
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='shop')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product')
     quantity = models.IntegerField()
+    reserved = models.IntegerField(default=0)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    @property
+    def available(self) -> int:
+        return self.quantity - self.reserved
+
 
 class DynamicField(models.Model):
     """
@@ -188,42 +227,150 @@ class OrderProduct(models.Model):
            - order (ForeignKey): Связь с заказом, к которому относится продукт.
                                  При удалении заказа запись также удаляется.
                                  Используется related_name='order_products' для обратной связи.
+           - sub_order (ForeignKey): Связь с заказом поставщика, в который попала позиция при оформлении.
+                                     Опционально (null=True, blank=True).
+                                     Используется related_name='supplier_lines' для обратной связи.
            - quantity (IntegerField): Количество продукта в заказе.
+           - unit_price (DecimalField): Цена за единицу на момент добавления товара в заказ.
+           - product_name (CharField): Название продукта на момент добавления товара в заказ.
+           - shop_name (CharField): Название магазина на момент добавления товара в заказ.
 
        Методы:
-           - update_product_quantity(action: str) -> int:
-               Обновляет количество продукта на складе в зависимости от действия ('out_of_stock' или 'in_stock').
-               Возвращает обновленное количество продукта на складе.
+           - snapshot(shop_product: ShopProduct) -> dict:
+               Возвращает цену, название продукта и магазина для сохранения в позиции заказа.
+
+           - reserve(quantity: int) -> None:
+               Атомарно резервирует товар на складе под позицию заказа.
+
+           - release(quantity: int) -> None:
+               Снимает резерв товара с позиции заказа.
    """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='products')
     shop_product = models.ForeignKey(ShopProduct, on_delete=models.CASCADE, related_name='shop_products')
     order = models.ForeignKey('Order', on_delete=models.CASCADE, related_name='order_products')
+    sub_order = models.ForeignKey('Order', on_delete=models.SET_NULL, related_name='supplier_lines',
+                                  null=True, blank=True)
     quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    product_name = models.CharField(max_length=100, blank=True)
+    shop_name = models.CharField(max_length=50, blank=True)
 
-    def update_product_quantity(self, action: str):
+    @staticmethod
+    def snapshot(shop_product: ShopProduct) -> dict:
         """
-           Аргументы:
-                - action (str): Действие для обновления количества:
-                    - 'out_of_stock': Уменьшает количество товара на складе.
-                    - 'in_stock': Увеличивает количество товара на складе.
+            Снимок данных каталога позволяет показывать историю заказов и письма без join'ов,
+            а итоги старых заказов не меняются при изменении цен в каталоге.
+
+            Аргументы:
+                - shop_product (ShopProduct): Продукт магазина с загруженными shop и product.
+                    Если у него есть аннотация price, цена не запрашивается повторно.
 
             Возвращает:
-                - int: Обновленное количество продукта на складе.
+                - dict: Значения полей unit_price, product_name и shop_name.
+        """
+        price = getattr(shop_product, 'price', None)
+        if price is None:
+            price = ProductInfo.objects.filter(product=shop_product.product_id).values_list('price', flat=True).first()
+        return {
+            'unit_price': price or 0,
+            'product_name': shop_product.product.name,
+            'shop_name': shop_product.shop.name,
+        }
+
+    def reserve(self, quantity: int) -> None:
+        """
+            Резервирует товар под позицию заказа. Счетчик reserved продукта магазина увеличивается
+            одним условным UPDATE (reserved = reserved + n WHERE quantity - reserved >= n),
+            поэтому параллельные заказы не могут зарезервировать больше, чем есть на складе.
+            Срок действия резерва позиции продлевается на STOCK_RESERVATION_TTL.
+
+            Аргументы:
+                - quantity (int): Количество товара для резервирования.
+
+            Возвращает:
+                - None
 
             Исключения:
-                - ValueError: Если действие 'out_of_stock' и недостаточно товара на складе.
+                - ValueError: Если количество не положительное или недостаточно доступного товара на складе.
         """
-        if action == 'out_of_stock':
-            if self.shop_product.quantity >= self.quantity:
-                self.shop_product.quantity -= self.quantity
-                self.shop_product.save()
-                return self.shop_product.quantity
-            else:
+        if quantity < 1:
+            # Отрицательный резерв увеличил бы доступный остаток на складе.
+            raise ValueError("Количество товара должно быть больше нуля")
+        expires_at = StockReservation.expires_from_now()
+        with transaction.atomic():
+            updated = (
+                ShopProduct.objects.filter(pk=self.shop_product_id, quantity__gte=F('reserved') + quantity)
+                .update(reserved=F('reserved') + quantity)
+            )
+            if not updated:
                 raise ValueError("Недостаточно товара на складе")
-        elif action == 'in_stock':
-            self.shop_product.quantity += self.quantity
-            self.shop_product.save()
-            return self.shop_product.quantity
+            extended = StockReservation.objects.filter(order_product=self).update(
+                quantity=F('quantity') + quantity, expires_at=expires_at
+            )
+            if not extended:
+                StockReservation.objects.create(
+                    order_product=self, shop_product_id=self.shop_product_id,
+                    quantity=quantity, expires_at=expires_at,
+                )
+
+    def release(self, quantity: int) -> None:
+        """
+            Снимает резерв с позиции заказа, но не больше, чем зарезервировано
+            (истекший резерв мог быть уже освобожден release_expired_reservations).
+
+            Аргументы:
+                - quantity (int): Количество товара, которое больше не нужно резервировать.
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - ValueError: Если количество не положительное.
+        """
+        if quantity < 1:
+            # Отрицательное снятие резерва увеличило бы reserved сверх остатка на складе.
+            raise ValueError("Количество товара должно быть больше нуля")
+        with transaction.atomic():
+            reservation = StockReservation.objects.select_for_update().filter(order_product=self).first()
+            if reservation is None:
+                return
+            released = min(quantity, reservation.quantity)
+            if released == reservation.quantity:
+                reservation.delete()
+            else:
+                StockReservation.objects.filter(pk=reservation.pk).update(quantity=F('quantity') - released)
+            ShopProduct.objects.filter(pk=self.shop_product_id).update(reserved=F('reserved') - released)
+
+
+class StockReservation(models.Model):
+    """
+        Модель для представления резерва товара под позицию неоформленного заказа.
+
+        Атрибуты:
+            - order_product (OneToOneField): Позиция заказа, под которую зарезервирован товар.
+                                             Используется related_name='reservation' для обратной связи.
+            - shop_product (ForeignKey): Продукт магазина, который зарезервирован.
+                                         Используется related_name='reservations' для обратной связи.
+            - quantity (IntegerField): Зарезервированное количество.
+            - expires_at (DateTimeField): Момент истечения резерва (индексируется для
+                                          release_expired_reservations).
+
+        Методы:
+            - expires_from_now() -> datetime:
+                Возвращает срок действия нового резерва.
+    """
+    order_product = models.OneToOneField(OrderProduct, on_delete=models.CASCADE, related_name='reservation')
+    shop_product = models.ForeignKey(ShopProduct, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    @staticmethod
+    def expires_from_now():
+        """
+            Возвращает:
+                - datetime: Текущее время плюс STOCK_RESERVATION_TTL секунд.
+        """
+        return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
 
 
 class DeliveryContacts(models.Model):
@@ -249,12 +396,22 @@ class DeliveryContacts(models.Model):
     def __str__(self) -> str:
         return self.name
 
+
+class OrderVersionConflict(ValueError):
+    """
+        Исключение, которое возникает, когда заказ изменен параллельным запросом:
+        условный UPDATE ... WHERE version = n не нашел строку с ожидаемой версией
+        и повторные попытки исчерпаны, либо заказ за это время перестал быть редактируемым.
+    """
+
+
 class Order(models.Model):
     """
         Модель для представления заказа.
 
         Атрибуты:
             - ORDER_STATUS_CHOICES (list[tuple[str, str]]): Список возможных статусов заказа.
+            - EDITABLE_STATUSES (tuple[str]): Статусы, в которых можно менять позиции заказа.
             - user (ForeignKey): Связь с пользователем, который создал заказ.
                                  При удалении пользователя заказ также удаляется.
             - status_choice (CharField): Текущий статус заказа. По умолчанию 'empty' (Пустой).
@@ -266,16 +423,46 @@ class Order(models.Model):
             - delivery_contacts (ForeignKey): Связь с контактными данными доставки.
                                               При удалении данных доставки связь обнуляется.
                                               Опционально (null=True, blank=True).
+            - version (IntegerField): Версия строки для оптимистичной блокировки. Каждое изменение
+                                      заказа выполняется условным UPDATE ... WHERE version = n
+                                      и увеличивает версию на 1.
+            - parent (ForeignKey): Для заказа поставщика — связь с заказом покупателя, из которого он выделен.
+                                   Опционально (null=True, blank=True).
+                                   Используется related_name='sub_orders' для обратной связи.
+            - shop (ForeignKey): Для заказа поставщика — магазин, позиции которого в него входят.
+                                 Опционально (null=True, blank=True).
+                                 Используется related_name='orders' для обратной связи.
+                                 Индексы (shop, -created_at) и (shop, status_choice, -created_at)
+                                 обслуживают входящие заказы поставщика (SupplierOrderViewSet),
+                                 индекс (user, -created_at) — историю заказов в профиле.
 
         Методы:
-            - get_product_price() -> Decimal:
-                Возвращает цену первого продукта в заказе.
+            - get_totals() -> dict:
+                Возвращает общую стоимость и количество позиций заказа одним агрегирующим запросом.
 
-            - update_total_price(price: Optional[Decimal] = None) -> None:
+            - update_total_price() -> None:
                 Обновляет общую стоимость заказа на основе цен и количества продуктов.
 
             - update_status() -> None:
                 Обновляет статус заказа в зависимости от наличия продуктов в заказе.
+
+            - update_totals() -> None:
+                Обновляет общую стоимость и статус заказа одним UPDATE.
+
+            - edit(change: Callable[[], Any]) -> Any:
+                Выполняет изменение позиций заказа в транзакции, повторяя ее целиком при конфликте версий.
+
+            - add_line(shop_product: ShopProduct, quantity: int, **snapshot) -> OrderProduct:
+                Добавляет продукт в заказ и резервирует его на складе в одной транзакции.
+
+            - apply_lines(lines: dict[int, int]) -> None:
+                Применяет изменения количества сразу по нескольким продуктам в одной транзакции.
+
+            - place() -> None:
+                Превращает резервы заказа в списание со склада и переводит заказ в статус 'done'.
+
+            - split_by_supplier() -> list[Order]:
+                Разделяет оформленный заказ на заказы поставщиков по магазинам.
     """
     ORDER_STATUS_CHOICES = [
         ('empty', 'Пустой'),
@@ -283,6 +470,7 @@ class Order(models.Model):
         ('making an order', 'Оформление заказа'),
         ('done', 'Завершен'),
     ]
+    EDITABLE_STATUSES = ('empty', 'new')
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     status_choice = models.CharField(default=ORDER_STATUS_CHOICES[0][0])
@@ -292,39 +480,484 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     delivery_contacts = models.ForeignKey(DeliveryContacts, on_delete=models.CASCADE,
                                           related_name='delivery_contacts', null=True, blank=True)
+    version = models.IntegerField(default=0)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='sub_orders', null=True, blank=True)
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, related_name='orders', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            models.Index(fields=['shop', '-created_at'], name='order_shop_created_idx'),
+            models.Index(fields=['shop', 'status_choice', '-created_at'], name='order_shop_status_created_idx'),
+        ]
+
+    def get_totals(self) -> dict:
+        """
+            Каждая позиция умножается на свою сохраненную цену (unit_price),
+            сумма считается в базе данных одним запросом Sum(quantity * unit_price).
+
+            Возвращает:
+                - dict: {'total_price': Decimal, 'lines': int}.
+        """
+        return self.order_products.aggregate(
+            total_price=Coalesce(
+                Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+                Decimal(0),
+            ),
+            lines=Count('id'),
+        )
+
+    def _fresh_totals(self) -> dict:
+        """
+            Читает итоги позиций вместе с текущими версией и статусом заказа одним запросом,
+            поэтому между чтением версии и условным UPDATE (_save_fields) нет других запросов,
+            и конфликт возможен, только если заказ изменен именно в этот промежуток.
+
+            Возвращает:
+                - dict: {'total_price': Decimal, 'lines': int}.
+
+            Исключения:
+                - OrderVersionConflict: Если заказ уже нельзя редактировать.
+        """
+        row = Order.objects.filter(pk=self.pk).annotate(
+            lines_total=Coalesce(
+                Sum(
+                    F('order_products__quantity') * F('order_products__unit_price'),
+                    output_field=models.DecimalField(max_digits=10, decimal_places=2),
+                ),
+                Decimal(0),
+            ),
+            lines_count=Count('order_products'),
+        ).values('version', 'status_choice', 'lines_total', 'lines_count').get()
+        self.version, self.status_choice = row['version'], row['status_choice']
+        if self.status_choice not in self.EDITABLE_STATUSES:
+            raise OrderVersionConflict(f"Заказ уже изменен. Статус: {self.status_choice}")
+        return {'total_price': row['lines_total'], 'lines': row['lines_count']}
+
+    def _save_fields(self, **fields) -> None:
+        """
+            Записывает переданные поля одним условным UPDATE ... WHERE version = n
+            без перечитывания и блокировки строки заказа, увеличивая версию на 1.
+
+            Аргументы:
+                - **fields: Имена полей и их новые значения.
+
+            Исключения:
+                - OrderVersionConflict: Если строка заказа уже изменена другим запросом.
+        """
+        fields['updated_at'] = timezone.now()
+        updated = Order.objects.filter(pk=self.pk, version=self.version).update(
+            version=F('version') + 1, **fields
+        )
+        if not updated:
+            raise OrderVersionConflict("Заказ был изменен другим запросом, повторите попытку")
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.version += 1
+
+    def _retry_on_conflict(self, change, editable_statuses):
+        """
+            Выполняет изменение заказа с повторами при конфликте версий.
+
+            После конфликта выполняется пауза со случайной долей
+            ORDER_VERSION_RETRY_DELAY * 2 ** попытка секунд, версия и статус перечитываются
+            из базы данных, и, если заказ все еще в одном из editable_statuses, изменение
+            повторяется (не более ORDER_VERSION_RETRIES раз). Изменение, которое пишет
+            что-либо до _save_fields, должно само выполняться в transaction.atomic, чтобы
+            неудачная попытка откатывалась целиком.
 
-    def get_product_price(self):
+            Внутри транзакции повторов нет: строки, уже измененные вызывающим кодом
+            (например, резерв на складе), оставались бы заблокированными на время паузы,
+            поэтому конфликт сразу передается наверх, а повторяется вся транзакция (edit).
+
+            Аргументы:
+                - change (Callable[[], Any]): Изменение заказа, которое вызывает _save_fields.
+                - editable_statuses (tuple[str]): Статусы, в которых изменение допустимо.
+
+            Возвращает:
+                - Any: Результат change.
+
+            Исключения:
+                - OrderVersionConflict: Если заказ перестал быть редактируемым или повторы исчерпаны.
+        """
+        retries = 0 if transaction.get_connection().in_atomic_block else settings.ORDER_VERSION_RETRIES
+        for attempt in range(retries + 1):
+            if self.status_choice not in editable_statuses:
+                raise OrderVersionConflict(f"Заказ уже изменен. Статус: {self.status_choice}")
+            try:
+                return change()
+            except OrderVersionConflict:
+                if attempt == retries:
+                    raise
+                time.sleep(random.uniform(0, settings.ORDER_VERSION_RETRY_DELAY * 2 ** attempt))
+                self.refresh_from_db(fields=['version', 'status_choice'])
+
+    def edit(self, change):
         """
+            Выполняет изменение позиций заказа в transaction.atomic. При конфликте версий
+            транзакция откатывается и повторяется целиком (_retry_on_conflict), поэтому
+            блокировки строк не удерживаются во время паузы перед повтором.
+
+            Аргументы:
+                - change (Callable[[], Any]): Изменение позиций и итогов заказа.
+
             Возвращает:
-                - Decimal: Цена первого продукта в заказе.
+                - Any: Результат change.
+
+            Исключения:
+                - OrderVersionConflict: Если заказ перестал быть редактируемым или повторы исчерпаны.
         """
-        price = ProductInfo.objects.filter(product=self.order_products.first().product).first().price
-        return price
+        def attempt():
+            with transaction.atomic():
+                return change()
+
+        return self._retry_on_conflict(attempt, self.EDITABLE_STATUSES)
 
-    def update_total_price(self, price=None) -> None:
+    def _status_for(self, lines: int) -> str:
         """
-                Аргументы:
-                    - price (Optional[Decimal]): Цена продукта (опционально).
+            Аргументы:
+                - lines (int): Количество позиций в заказе.
 
-                Возвращает:
-                    - None
+            Возвращает:
+                - str: 'empty' для пустого заказа, иначе 'new'.
         """
-        if not self.order_products.exists():
-            self.total_price = 0
-        else:
-            self.total_price = sum(self.get_product_price() * item.quantity for item in self.order_products.all())
-            self.save()
+        return self.ORDER_STATUS_CHOICES[1][0] if lines else self.ORDER_STATUS_CHOICES[0][0]
+
+    def update_total_price(self) -> None:
+        """
+            Обновляет общую стоимость заказа: сумма позиций считается одним агрегирующим
+            запросом (_fresh_totals) и записывается условным UPDATE по версии заказа (_save_fields).
+            При конфликте версий стоимость пересчитывается заново (_retry_on_conflict).
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - OrderVersionConflict: Если заказ оформлен параллельным запросом или повторы исчерпаны.
+        """
+        self._retry_on_conflict(
+            lambda: self._save_fields(total_price=self._fresh_totals()['total_price']),
+            self.EDITABLE_STATUSES,
+        )
 
     def update_status(self) -> None:
         """
+            Обновляет статус заказа в зависимости от наличия продуктов в заказе ('empty' или 'new').
+            Статус записывается условным UPDATE по версии заказа (_save_fields); при конфликте
+            версий наличие позиций проверяется заново (_retry_on_conflict).
+
             Возвращает:
                 - None
+
+            Исключения:
+                - OrderVersionConflict: Если заказ оформлен параллельным запросом или повторы исчерпаны.
         """
-        if not self.order_products.exists():
-            self.status_choice = self.ORDER_STATUS_CHOICES[0][0]
-        elif self.order_products.exists():
-            self.status_choice = self.ORDER_STATUS_CHOICES[1][0]
-        self.save()
+        self._retry_on_conflict(
+            lambda: self._save_fields(status_choice=self._status_for(self._fresh_totals()['lines'])),
+            self.EDITABLE_STATUSES,
+        )
+
+    def update_totals(self) -> None:
+        """
+            Пересчитывает стоимость и статус заказа: один агрегирующий запрос и один UPDATE,
+            независимо от количества позиций в заказе. При конфликте версий итог
+            пересчитывается заново (_retry_on_conflict).
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - OrderVersionConflict: Если заказ оформлен параллельным запросом или повторы исчерпаны.
+        """
+        def save_totals():
+            totals = self._fresh_totals()
+            self._save_fields(total_price=totals['total_price'], status_choice=self._status_for(totals['lines']))
+
+        self._retry_on_conflict(save_totals, self.EDITABLE_STATUSES)
+
+    def add_line(self, shop_product: ShopProduct, quantity: int, **snapshot) -> OrderProduct:
+        """
+            Аргументы:
+                - shop_product (ShopProduct): Продукт магазина, который добавляется в заказ.
+                - quantity (int): Количество продукта.
+                - **snapshot: Цена и названия для новой позиции. По умолчанию берутся из каталога.
+
+            Возвращает:
+                - OrderProduct: Позиция заказа.
+
+            Исключения:
+                - ValueError: Если недостаточно доступного товара на складе. Транзакция откатывается,
+                              новая позиция не сохраняется.
+        """
+        with transaction.atomic():
+            order_product, created = OrderProduct.objects.get_or_create(
+                product_id=shop_product.product_id,
+                order=self,
+                defaults={
+                    'shop_product': shop_product,
+                    'quantity': quantity,
+                    **(snapshot or OrderProduct.snapshot(shop_product)),
+                },
+            )
+            order_product.reserve(quantity)
+            if not created:
+                OrderProduct.objects.filter(pk=order_product.pk).update(quantity=F('quantity') + quantity)
+        return order_product
+
+    def apply_lines(self, lines: dict) -> None:
+        """
+            Все затронутые продукты магазина проверяются и блокируются одним запросом
+            (SELECT ... FOR UPDATE в порядке id, чтобы параллельные запросы не взаимоблокировались),
+            после чего резервы и позиции заказа обновляются пакетно, а итог пересчитывается один раз.
+
+            Аргументы:
+                - lines (dict[int, int]): id продукта -> изменение количества в заказе.
+                    Положительное значение добавляет продукт в заказ и резервирует его на складе,
+                    отрицательное — уменьшает позицию и снимает резерв.
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - ValueError: Если хотя бы одну позицию применить нельзя. Транзакция откатывается целиком.
+                - OrderVersionConflict: Если заказ оформлен параллельным запросом или повторы исчерпаны.
+        """
+        self.edit(lambda: self._apply_lines(lines))
+
+    def _apply_lines(self, lines: dict) -> None:
+        price = ProductInfo.objects.filter(product=OuterRef('product')).values('price')[:1]
+        expires_at = StockReservation.expires_from_now()
+        shop_products = {}
+        locked = (
+            ShopProduct.objects.select_for_update(of=('self',))
+            .select_related('shop', 'product')
+            .annotate(price=Subquery(price))
+            .filter(product_id__in=lines)
+            .order_by('id')
+        )
+        for shop_product in locked:
+            shop_products.setdefault(shop_product.product_id, shop_product)
+        order_products = {
+            order_product.product_id: order_product
+            for order_product in self.order_products.select_for_update().order_by('id')
+        }
+        reservations = {
+            reservation.order_product_id: reservation
+            for reservation in StockReservation.objects.select_for_update().filter(order_product__order=self)
+        }
+
+        errors = []
+        for product_id, quantity in lines.items():
+            shop_product = shop_products.get(product_id)
+            order_product = order_products.get(product_id)
+            if shop_product is None:
+                errors.append(f"Товар {product_id} не найден")
+            elif quantity > 0 and not shop_product.product.is_available:
+                errors.append(f"Товар {shop_product.product.name} недоступен для продажи")
+            elif quantity > 0 and shop_product.available < quantity:
+                errors.append(f"Недостаточно товара {shop_product.product.name} на складе")
+            elif quantity < 0 and (order_product is None or order_product.quantity < -quantity):
+                errors.append(f"Количество продукта {shop_product.product.name} в заказе меньше указанного")
+        if errors:
+            raise ValueError("; ".join(errors))
+
+        new_lines, changed_lines, removed_lines = [], [], []
+        for product_id, quantity in lines.items():
+            shop_product = shop_products[product_id]
+            order_product = order_products.get(product_id)
+            if order_product is None:
+                new_lines.append(OrderProduct(
+                    order=self,
+                    product_id=product_id,
+                    shop_product=shop_product,
+                    quantity=quantity,
+                    **OrderProduct.snapshot(shop_product),
+                ))
+            elif order_product.quantity + quantity == 0:
+                removed_lines.append(order_product)
+            else:
+                order_product.quantity += quantity
+                changed_lines.append(order_product)
+
+        OrderProduct.objects.bulk_create(new_lines)
+        OrderProduct.objects.bulk_update(changed_lines, ['quantity'])
+
+        new_reservations, changed_reservations = [], []
+        for order_product in new_lines + changed_lines:
+            quantity = lines[order_product.product_id]
+            shop_product = shop_products[order_product.product_id]
+            reservation = reservations.get(order_product.pk)
+            if quantity < 0:
+                quantity = -min(-quantity, reservation.quantity if reservation else 0)
+            shop_product.reserved += quantity
+            if reservation is None:
+                if quantity > 0:
+                    new_reservations.append(StockReservation(
+                        order_product=order_product, shop_product=shop_product,
+                        quantity=quantity, expires_at=expires_at,
+                    ))
+            else:
+                reservation.quantity += quantity
+                reservation.expires_at = expires_at
+                changed_reservations.append(reservation)
+        for order_product in removed_lines:
+            reservation = reservations.get(order_product.pk)
+            if reservation is not None:
+                shop_products[order_product.product_id].reserved -= reservation.quantity
+
+        StockReservation.objects.bulk_create(new_reservations)
+        StockReservation.objects.bulk_update(changed_reservations, ['quantity', 'expires_at'])
+        StockReservation.objects.filter(quantity__lte=0, order_product__order=self).delete()
+        OrderProduct.objects.filter(pk__in=[order_product.pk for order_product in removed_lines]).delete()
+        ShopProduct.objects.bulk_update(shop_products.values(), ['reserved'])
+        self.update_totals()
+
+    def place(self) -> None:
+        """
+            Резервы позиций превращаются в списание со склада: для каждой позиции выполняется один
+            UPDATE quantity = quantity - n, reserved = reserved - r, где r — зарезервированная часть.
+            Незарезервированная часть позиции (резерв истек и был освобожден) списывается,
+            только если она доступна: WHERE quantity - reserved >= n - r.
+            После списания заказ разделяется на заказы поставщиков (split_by_supplier).
+            Статус 'done' записывается условным UPDATE ... WHERE version = n: если позиции заказа
+            изменились параллельно, попытка откатывается и выполняется заново по актуальным позициям.
+
+            Возвращает:
+                - None
+
+            Исключения:
+                - ValueError: Если для незарезервированной части позиции недостаточно товара.
+                              Транзакция откатывается, заказ остается неоформленным.
+                - OrderVersionConflict: Если заказ уже оформлен или повторы исчерпаны.
+        """
+        self._retry_on_conflict(self._place, (self.ORDER_STATUS_CHOICES[1][0],))
+
+    def _place(self) -> None:
+        with transaction.atomic():
+            reservations = {
+                reservation.order_product_id: reservation.quantity
+                for reservation in StockReservation.objects.select_for_update().filter(order_product__order=self)
+            }
+            for order_product in self.order_products.order_by('shop_product_id'):
+                reserved = reservations.get(order_product.pk, 0)
+                updated = ShopProduct.objects.filter(
+                    pk=order_product.shop_product_id,
+                    quantity__gte=F('reserved') + order_product.quantity - reserved,
+                ).update(
+                    quantity=F('quantity') - order_product.quantity,
+                    reserved=F('reserved') - reserved,
+                )
+                if not updated:
+                    raise ValueError(f"Недостаточно товара {order_product.product_name} на складе")
+            StockReservation.objects.filter(order_product__order=self).delete()
+            self._save_fields(
+                status_choice=self.ORDER_STATUS_CHOICES[3][0],
+                delivery_choice=self.delivery_choice,
+                delivery_contacts=self.delivery_contacts,
+            )
+            self.split_by_supplier()
+
+    def split_by_supplier(self) -> list:
+        """
+            Позиции заказа читаются одним запросом с select_related до магазина и его владельца
+            и группируются по магазину. Для каждого магазина создается заказ поставщика
+            (parent=self, shop=магазин) с суммой его позиций, а позиции получают ссылку sub_order.
+            Позиции остаются в заказе покупателя, поэтому покупатель видит заказ целиком,
+            а поставщик — только свои позиции. Число запросов не зависит от числа магазинов.
+
+            Возвращает:
+                - list[Order]: Созданные заказы поставщиков с загруженными shop и shop.user.
+        """
+        lines = list(self.order_products.select_related('shop_product__shop__user').order_by('id'))
+        groups = {}
+        for line in lines:
+            groups.setdefault(line.shop_product.shop_id, []).append(line)
+
+        sub_orders = Order.objects.bulk_create(
+            Order(
+                user_id=self.user_id,
+                parent=self,
+                shop=shop_lines[0].shop_product.shop,
+                status_choice=self.status_choice,
+                delivery_choice=self.delivery_choice,
+                delivery_contacts_id=self.delivery_contacts_id,
+                total_price=sum(line.quantity * line.unit_price for line in shop_lines),
+            )
+            for shop_lines in groups.values()
+        )
+        for sub_order, shop_lines in zip(sub_orders, groups.values()):
+            for line in shop_lines:
+                line.sub_order = sub_order
+        OrderProduct.objects.bulk_update(lines, ['sub_order'])
+        return sub_orders
+
+
+class OrderNotification(models.Model):
+    """
+        Модель для представления письма об оформлении заказа (transactional outbox).
+
+        Письма создаются в той же транзакции, что и смена статуса заказа, поэтому не теряются
+        при сбое воркера и не отправляются для откатившихся заказов. Отправку выполняет
+        задача send_order_notifications.
+
+        Атрибуты:
+            - STATUS_CHOICES (list[tuple[str, str]]): Список возможных статусов письма.
+            - order (ForeignKey): Связь с заказом, к которому относится письмо (опционально:
+                                  у сводок поставщикам заказа нет).
+                                  Используется related_name='notifications' для обратной связи.
+            - recipient (EmailField): Email адрес получателя.
+            - subject (CharField): Тема письма.
+            - text (TextField): Текст письма.
+            - status (CharField): Статус отправки. По умолчанию 'pending'.
+            - attempts (IntegerField): Количество неудачных попыток отправки.
+            - next_attempt_at (DateTimeField): Время следующей попытки отправки (индексируется).
+            - last_error (TextField): Текст последней ошибки отправки.
+            - created_at (DateTimeField): Дата и время создания письма (автоматически добавляется).
+            - sent_at (DateTimeField): Дата и время отправки письма (опционально).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не отправлено'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_CHOICES[0][0])
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+
+class SupplierOrderEvent(models.Model):
+    """
+        Модель для представления события "новый заказ" для поставщика, ожидающего отправки в сводке.
+
+        Создается при оформлении заказа для каждого заказа поставщика
+        (notifications.queue_order_notifications), если включен режим сводок (SUPPLIER_DIGEST_INTERVAL). Задача send_supplier_digests
+        собирает накопленные события в одно письмо на поставщика и отмечает их отправленными.
+
+        Атрибуты:
+            - supplier (ForeignKey): Связь с пользователем-поставщиком.
+                                     Используется related_name='order_events' для обратной связи.
+            - order (ForeignKey): Связь с заказом поставщика.
+                                  Используется related_name='supplier_events' для обратной связи.
+            - created_at (DateTimeField): Дата и время создания события (автоматически добавляется).
+            - digest_sent_at (DateTimeField): Дата и время включения события в сводку (опционально, индексируется).
+    """
+    supplier = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_events')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='supplier_events')
+    created_at = models.DateTimeField(auto_now_add=True)
+    digest_sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supplier', 'order'], name='unique_supplier_order_event'),
+        ]
 
 
 class VerificationToken(models.Model):
@@ -361,14 +994,119 @@ class UserProfile(models.Model):
                                     При удалении пользователя профиль также удаляется.
             - avatar (ImageField): Изображение пользователя (опционально).
             - avatar_thumbnail (ImageField): Миниатюра изображения пользователя (опционально).
+            - avatar_blob (ForeignKey): Хранимый по хешу файл изображения (ImageBlob).
+                                        Заполняется автоматически при сохранении загруженного изображения.
+            - renditions (QuerySet): Адаптивные версии изображения пользователя.
 
         Методы:
             - __str__() -> str:
                 Возвращает строковое представление объекта профиля.
+
+            - save() -> None:
+                Сохраняет профиль и счетчики ссылок его изображения в одной транзакции.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, validators=[validate_image_size])
+    avatar_blob = models.ForeignKey('ImageBlob', on_delete=models.SET_NULL, related_name='profiles',
+                                    null=True, blank=True, editable=False)
     avatar_thumbnail = models.ImageField(upload_to='avatars/thumbnails/', null=True, blank=True)
 
     def __str__(self):
         return f"Profile of {self.user.username}"
+
+    def save(self, *args, **kwargs) -> None:
+        # Счетчики ссылок ImageBlob меняются в pre_save (image_storage.attach_image)
+        # и откатываются вместе с неудачным сохранением.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def renditions(self):
+        return ImageRendition.objects.for_blob(self.avatar_blob_id)
+
+
+class ImageBlob(models.Model):
+    """
+        Модель для представления загруженного изображения, сохраненного по хешу содержимого.
+
+        Одинаковые файлы (например, одна фотография для всех вариантов товара и всех магазинов)
+        хранятся один раз, и адаптивные версии для них создаются тоже один раз.
+        ref_count — количество товаров и профилей, которые ссылаются на изображение;
+        изображения без ссылок удаляются задачей collect_image_garbage.
+
+        Атрибуты:
+            - sha256 (CharField): SHA-256 содержимого файла (уникальный).
+            - file (ImageField): Файл изображения.
+            - size (PositiveBigIntegerField): Размер файла в байтах.
+            - ref_count (PositiveIntegerField): Количество объектов, ссылающихся на изображение.
+            - created_at (DateTimeField): Дата и время загрузки (автоматически добавляется).
+            - renditions (GenericRelation): Адаптивные версии изображения (ImageRendition).
+
+        Методы:
+            - __str__() -> str:
+                Возвращает хеш содержимого.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.ImageField(upload_to='images/')
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    renditions = GenericRelation('ImageRendition')
+
+    def __str__(self):
+        return self.sha256
+
+
+class ImageRenditionManager(models.Manager):
+    def for_blob(self, blob_id):
+        """
+            Аргументы:
+                - blob_id (Optional[int]): Идентификатор ImageBlob.
+
+            Возвращает:
+                - QuerySet: Версии изображения или пустой QuerySet, если изображения нет.
+        """
+        if blob_id is None:
+            return self.none()
+        return self.filter(content_type=ContentType.objects.get_for_model(ImageBlob), object_id=blob_id)
+
+
+class ImageRendition(models.Model):
+    """
+        Модель для представления адаптивной версии изображения определенного размера и формата.
+
+        Атрибуты:
+            - FORMAT_CHOICES (list[tuple[str, str]]): Список форматов версий.
+            - content_type (ForeignKey): Тип объекта, которому принадлежит изображение.
+            - object_id (PositiveIntegerField): Идентификатор объекта.
+            - content_object (GenericForeignKey): Изображение (ImageBlob).
+                                                  Обратная связь — поле renditions объекта.
+                                                  У Product и UserProfile renditions — версии их ImageBlob.
+            - width (PositiveIntegerField): Размер версии по большей стороне в пикселях.
+            - format (CharField): Формат файла версии ('JPEG' или 'WEBP').
+            - file (ImageField): Файл версии.
+            - created_at (DateTimeField): Дата и время создания версии (автоматически добавляется).
+    """
+    FORMAT_CHOICES = [
+        ('JPEG', 'JPEG'),
+        ('WEBP', 'WebP'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    file = models.ImageField(upload_to='renditions/')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageRenditionManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='rendition_object_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'width', 'format'],
+                                    name='unique_image_rendition'),
+        ]
@@ -0,0 +1,167 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
+
+from .models import Order, OrderNotification, OrderProduct, SupplierOrderEvent
+
+
+def order_email_text(order: Order, lines: list[OrderProduct]) -> str:
+    """
+        Формирует текст письма об оформленном заказе.
+
+        Аргументы:
+            - order (Order): Оформленный заказ покупателя (используется для способа получения).
+            - lines (list[OrderProduct]): Позиции, которые нужно перечислить в письме.
+
+        Возвращает:
+            - str: Текст письма со списком продуктов, суммой позиций и способом получения.
+    """
+    total_price = sum((line.quantity * line.unit_price for line in lines), Decimal(0))
+    text = (
+        f"Поступил новый заказ.\n"
+        f"'Продукты: {' '.join(line.product_name for line in lines)}\n"
+        f"Общая сумма заказа {total_price} рублей.\n"
+    )
+    if not order.delivery_choice:
+        return text + "Способ получения - самовывоз "
+    return text + (
+        f"Доставка указана по адресу: город {order.delivery_contacts.city}, "
+        f"улица {order.delivery_contacts.street}, "
+        f"дом {order.delivery_contacts.house_number}, "
+        f"квартира {order.delivery_contacts.apartment_number}."
+    )
+
+
+def queue_order_notifications(order: Order) -> list[OrderNotification]:
+    """
+        Записывает письма поставщикам и покупателю в OrderNotification.
+
+        Должна вызываться после Order.place в той же транзакции: письма сохраняются только
+        вместе с заказом, а задача send_order_notifications запускается после фиксации транзакции.
+        Позиции заказа вместе с заказами поставщиков и владельцами магазинов читаются одним запросом;
+        владелец каждого магазина получает письмо только со своими позициями. Если включен режим сводок
+        (SUPPLIER_DIGEST_INTERVAL > 0), вместо писем поставщикам создаются SupplierOrderEvent.
+
+        Аргументы:
+            - order (Order): Оформленный заказ покупателя.
+
+        Возвращает:
+            - list[OrderNotification]: Созданные письма.
+    """
+    from .tasks import send_order_notifications
+
+    lines = list(order.order_products.select_related('sub_order__shop__user').order_by('id'))
+    sub_orders = {}
+    for line in lines:
+        if line.sub_order is not None:
+            sub_orders.setdefault(line.sub_order_id, (line.sub_order, []))[1].append(line)
+
+    notifications = []
+    if settings.SUPPLIER_DIGEST_INTERVAL:
+        SupplierOrderEvent.objects.bulk_create(
+            SupplierOrderEvent(supplier_id=sub_order.shop.user_id, order=sub_order)
+            for sub_order, _ in sub_orders.values()
+        )
+    else:
+        notifications.extend(
+            OrderNotification(
+                order=sub_order, recipient=sub_order.shop.user.email, subject="Новый заказ",
+                text=order_email_text(order, sub_order_lines),
+            )
+            for sub_order, sub_order_lines in sub_orders.values() if sub_order.shop.user.email
+        )
+    if order.user.email:
+        notifications.append(OrderNotification(
+            order=order, recipient=order.user.email, subject="Подтверждение заказа",
+            text=order_email_text(order, lines),
+        ))
+    notifications = OrderNotification.objects.bulk_create(notifications)
+    transaction.on_commit(send_order_notifications.delay)
+    return notifications
+
+
+def supplier_digest_text(orders: int, lines: list[dict]) -> str:
+    """
+        Формирует текст сводки заказов для поставщика.
+
+        Аргументы:
+            - orders (int): Количество заказов в сводке.
+            - lines (list[dict]): Строки сводки с полями product_name, total_quantity и total_price.
+
+        Возвращает:
+            - str: Текст письма со списком продуктов и общей суммой.
+    """
+    total = sum((line['total_price'] for line in lines), Decimal(0))
+    products = "\n".join(
+        f"{line['product_name']} - {line['total_quantity']} шт. на сумму {line['total_price']} рублей" for line in lines
+    )
+    return (
+        f"Поступили новые заказы: {orders}.\n"
+        f"Продукты:\n{products}\n"
+        f"Общая сумма заказов {total} рублей.\n"
+    )
+
+
+def queue_supplier_digests(batch_size: int = 1000) -> list[OrderNotification]:
+    """
+        Собирает накопленные SupplierOrderEvent в одно письмо-сводку на поставщика.
+
+        События блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому параллельный запуск
+        не отправит одно событие дважды. События ссылаются на заказы поставщиков, поэтому строки сводки
+        для всех поставщиков читаются одним запросом по их позициям, сгруппированным по владельцу
+        магазина и продукту. Письма записываются в OrderNotification
+        и отправляются задачей send_order_notifications после фиксации транзакции.
+
+        Аргументы:
+            - batch_size (int): Максимальное количество событий, обрабатываемых за один вызов.
+
+        Возвращает:
+            - list[OrderNotification]: Созданные письма-сводки.
+    """
+    from .tasks import send_order_notifications
+
+    with transaction.atomic():
+        events = list(
+            SupplierOrderEvent.objects.select_for_update(skip_locked=True)
+            .filter(digest_sent_at__isnull=True)
+            .order_by('id')
+            .values_list('id', 'supplier_id')[:batch_size]
+        )
+        if not events:
+            return []
+        event_ids = [event_id for event_id, _ in events]
+        orders = defaultdict(int)
+        for _, supplier_id in events:
+            orders[supplier_id] += 1
+
+        rows = (
+            OrderProduct.objects
+            .filter(sub_order__supplier_events__id__in=event_ids)
+            .values('sub_order__shop__user_id', 'sub_order__shop__user__email', 'product_name')
+            .annotate(
+                total_quantity=Sum('quantity'),
+                total_price=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=10, decimal_places=2)),
+            )
+            .order_by('sub_order__shop__user_id', 'product_name')
+        )
+        digests = defaultdict(list)
+        emails = {}
+        for row in rows:
+            digests[row['sub_order__shop__user_id']].append(row)
+            emails[row['sub_order__shop__user_id']] = row['sub_order__shop__user__email']
+
+        notifications = OrderNotification.objects.bulk_create(
+            OrderNotification(
+                recipient=emails[supplier_id],
+                subject="Сводка новых заказов",
+                text=supplier_digest_text(orders[supplier_id], lines),
+            )
+            for supplier_id, lines in digests.items() if emails[supplier_id]
+        )
+        SupplierOrderEvent.objects.filter(id__in=event_ids).update(digest_sent_at=timezone.now())
+        transaction.on_commit(send_order_notifications.delay)
+    return notifications
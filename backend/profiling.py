@@ -0,0 +1,272 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Профиль текущего запроса (RequestProfile) или None вне запроса.
+_profile = ContextVar('request_profile', default=None)
+# Пути медленных запросов, следующий запрос к которым записывается полностью (не больше SLOW_PATHS_LIMIT).
+_slow_paths = OrderedDict()
+_slow_paths_lock = threading.Lock()
+SLOW_PATHS_LIMIT = 1000
+
+
+class RequestProfile:
+    """
+        Данные профилирования одного запроса.
+
+        Атрибуты:
+            - reason (Optional[str]): Правило, по которому запрос записывается полностью
+              ('header', 'path', 'user', 'slow', 'sample'), или None - только время и счетчики.
+            - started_at (datetime): Время начала запроса.
+            - queries (int): Количество SQL-запросов.
+            - db_ms (float): Суммарное время SQL-запросов в миллисекундах.
+            - sql (list[dict]): SQL-запросы с длительностью (только если reason задан).
+    """
+    def __init__(self, reason=None):
+        self.reason = reason
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.sql = []
+
+
+def record_query(execute, sql, params, many, context):
+    """
+        Обертка выполнения SQL (connection.execute_wrappers): всегда считает количество и время
+        запросов, а текст запросов сохраняет только для запросов, записываемых полностью.
+    """
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        profile.queries += 1
+        profile.db_ms += duration
+        if profile.reason:
+            profile.sql.append({
+                'sql': sql, 'duration_ms': round(duration, 3), 'database': context['connection'].alias,
+            })
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    """
+        Подключает record_query к каждому соединению с БД (один раз на объект соединения).
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def profiling_user(request):
+    """
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - set[str]: Идентификатор и имя пользователя сессии или токена (пустое множество для анонимного).
+    """
+    authorization = request.headers.get('Authorization', '').split()
+    if len(authorization) == 2 and authorization[0].lower() == 'token':
+        from rest_framework.authtoken.models import Token
+
+        user = Token.objects.filter(key=authorization[1]).values_list('user_id', 'user__username').first()
+        return {str(user[0]), user[1]} if user else set()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return {str(user.pk), user.username}
+    return set()
+
+
+def capture_reason(request):
+    """
+        Определяет, нужно ли записать запрос полностью (с SQL), по правилам PROFILING_*:
+        заголовок X-Profile со значением PROFILING_HEADER_TOKEN, префикс пути из PROFILING_PATHS,
+        пользователь из PROFILING_USERS, путь, предыдущий запрос к которому был медленнее
+        PROFILING_SLOW_MS, и случайная выборка с долей PROFILING_SAMPLE_RATE.
+
+        Аргументы:
+            - request (HttpRequest): Запрос.
+
+        Возвращает:
+            - Optional[str]: Сработавшее правило или None.
+    """
+    token = settings.PROFILING_HEADER_TOKEN
+    if token and request.headers.get('X-Profile') == token:
+        return 'header'
+    if any(request.path.startswith(prefix) for prefix in settings.PROFILING_PATHS):
+        return 'path'
+    if _slow_paths:
+        with _slow_paths_lock:
+            if _slow_paths.pop(request.path, None):
+                return 'slow'
+    if settings.PROFILING_USERS and profiling_user(request) & set(settings.PROFILING_USERS):
+        return 'user'
+    if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+_sinks = (None, [])
+
+
+def get_sinks() -> list:
+    """
+        Возвращает:
+            - list: Экземпляры классов из PROFILING_SINKS (создаются заново при изменении настройки).
+    """
+    global _sinks
+    paths, sinks = _sinks
+    if paths != tuple(settings.PROFILING_SINKS):
+        _sinks = paths, sinks = tuple(settings.PROFILING_SINKS), [import_string(path)() for path in settings.PROFILING_SINKS]
+    return sinks
+
+
+def emit(data: dict) -> None:
+    """
+        Передает профиль во все sinks. Ошибка sink записывается в журнал и не влияет на ответ.
+
+        Аргументы:
+            - data (dict): Профиль запроса.
+
+        Возвращает:
+            - None
+    """
+    for sink in get_sinks():
+        try:
+            sink.emit(data)
+        except Exception:
+            logger.exception('Ошибка записи профиля в %s', type(sink).__name__)
+
+
+class LoggingSink:
+    """
+        Записывает профиль в журнал backend.profiling одной строкой JSON.
+    """
+    def emit(self, data: dict) -> None:
+        logger.info(json.dumps(data, default=str, ensure_ascii=False))
+
+
+class SilkSink:
+    """
+        Сохраняет полностью записанные запросы в модели django-silk, чтобы их можно было
+        смотреть в интерфейсе /silk/. Запросы, записанные только по времени, не сохраняются.
+    """
+    def emit(self, data: dict) -> None:
+        if data['sql'] is None:
+            return
+        from silk.models import Request, Response, SQLQuery
+
+        request = Request.objects.create(
+            path=data['path'], method=data['method'], query_params=json.dumps(data['query_params']),
+            view_name=data['view_name'] or '', start_time=data['started_at'], end_time=data['finished_at'],
+        )
+        Response.objects.create(request=request, status_code=data['status'])
+        # bulk_create менеджера silk сам обновляет Request.num_sql_queries.
+        SQLQuery.objects.bulk_create([
+            SQLQuery(query=query['sql'], time_taken=query['duration_ms'], request=request) for query in data['sql']
+        ])
+
+
+class ProfilingMiddleware:
+    """
+        Профилирование запросов с низкими накладными расходами (вместо SilkyMiddleware,
+        который записывал в БД каждый запрос и каждый SQL-запрос).
+
+        Для каждого запроса измеряются время ответа, количество и время SQL-запросов; они
+        возвращаются в заголовке Server-Timing. Текст SQL-запросов записывается и передается
+        в PROFILING_SINKS только для запросов, выбранных capture_reason. Запросы медленнее
+        PROFILING_SLOW_MS передаются в sinks без SQL, а следующий запрос к тому же пути
+        записывается полностью.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile(capture_reason(request))
+        token = _profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        data = self.finish(request, response, profile)
+        if data is not None:
+            emit(data)
+        return response
+
+    async def __acall__(self, request):
+        # Правило PROFILING_USERS может потребовать запрос к БД.
+        reason = await sync_to_async(capture_reason)(request) if settings.PROFILING_USERS else capture_reason(request)
+        profile = RequestProfile(reason)
+        token = _profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        data = self.finish(request, response, profile)
+        if data is not None:
+            await sync_to_async(emit)(data)
+        return response
+
+    def finish(self, request, response, profile: RequestProfile):
+        """
+            Добавляет заголовок Server-Timing и собирает данные профиля для sinks.
+
+            Аргументы:
+                - request (HttpRequest): Запрос.
+                - response (HttpResponse): Ответ.
+                - profile (RequestProfile): Профиль запроса.
+
+            Возвращает:
+                - Optional[dict]: Профиль для sinks или None, если запрос не нужно передавать в sinks.
+        """
+        duration = (time.perf_counter() - profile.started) * 1000
+        response['Server-Timing'] = (
+            f'app;dur={duration:.1f}, db;dur={profile.db_ms:.1f};desc="{profile.queries} queries"'
+        )
+        slow = duration >= settings.PROFILING_SLOW_MS
+        if slow and not profile.reason:
+            with _slow_paths_lock:
+                _slow_paths[request.path] = True
+                while len(_slow_paths) > SLOW_PATHS_LIMIT:
+                    _slow_paths.popitem(last=False)
+        if not (profile.reason or slow):
+            return None
+        match = request.resolver_match
+        return {
+            'path': request.path,
+            'method': request.method,
+            'query_params': dict(request.GET.items()),
+            'view_name': match.view_name if match else None,
+            'status': response.status_code,
+            'reason': profile.reason,
+            'started_at': profile.started_at,
+            'finished_at': timezone.now(),
+            'duration_ms': round(duration, 3),
+            'queries': profile.queries,
+            'db_ms': round(profile.db_ms, 3),
+            'sql': profile.sql if profile.reason else None,
+        }
@@ -0,0 +1,191 @@
+import fcntl
+import hashlib
+import os
+import stat
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class DiskLRUCache:
+    """
+        Кеш версий изображений на локальном диске с ограничением общего размера.
+
+        Файлы хранятся как <directory>/<key[:2]>/<key>. При каждом чтении время изменения файла
+        обновляется, поэтому при превышении max_size удаляются давно не запрашивавшиеся файлы
+        (LRU), пока размер кеша не опустится до 90% max_size. Кеш общий для всех процессов
+        на сервере: блокировка ключа (lock) выполняется через flock, поэтому одновременные
+        запросы одной версии из разных потоков и процессов создают ее один раз.
+
+        Атрибуты:
+            - directory (str): Каталог кеша.
+            - max_size (int): Максимальный общий размер файлов кеша в байтах.
+
+        Методы:
+            - get(key: str) -> Optional[BinaryIO]:
+                Открывает файл из кеша или возвращает None.
+
+            - put(key: str, content: bytes) -> BinaryIO:
+                Записывает файл в кеш и открывает его.
+
+            - lock(key: str) -> ContextManager[None]:
+                Блокирует ключ на время создания файла.
+
+            - path(key: str) -> str:
+                Возвращает путь к файлу версии.
+    """
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        self._size_lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        """
+            Аргументы:
+                - key (str): Ключ версии.
+
+            Возвращает:
+                - str: Путь к файлу версии в кеше.
+        """
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str):
+        """
+            Аргументы:
+                - key (str): Ключ версии.
+
+            Возвращает:
+                - Optional[BinaryIO]: Открытый файл версии или None, если ее нет в кеше.
+        """
+        path = self.path(key)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return file
+
+    def put(self, key: str, content: bytes):
+        """
+            Записывает файл атомарно (через временный файл и rename), чтобы параллельные
+            чтения не получили недописанный файл, и при необходимости вытесняет старые файлы.
+
+            Аргументы:
+                - key (str): Ключ версии.
+                - content (bytes): Содержимое версии.
+
+            Возвращает:
+                - BinaryIO: Открытый файл версии.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+        file = open(path, 'rb')
+        self._add(len(content))
+        return file
+
+    @contextmanager
+    def lock(self, key: str):
+        """
+            Аргументы:
+                - key (str): Ключ версии.
+
+            Возвращает:
+                - ContextManager[None]: Контекстный менеджер, удерживающий блокировку ключа.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.lock', 'wb') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entries(self) -> list:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(('.lock', '.tmp')):
+                    continue
+                try:
+                    info = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, os.path.join(root, name)))
+        return entries
+
+    def _add(self, size: int) -> None:
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._size = self._evict()
+
+    def _evict(self) -> int:
+        # Размер пересчитывается по диску: файлы в кеш пишут и другие процессы.
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            for stale in (path, f'{path}.lock'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        return total
+
+
+def rendition_key(path: str, size: tuple, image_format: str) -> str:
+    """
+        Формирует ключ версии. В ключ входят время изменения и размер исходного файла,
+        поэтому после замены файла создается новая версия.
+
+        Аргументы:
+            - path (str): Абсолютный путь к исходному изображению.
+            - size (tuple[int, int]): Максимальные ширина и высота версии.
+            - image_format (str): Формат версии.
+
+        Возвращает:
+            - str: Ключ версии.
+
+        Исключения:
+            - FileNotFoundError: Если исходного файла нет или путь указывает не на файл.
+    """
+    source_stat = os.stat(path)
+    if not stat.S_ISREG(source_stat.st_mode):
+        raise FileNotFoundError(path)
+    source = f'{path}:{source_stat.st_mtime_ns}:{source_stat.st_size}:{size[0]}x{size[1]}:{image_format}'
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_rendition_cache() -> DiskLRUCache:
+    """
+        Возвращает общий для процесса кеш версий, создавая его при первом вызове.
+
+        Возвращает:
+            - DiskLRUCache: Кеш с настройками RENDITION_CACHE_DIR и RENDITION_CACHE_MAX_SIZE.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None or (_cache.directory, _cache.max_size) != (
+                settings.RENDITION_CACHE_DIR, settings.RENDITION_CACHE_MAX_SIZE):
+            _cache = DiskLRUCache(settings.RENDITION_CACHE_DIR, settings.RENDITION_CACHE_MAX_SIZE)
+        return _cache
@@ -1,20 +1,255 @@
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from queue import LifoQueue, Empty
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
 smtp_user = os.getenv('SMTP_USER')
 smtp_password = os.getenv('SMTP_PASSWORD')
+smtp_host = os.getenv('SMTP_HOST', 'smtp.yandex.ru')
+smtp_port = int(os.getenv('SMTP_PORT', 587))
+smtp_use_tls = os.getenv('SMTP_USE_TLS', 'True') == 'True'
+smtp_pool_size = int(os.getenv('SMTP_POOL_SIZE', 4))
+smtp_timeout = int(os.getenv('SMTP_TIMEOUT', 30))
+smtp_idle_timeout = int(os.getenv('SMTP_IDLE_TIMEOUT', 60))
+
+
+def build_message(host_email: str, user_email: str, subj_tex: str, mail_text: str) -> MIMEMultipart:
+    """
+        Формирует письмо.
+
+        Аргументы:
+            - host_email (str): Email адрес отправителя.
+            - user_email (str): Email адрес получателя.
+            - subj_tex (str): Тема письма.
+            - mail_text (str): Текст письма.
+
+        Возвращает:
+            - MIMEMultipart: Готовое к отправке письмо.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = host_email
+    msg['To'] = user_email
+    msg['Subject'] = "Наш интернет магазин " + subj_tex
+    msg.attach(MIMEText(mail_text, 'plain'))
+    return msg
+
+
+class SMTPConnectionPool:
+    """
+        Пул авторизованных SMTP-соединений.
+
+        Соединение открывается (STARTTLS и вход) один раз и затем переиспользуется
+        для всех писем, отправляемых через пул. Соединение, простаивавшее дольше idle_timeout
+        секунд, перед использованием проверяется командой NOOP. Если сервер разорвал
+        соединение во время отправки, пул открывает новое и повторяет письмо один раз.
+
+        Атрибуты:
+            - host (str): Адрес SMTP-сервера.
+            - port (int): Порт SMTP-сервера.
+            - user (Optional[str]): Логин на SMTP-сервере. Если не задан, вход не выполняется.
+            - password (Optional[str]): Пароль на SMTP-сервере.
+            - use_tls (bool): Выполнять ли STARTTLS после подключения.
+            - size (int): Максимальное количество одновременно открытых соединений.
+            - timeout (int): Таймаут сетевых операций в секундах.
+            - idle_timeout (int): Время простоя, после которого соединение проверяется перед использованием.
+
+        Методы:
+            - connection() -> ContextManager[smtplib.SMTP]:
+                Выдает соединение из пула и возвращает его обратно после использования.
+
+            - send_many(messages: list[MIMEMultipart]) -> list[dict]:
+                Отправляет письма пачками по соединениям пула и возвращает результат по каждому письму.
+
+            - close() -> None:
+                Закрывает все свободные соединения пула.
+    """
+    def __init__(self, host=smtp_host, port=smtp_port, user=smtp_user, password=smtp_password,
+                 use_tls=smtp_use_tls, size=smtp_pool_size, timeout=smtp_timeout, idle_timeout=smtp_idle_timeout):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _is_alive(self, server: smtplib.SMTP, idle_since: float) -> bool:
+        if time.monotonic() - idle_since < self.idle_timeout:
+            return True
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, idle_since = self._idle.get_nowait()
+            except Empty:
+                return self._connect()
+            if self._is_alive(server, idle_since):
+                return server
+            self._quit(server)
+
+    @contextmanager
+    def connection(self):
+        """
+            Выдает авторизованное соединение. Если свободных соединений нет и их уже size,
+            ожидает освобождения одного из них. Соединение, на котором произошла сетевая ошибка,
+            закрывается и в пул не возвращается.
+
+            Возвращает:
+                - ContextManager[smtplib.SMTP]: Контекстный менеджер с соединением.
+        """
+        self._slots.acquire()
+        server = None
+        try:
+            server = self._acquire()
+            yield server
+        except OSError:
+            if server is not None:
+                server.close()
+                server = None
+            raise
+        finally:
+            if server is not None:
+                self._idle.put((server, time.monotonic()))
+            self._slots.release()
+
+    def _send_batch(self, messages: list[MIMEMultipart]) -> list[dict]:
+        results = []
+        reconnected = False
+        while len(results) < len(messages):
+            try:
+                with self.connection() as server:
+                    for message in messages[len(results):]:
+                        try:
+                            refused = server.send_message(message)
+                        except smtplib.SMTPServerDisconnected:
+                            raise
+                        except smtplib.SMTPException as e:
+                            results.append({'recipient': message['To'], 'sent': False, 'error': str(e)})
+                        else:
+                            results.append({
+                                'recipient': message['To'],
+                                'sent': not refused,
+                                'error': str(refused) if refused else None,
+                            })
+                        reconnected = False
+            except OSError as e:
+                if reconnected:
+                    results.extend(
+                        {'recipient': message['To'], 'sent': False, 'error': str(e)}
+                        for message in messages[len(results):]
+                    )
+                reconnected = True
+        return results
+
+    def send_many(self, messages: list[MIMEMultipart]) -> list[dict]:
+        """
+            Делит письма на пачки по количеству соединений пула и отправляет каждую пачку
+            в одной SMTP-сессии. Ошибка одного письма не прерывает отправку остальных.
+
+            Аргументы:
+                - messages (list[MIMEMultipart]): Письма для отправки.
+
+            Возвращает:
+                - list[dict]: Результаты в порядке писем: recipient (str), sent (bool) и error (Optional[str]).
+        """
+        if not messages:
+            return []
+        batch_count = min(self.size, len(messages))
+        batches = [messages[i::batch_count] for i in range(batch_count)]
+        with ThreadPoolExecutor(max_workers=batch_count) as executor:
+            batch_results = list(executor.map(self._send_batch, batches))
+        results = [None] * len(messages)
+        for i, batch in enumerate(batch_results):
+            results[i::batch_count] = batch
+        return results
+
+    def close(self) -> None:
+        """
+            Возвращает:
+                - None
+        """
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            self._quit(server)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SMTPConnectionPool:
+    """
+        Возвращает общий для процесса пул SMTP-соединений, создавая его при первом вызове.
+
+        Возвращает:
+            - SMTPConnectionPool: Пул соединений с настройками из переменных окружения.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPConnectionPool()
+        return _pool
+
+
+def send_mails(mails: list[tuple[str, str, str]], host_email: str = smtp_user) -> list[dict]:
+    """
+        Отправляет несколько писем через общий пул соединений.
+
+        Аргументы:
+            - mails (list[tuple[str, str, str]]): Письма в виде (email получателя, тема, текст).
+            - host_email (str): Email адрес отправителя.
+
+        Возвращает:
+            - list[dict]: Результаты в порядке писем: recipient (str), sent (bool) и error (Optional[str]).
+    """
+    messages = [build_message(host_email, user_email, subj_tex, mail_text) for user_email, subj_tex, mail_text in mails]
+    return get_pool().send_many(messages)
+
 
 def send_varif_mail(host_email: str, password: str, user_email: str, subj_tex: str, mail_text: str) -> None:
     """
-        Отправляет письмо на указанный email.
+        Отправляет письмо на указанный email через общий пул соединений.
 
         Аргументы:
             - host_email (str): Email адрес отправителя.
             - password (str): Пароль для SMTP-сервера отправителя.
+              Используется пулом из переменной окружения SMTP_PASSWORD, параметр оставлен для совместимости.
             - user_email (str): Email адрес получателя.
             - subj_tex (str): Тема письма.
             - mail_text (str): Текст письма.
@@ -23,21 +258,8 @@ def send_varif_mail(host_email: str, password: str, user_email: str, subj_tex: s
             - None
 
         Исключения:
-            - Exception: Если возникает ошибка при отправке письма.
-    """
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = host_email
-        msg['To'] = user_email
-        msg['Subject'] = "Наш интернет магазин " + subj_tex
-        msg.attach(MIMEText(mail_text, 'plain'))
-
-        server = smtplib.SMTP('smtp.yandex.ru', 587)
-        server.starttls()
-        server.login(host_email, password)
-        server.sendmail(host_email, user_email, msg.as_string())
-        server.quit()
-
-        print(f"Письмо успешно отправлено на адрес {user_email}!")
-    except Exception as e:
-        print(f"Ошибка при отправке письма: {str(e)}")
+            - smtplib.SMTPException: Если письмо не удалось отправить.
+    """
+    result = send_mails([(user_email, subj_tex, mail_text)], host_email=host_email)[0]
+    if not result['sent']:
+        raise smtplib.SMTPException(result['error'])
@@ -8,9 +8,9 @@ from rest_framework.authtoken.models import Token
 from .models import (ProductCategory, Product,
                      ProductInfo, Parameters,
                      Shop, ShopProduct, DynamicField,
-                     OrderProduct, Order, DeliveryContacts, UserProfile)
-from .validators import validate_password
-from .tasks import generate_product_thumbnail
+                     OrderProduct, Order, DeliveryContacts, UserProfile, ImageRendition)
+from .validators import validate_image_size, validate_password
+from .thumbnails import schedule_thumbnail, thumbnail_outdated
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -151,6 +151,20 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         fields = ['model', 'price', 'price_rrc', 'info_parameters']
 
 
+class ImageRenditionSerializer(serializers.ModelSerializer):
+    """
+        Сериализатор для модели ImageRendition (адаптивная версия изображения).
+
+        Атрибуты:
+            - Meta: Внутренний класс для настройки сериализатора.
+                - model (ImageRendition): Модель, с которой работает сериализатор.
+                - fields (list[str]): Список полей модели, которые будут сериализованы.
+    """
+    class Meta:
+        model = ImageRendition
+        fields = ['width', 'format', 'file']
+
+
 class ProductDetailSerializer(serializers.ModelSerializer):
     """
         Сериализатор для модели Product (детальное представление).
@@ -160,15 +174,17 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 
         Атрибуты:
             - product_info (ProductInfoSerializer): Вложенный сериализатор для информации о продукте.
+            - renditions (ImageRenditionSerializer): Адаптивные версии изображения продукта.
             - Meta: Внутренний класс для настройки сериализатора.
                 - model (Product): Модель, с которой работает сериализатор.
                 - fields (list[str]): Список полей модели, которые будут сериализованы.
     """
     product_info = ProductInfoSerializer(many=True, read_only=True)
+    renditions = ImageRenditionSerializer(many=True, read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'category', 'user', 'product_info', 'image', 'thumbnail']
+        fields = ['id', 'name', 'category', 'user', 'product_info', 'image', 'thumbnail', 'renditions']
 
     def to_representation(self, instance) -> dict:
         """
@@ -216,6 +232,9 @@ class ProductListSerializer(serializers.ModelSerializer):
         Returns:
             float or None: Значение поля 'price' или None, если product_info пуст.
         """
+        if hasattr(obj, 'price'):
+            # Цена уже получена подзапросом (views.annotate_price), отдельный запрос не нужен.
+            return obj.price
         product_info = obj.product_info.first()
         return product_info.price if product_info else None
 
@@ -288,7 +307,7 @@ class CreateProductCardSerializer(serializers.Serializer):
     model = serializers.CharField(max_length=100)
     price = serializers.IntegerField()
     price_rrc = serializers.IntegerField()
-    image = serializers.ImageField(required=False)
+    image = serializers.ImageField(required=False, validators=[validate_image_size])
     screen_size = serializers.FloatField(required=False)
     resolution = serializers.CharField(required=False)
     internal_memory = serializers.IntegerField(required=False)
@@ -311,8 +330,8 @@ class CreateProductCardSerializer(serializers.Serializer):
         product_name = validated_data['product_name']
         image = validated_data.pop('image', None)
         product, _ = Product.objects.get_or_create(user=user, name=product_name, category=category, image=image)
-        if image:
-            generate_product_thumbnail.delay(product.id)
+        if thumbnail_outdated(product, 'image', 'image_blob', 'thumbnail'):
+            schedule_thumbnail('product', product.id)
 
         # Создание продукта в магазине
         quantity = validated_data['quantity']
@@ -449,23 +468,85 @@ class OrderProductSerializer(serializers.ModelSerializer):
         Сериализатор для модели OrderProduct.
 
         Преобразует данные модели OrderProduct в формат JSON и обратно.
-        Включает вложенные сериализаторы для полей 'product' и 'shop_product'.
+        Название продукта, магазина и цена берутся из снимка, сохраненного в позиции заказа,
+        поэтому сериализация не требует обращений к каталогу.
 
         Атрибуты:
-            - product (ProductSerializer): Вложенный сериализатор для продукта.
-            - shop_product (ShopProductSerializer): Вложенный сериализатор для продукта магазина.
             - Meta: Внутренний класс для настройки сериализатора.
                 - model (OrderProduct): Модель, с которой работает сериализатор.
                 - fields (list[str]): Список полей модели, которые будут сериализованы.
                 - read_only_fields (list[str]): Список полей, доступных только для чтения.
     """
-    product = ProductSerializer()
-    shop_product = ShopProductSerializer()
-
     class Meta:
         model = OrderProduct
-        fields = ['id', 'product', 'shop_product', 'quantity']
-        read_only_fields = ['product_info']
+        fields = ['id', 'product', 'product_name', 'shop_name', 'unit_price', 'quantity']
+        read_only_fields = ['product_name', 'shop_name', 'unit_price']
+
+
+class AddProductSerializer(serializers.Serializer):
+    """
+        Сериализатор добавления продукта в заказ или корзину и удаления продукта из них.
+
+        Атрибуты:
+            - product_id (IntegerField): Идентификатор продукта.
+            - quantity (IntegerField): Добавляемое или удаляемое количество, не меньше 1.
+    """
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class OrderLineSerializer(serializers.Serializer):
+    """
+        Сериализатор одной позиции пакетного изменения заказа.
+
+        Атрибуты:
+            - product_id (IntegerField): Идентификатор продукта.
+            - quantity (IntegerField): Изменение количества. Положительное значение добавляет продукт,
+                                       отрицательное — убирает его из заказа. Отрицательное значение
+                                       не может увеличить склад: apply_lines отклоняет его, если в заказе
+                                       меньше товара, и снимает только резерв позиции.
+    """
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+
+    def validate_quantity(self, value) -> int:
+        """
+            Аргументы:
+                - value (int): Изменение количества.
+
+            Возвращает:
+                - int: Проверенное значение.
+
+            Исключения:
+                - ValidationError: Если изменение равно нулю.
+        """
+        if value == 0:
+            raise ValidationError("Количество не может быть равно нулю")
+        return value
+
+
+class OrderLinesSerializer(serializers.Serializer):
+    """
+        Сериализатор пакетного изменения заказа.
+
+        Атрибуты:
+            - lines (ListField): Список позиций (OrderLineSerializer), не более 500 за запрос.
+
+        Методы:
+            - get_lines() -> dict[int, int]:
+                Возвращает изменения количества по продуктам; повторяющиеся продукты суммируются.
+    """
+    lines = serializers.ListField(child=OrderLineSerializer(), allow_empty=False, max_length=500)
+
+    def get_lines(self) -> dict:
+        """
+            Возвращает:
+                - dict[int, int]: id продукта -> суммарное изменение количества.
+        """
+        lines = {}
+        for line in self.validated_data['lines']:
+            lines[line['product_id']] = lines.get(line['product_id'], 0) + line['quantity']
+        return {product_id: quantity for product_id, quantity in lines.items() if quantity}
 
 
 class DeliveryContactsSerializer(serializers.ModelSerializer):
@@ -509,6 +590,28 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'status_choice', 'total_price']
 
 
+class SupplierOrderSerializer(serializers.ModelSerializer):
+    """
+        Сериализатор заказа поставщика для входящих заказов (SupplierOrderViewSet).
+
+        Содержит только позиции магазина поставщика (supplier_lines) и контакты доставки.
+
+        Атрибуты:
+            - lines (OrderProductSerializer): Вложенный сериализатор для позиций заказа поставщика.
+            - delivery_contacts (DeliveryContactsSerializer): Вложенный сериализатор для контактных данных доставки.
+            - Meta: Внутренний класс для настройки сериализатора.
+                - model (Order): Модель, с которой работает сериализатор.
+                - fields (list[str]): Список полей модели, которые будут сериализованы.
+    """
+    lines = OrderProductSerializer(source='supplier_lines', many=True, read_only=True)
+    delivery_contacts = DeliveryContactsSerializer(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'parent', 'shop', 'status_choice', 'created_at', 'total_price',
+                  'lines', 'delivery_choice', 'delivery_contacts']
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     """
         Сериализатор для модели UserProfile.
@@ -1,16 +1,32 @@
+import hashlib
 import os
 from celery import shared_task
 import yaml
 import requests
-from django.core.files import File
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
 
 from django.contrib.auth.models import User
-from PIL import Image
 from io import BytesIO
+from PIL import Image
 
 
-from .models import Shop, ProductCategory, Product, ShopProduct, ProductInfo, Parameters, UserProfile
+from .models import (Shop, ProductCategory, Product, ShopProduct, ProductInfo, Parameters, UserProfile,
+                     StockReservation, OrderNotification, ImageBlob, ImageRendition)
+from .catalog_cache import bump_catalog_version
+from .image_storage import IMAGE_FIELDS, adopt_image, collect_image_garbage
+from .images import RENDITION_FORMATS, make_renditions, make_renditions_job, make_thumbnail
+from .notifications import queue_supplier_digests
+from .thumbnails import pop_pending_thumbnails
+from .send_email import send_mails
 from .translator import translat_text_en_ru, translat_text_ru_en, translator_key
 
 
@@ -165,12 +181,96 @@ def import_products_task(data, user):
         return e
 
 def generate_thumbnail(image_path, size=(300, 300)):
-    img = Image.open(image_path)
-    img.convert('RGB')  # Ensure compatibility
-    img.thumbnail(size)
-    thumb_io = BytesIO()
-    img.save(thumb_io, format='JPEG')
-    return thumb_io
+    return BytesIO(make_thumbnail(image_path, size))
+
+
+RENDITION_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def save_renditions(blob, renditions):
+    """
+    Сохраняет адаптивные версии изображения (ImageRendition), заменяя версии тех же размеров и форматов.
+
+    Имя файла версии содержит хеш исходного изображения и хеш содержимого версии, поэтому файлы
+    отдаются с неизменяемым Cache-Control (media.IMMUTABLE_CACHE_CONTROL): существующий файл
+    никогда не перезаписывается, а измененная версия получает новое имя. Миниатюры объектов,
+    ссылавшиеся на замененную версию, переводятся на новый файл, старый файл удаляется
+    после фиксации транзакции.
+
+    Аргументы:
+        - blob (ImageBlob): Изображение.
+        - renditions (dict[tuple[int, str], bytes]): Результат make_renditions.
+
+    Возвращает:
+        - list[ImageRendition]: Сохраненные версии.
+    """
+    with transaction.atomic():
+        replaced = {}
+        for rendition in blob.renditions.filter(width__in={width for width, _ in renditions}):
+            if (rendition.width, rendition.format) in renditions:
+                replaced[(rendition.width, rendition.format)] = rendition.file.name
+                rendition.delete()
+        created = []
+        for (width, image_format), content in renditions.items():
+            rendition = ImageRendition(content_object=blob, width=width, format=image_format)
+            digest = hashlib.sha256(content).hexdigest()[:8]
+            name = f"{blob.sha256}_{width}_{digest}.{RENDITION_EXTENSIONS[image_format]}"
+            path = rendition.file.field.generate_filename(rendition, name)
+            if rendition.file.storage.exists(path):
+                rendition.file.name = path
+            else:
+                rendition.file.save(name, ContentFile(content), save=False)
+            created.append(rendition)
+
+        stale = []
+        for rendition in created:
+            old_name = replaced.get((rendition.width, rendition.format))
+            if old_name and old_name != rendition.file.name:
+                for model, _, target, _ in THUMBNAIL_TARGETS.values():
+                    model.objects.filter(**{target: old_name}).update(**{target: rendition.file.name})
+                stale.append(old_name)
+        storage = ImageRendition._meta.get_field('file').storage
+        transaction.on_commit(lambda: [storage.delete(name) for name in stale])
+        # bulk_create не отправляет post_save, поэтому кеш каталога сбрасывается явно.
+        transaction.on_commit(bump_catalog_version)
+        return ImageRendition.objects.bulk_create(created)
+
+
+def generate_renditions(instance, thumbnail_field, thumbnail_width):
+    """
+    Создает недостающие адаптивные версии изображения объекта и указывает миниатюрой готовую
+    JPEG-версию нужного размера.
+
+    Сразу создаются только миниатюра и размеры из RENDITION_EAGER_WIDTHS; остальные размеры
+    создаются по запросу (views.rendition). Версии создаются для ImageBlob, а не для объекта,
+    поэтому изображение, загруженное для нескольких товаров, обрабатывается один раз
+    (make_renditions, одно декодирование); строка ImageBlob блокируется, чтобы параллельные задачи
+    не создавали версии одновременно. Изображение, еще не связанное с ImageBlob,
+    сначала регистрируется (adopt_image).
+
+    Аргументы:
+        - instance (Product | UserProfile): Объект с изображением.
+        - thumbnail_field (str): Имя поля миниатюры.
+        - thumbnail_width (int): Размер миниатюры.
+
+    Возвращает:
+        - None
+    """
+    _, blob_field = IMAGE_FIELDS[type(instance)]
+    blob = getattr(instance, blob_field) or adopt_image(instance)
+    widths = {*settings.RENDITION_EAGER_WIDTHS, thumbnail_width}
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().get(pk=blob.pk)
+        existing = {(rendition.width, rendition.format): rendition for rendition in blob.renditions.all()}
+        missing = tuple(sorted(
+            width for width in widths
+            if any((width, image_format) not in existing for image_format in RENDITION_FORMATS)
+        ))
+        if missing:
+            for rendition in save_renditions(blob, make_renditions(blob.file.path, widths=missing)):
+                existing[(rendition.width, rendition.format)] = rendition
+    getattr(instance, thumbnail_field).name = existing[(thumbnail_width, 'JPEG')].file.name
+    instance.save(update_fields=[thumbnail_field])
 
 
 @shared_task
@@ -179,9 +279,7 @@ def generate_product_thumbnail(product_id):
     if not product.image:
         return
 
-    thumb_io = generate_thumbnail(product.image.path)
-    thumb_name = os.path.basename(product.image.name)
-    product.thumbnail.save(f"thumb_{thumb_name}", File(thumb_io), save=True)
+    generate_renditions(product, 'thumbnail', 300)
 
 
 @shared_task
@@ -190,8 +288,357 @@ def generate_avatar_thumbnail(profile_id):
     if not profile.avatar:
         return
 
-    thumb_io = generate_thumbnail(profile.avatar.path, size=(150, 150))
-    thumb_name = os.path.basename(profile.avatar.name)
-    profile.avatar_thumbnail.save(f"thumb_{thumb_name}", File(thumb_io), save=True)
+    generate_renditions(profile, 'avatar_thumbnail', 150)
+
+
+@shared_task
+def release_expired_reservations(batch_size=500):
+    """
+    Периодическая задача Celery (CELERY_BEAT_SCHEDULE), которая освобождает истекшие резервы товаров.
+
+    Резервы обрабатываются пачками по batch_size в отдельных транзакциях. Строки выбираются
+    через SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько воркеров и одновременное оформление
+    заказа не освобождают один и тот же резерв дважды. Счетчик reserved каждого продукта магазина
+    уменьшается одним UPDATE на продукт магазина в каждой пачке.
+
+    Аргументы:
+        - batch_size (int): Количество резервов в одной пачке.
+
+    Возвращает:
+        - int: Количество освобожденных резервов.
+    """
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now())
+                .order_by('expires_at')
+                .values_list('id', 'shop_product_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return released
+            quantities = Counter()
+            for _, shop_product_id, quantity in batch:
+                quantities[shop_product_id] += quantity
+            for shop_product_id in sorted(quantities):
+                ShopProduct.objects.filter(pk=shop_product_id).update(
+                    reserved=F('reserved') - quantities[shop_product_id]
+                )
+            StockReservation.objects.filter(pk__in=[reservation_id for reservation_id, _, _ in batch]).delete()
+        released += len(batch)
+        if len(batch) < batch_size:
+            return released
+
+
+@shared_task
+def send_order_notifications(batch_size=100):
+    """
+    Задача Celery, которая отправляет письма из таблицы OrderNotification (transactional outbox).
+
+    Запускается после фиксации транзакции оформления заказа и периодически (CELERY_BEAT_SCHEDULE),
+    чтобы дослать письма, которые не удалось отправить. Пачка писем захватывается короткой
+    транзакцией: строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, и следующая попытка
+    откладывается на ORDER_NOTIFICATION_CLAIM_TIMEOUT секунд, поэтому другие воркеры не отправят
+    эти письма повторно, а письма воркера, который упал во время отправки, будут досланы позже.
+    Письма отправляются вне транзакции через пул SMTP-соединений (send_mails), так что медленный
+    SMTP-сервер не удерживает транзакцию и блокировки строк; результаты записываются второй
+    короткой транзакцией. После неудачной попытки следующая откладывается на
+    ORDER_NOTIFICATION_RETRY_DELAY * 2 ** attempts секунд; после ORDER_NOTIFICATION_MAX_ATTEMPTS
+    попыток письмо получает статус 'failed'.
+
+    Аргументы:
+        - batch_size (int): Количество писем в одной пачке.
+
+    Возвращает:
+        - int: Количество отправленных писем.
+    """
+    sent = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OrderNotification.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:batch_size]
+            )
+            if not batch:
+                return sent
+            OrderNotification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                next_attempt_at=now + timedelta(seconds=settings.ORDER_NOTIFICATION_CLAIM_TIMEOUT)
+            )
+
+        results = send_mails([(n.recipient, n.subject, n.text) for n in batch])
+
+        for notification, result in zip(batch, results):
+            if result['sent']:
+                notification.status = 'sent'
+                notification.sent_at = timezone.now()
+                sent += 1
+                continue
+            notification.attempts += 1
+            notification.last_error = result['error']
+            if notification.attempts >= settings.ORDER_NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = 'failed'
+            else:
+                notification.next_attempt_at = timezone.now() + timedelta(
+                    seconds=settings.ORDER_NOTIFICATION_RETRY_DELAY * 2 ** (notification.attempts - 1)
+                )
+        OrderNotification.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+        if len(batch) < batch_size:
+            return sent
+
+
+@shared_task
+def send_supplier_digests():
+    """
+    Периодическая задача Celery (CELERY_BEAT_SCHEDULE), которая раз в SUPPLIER_DIGEST_INTERVAL минут
+    отправляет каждому поставщику одно письмо-сводку по заказам, оформленным с прошлой сводки.
+
+    Возвращает:
+        - int: Количество поставленных в очередь сводок.
+    """
+    return len(queue_supplier_digests())
+
+
+@shared_task
+def collect_image_garbage_task(batch_size=500):
+    """
+    Периодическая задача Celery (CELERY_BEAT_SCHEDULE), которая удаляет изображения (ImageBlob),
+    на которые больше не ссылается ни один товар или профиль, вместе с их адаптивными версиями.
+
+    Аргументы:
+        - batch_size (int): Количество изображений, удаляемых в одной транзакции.
+
+    Возвращает:
+        - int: Количество удаленных изображений.
+    """
+    deleted = 0
+    while True:
+        batch = collect_image_garbage(settings.IMAGE_GC_GRACE_PERIOD, batch_size)
+        deleted += batch
+        if batch < batch_size:
+            return deleted
+
+
+# Модель, поле исходного изображения, поле миниатюры и размер миниатюры для каждого вида изображений.
+THUMBNAIL_TARGETS = {
+    'product': (Product, 'image', 'thumbnail', (300, 300)),
+    'avatar': (UserProfile, 'avatar', 'avatar_thumbnail', (150, 150)),
+}
+
+
+@shared_task
+def generate_thumbnail_batch(kind):
+    """
+    Задача Celery, которая создает миниатюры для всех объектов, накопленных schedule_thumbnail
+    за окно THUMBNAIL_BATCH_WINDOW, за один вызов: объекты читаются одним запросом,
+    а ошибка одного изображения не прерывает обработку остальных.
+
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+
+    Возвращает:
+        - int: Количество созданных миниатюр.
+    """
+    model, source, target, size = THUMBNAIL_TARGETS[kind]
+    ids = pop_pending_thumbnails(kind)
+    blob_field = IMAGE_FIELDS[model][1]
+    done = 0
+    for instance in model.objects.filter(pk__in=ids).select_related(blob_field).order_by('pk'):
+        if not getattr(instance, source):
+            continue
+        try:
+            generate_renditions(instance, target, size[0])
+        except (OSError, ValueError, Image.DecompressionBombError):
+            continue
+        done += 1
+    return done
+
+
+def thumbnail_checkpoint_key(kind, runner='command'):
+    """
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+        - runner (str): Способ запуска: 'command' (regenerate_thumbnails) или 'task'
+          (regenerate_thumbnails_task). У каждого своя контрольная точка.
+
+    Возвращает:
+        - str: Ключ контрольной точки.
+    """
+    return f'thumbnails:checkpoint:{runner}:{kind}'
+
+
+def advance_thumbnail_checkpoint(kind, chunk=None, end_id=None, client=None):
+    """
+    Продвигает контрольную точку regenerate_thumbnails_task после завершения пачки.
+
+    Пачки обрабатываются параллельно и завершаются в любом порядке, поэтому завершенные пачки
+    хранятся в хеше Redis (id перед пачкой -> последний id пачки), а контрольная точка
+    сдвигается только по непрерывной цепочке завершенных пачек. Пачка, задача которой упала,
+    остается после контрольной точки и обрабатывается снова при продолжении. Когда контрольная
+    точка доходит до последнего id запуска (end_id), состояние запуска удаляется.
+
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+        - chunk (Optional[tuple[int, int]]): Завершенная пачка (id перед пачкой, последний id пачки).
+        - end_id (Optional[int]): Последний id запуска (передается после постановки всех пачек в очередь).
+        - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+    Возвращает:
+        - None
+    """
+    client = client or get_redis_connection('default')
+    checkpoint_key = thumbnail_checkpoint_key(kind, 'task')
+    done_key, end_key = f'{checkpoint_key}:done', f'{checkpoint_key}:end'
+
+    def advance(pipe):
+        checkpoint = int(pipe.get(checkpoint_key) or 0)
+        done = {int(after_id): int(last_id) for after_id, last_id in pipe.hgetall(done_key).items()}
+        end = end_id if end_id is not None else pipe.get(end_key)
+        if chunk is not None:
+            done[chunk[0]] = chunk[1]
+        while checkpoint in done:
+            checkpoint = done.pop(checkpoint)
+        pipe.multi()
+        if end is not None and checkpoint >= int(end):
+            pipe.delete(checkpoint_key, done_key, end_key)
+            return
+        pipe.set(checkpoint_key, checkpoint)
+        pipe.delete(done_key)
+        if done:
+            pipe.hset(done_key, mapping=done)
+        if end_id is not None:
+            pipe.set(end_key, end_id)
+
+    client.transaction(advance, checkpoint_key, done_key, end_key)
+
+
+def thumbnail_chunks(kind, chunk_size=500, after_id=0):
+    """
+    Перебирает идентификаторы объектов с изображениями пачками в порядке id (keyset-пагинация
+    по первичному ключу, без OFFSET).
 
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+        - chunk_size (int): Количество объектов в пачке.
+        - after_id (int): Идентификатор, после которого начинается обход (контрольная точка).
 
+    Возвращает:
+        - Iterator[list[int]]: Пачки идентификаторов.
+    """
+    model, source, _, _ = THUMBNAIL_TARGETS[kind]
+    queryset = model.objects.exclude(**{f'{source}__isnull': True}).exclude(**{source: ''}).order_by('pk')
+    while True:
+        ids = list(queryset.filter(pk__gt=after_id).values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        after_id = ids[-1]
+
+
+def regenerate_thumbnail_chunk(kind, ids, map_func=map):
+    """
+    Пересоздает миниатюры для пачки объектов и записывает поля миниатюр одним bulk_update.
+
+    Миниатюра - это JPEG-версия нужного размера (ImageRendition), поэтому версии пересоздаются
+    make_renditions и сохраняются save_renditions: измененное содержимое получает новое имя файла,
+    а файлы с неизменяемым Cache-Control не перезаписываются.
+
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+        - ids (list[int]): Идентификаторы объектов пачки.
+        - map_func (Callable): Функция вида map, которой выполняется уменьшение изображений,
+            например ProcessPoolExecutor.map. По умолчанию изображения обрабатываются в текущем процессе.
+
+    Возвращает:
+        - tuple[int, int]: Количество пересозданных миниатюр и количество ошибок.
+    """
+    model, _, target, size = THUMBNAIL_TARGETS[kind]
+    blob_field = IMAGE_FIELDS[model][1]
+    instances = list(model.objects.filter(pk__in=ids).select_related(blob_field).order_by('pk'))
+    blobs, pending, failed = {}, [], 0
+    for instance in instances:
+        try:
+            blob = getattr(instance, blob_field) or adopt_image(instance)
+        except OSError:
+            failed += 1
+            continue
+        blobs[blob.pk] = blob
+        pending.append((instance, blob.pk))
+
+    # Объекты с одинаковым изображением (ImageBlob) ссылаются на одни версии, поэтому изображение уменьшается один раз.
+    jobs = [(blob.file.path, (size[0],)) for blob in blobs.values()]
+    thumbnails = {}
+    for blob_id, (renditions, error) in zip(blobs, map_func(make_renditions_job, jobs)):
+        if renditions is None:
+            continue
+        with transaction.atomic():
+            blob = ImageBlob.objects.select_for_update().get(pk=blob_id)
+            saved = save_renditions(blob, renditions)
+        thumbnails[blob_id] = next(rendition.file.name for rendition in saved if rendition.format == 'JPEG')
+
+    done = []
+    for instance, blob_id in pending:
+        if blob_id not in thumbnails:
+            failed += 1
+            continue
+        getattr(instance, target).name = thumbnails[blob_id]
+        done.append(instance)
+    model.objects.bulk_update(done, [target])
+    return len(done), failed
+
+
+@shared_task
+def regenerate_thumbnail_chunk_task(kind, ids, after_id=None):
+    """
+    Задача Celery, которая пересоздает миниатюры одной пачки объектов.
+
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS.
+        - ids (list[int]): Идентификаторы пачки.
+        - after_id (Optional[int]): Id перед пачкой для контрольной точки regenerate_thumbnails_task.
+          Контрольная точка продвигается только после успешной обработки пачки.
+
+    Возвращает:
+        - int: Количество пересозданных миниатюр.
+    """
+    done = regenerate_thumbnail_chunk(kind, ids)[0]
+    if after_id is not None:
+        advance_thumbnail_checkpoint(kind, chunk=(after_id, ids[-1]))
+    return done
+
+
+@shared_task
+def regenerate_thumbnails_task(kind, chunk_size=500, resume=True):
+    """
+    Задача Celery для массового пересоздания миниатюр (например, после изменения размера).
+
+    Обходит объекты пачками в порядке id и ставит каждую пачку в очередь отдельной задачей
+    regenerate_thumbnail_chunk_task, чтобы пачки обрабатывались параллельно всеми воркерами.
+    Контрольная точка (свой ключ, не общий с командой regenerate_thumbnails) продвигается
+    задачами пачек по мере их успешного завершения (advance_thumbnail_checkpoint),
+    поэтому при продолжении повторяются все пачки, которые не были обработаны.
+
+    Аргументы:
+        - kind (str): Вид изображений из THUMBNAIL_TARGETS ('product' или 'avatar').
+        - chunk_size (int): Количество объектов в пачке.
+        - resume (bool): Продолжить с контрольной точки. Если False, обход начинается сначала.
+
+    Возвращает:
+        - int: Количество поставленных в очередь пачек.
+    """
+    client = get_redis_connection('default')
+    checkpoint_key = thumbnail_checkpoint_key(kind, 'task')
+    after_id = int(client.get(checkpoint_key) or 0) if resume else 0
+    client.delete(f'{checkpoint_key}:done', f'{checkpoint_key}:end')
+    client.set(checkpoint_key, after_id)
+    chunks = 0
+    for ids in thumbnail_chunks(kind, chunk_size, after_id):
+        regenerate_thumbnail_chunk_task.delay(kind, ids, after_id)
+        after_id = ids[-1]
+        chunks += 1
+    advance_thumbnail_checkpoint(kind, end_id=after_id, client=client)
+    return chunks
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+PENDING_KEY = 'thumbnails:pending:{kind}'
+FLUSH_KEY = 'thumbnails:flush:{kind}'
+
+
+def thumbnail_outdated(instance, source_field: str, blob_field: str, thumbnail_field: str,
+                       old_blob_id=None) -> bool:
+    """
+        Проверяет, нужно ли пересоздать миниатюру после сохранения объекта.
+
+        Содержимое изображения определяется по ImageBlob (SHA-256 файла), поэтому если
+        изображение не изменилось (или загружен тот же файл повторно), миниатюра не пересоздается.
+        Изображение, еще не связанное с ImageBlob, считается измененным.
+
+        Аргументы:
+            - instance (Product | UserProfile): Сохраненный объект.
+            - source_field (str): Имя поля изображения.
+            - blob_field (str): Имя поля ссылки на ImageBlob.
+            - thumbnail_field (str): Имя поля миниатюры.
+            - old_blob_id (Optional[int]): Идентификатор ImageBlob до сохранения.
+
+        Возвращает:
+            - bool: True, если миниатюру нужно создать.
+    """
+    if not getattr(instance, source_field):
+        return False
+    blob_id = getattr(instance, f'{blob_field}_id')
+    return blob_id is None or blob_id != old_blob_id or not getattr(instance, thumbnail_field)
+
+
+def schedule_thumbnail(kind: str, object_id: int, client=None) -> None:
+    """
+        Ставит объект в очередь на создание миниатюры после фиксации транзакции.
+
+        Идентификаторы накапливаются в множестве Redis thumbnails:pending:<kind>. Первый вызов
+        ставит задачу generate_thumbnail_batch с задержкой THUMBNAIL_BATCH_WINDOW секунд,
+        а остальные вызовы в этом окне только добавляют идентификатор в множество, поэтому
+        все объекты, измененные за окно, обрабатываются одним вызовом задачи.
+
+        Аргументы:
+            - kind (str): Вид изображений ('product' или 'avatar').
+            - object_id (int): Идентификатор объекта.
+            - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+        Возвращает:
+            - None
+    """
+    from .tasks import generate_thumbnail_batch
+
+    def enqueue():
+        redis = client or get_redis_connection('default')
+        redis.sadd(PENDING_KEY.format(kind=kind), object_id)
+        # Флаг живет дольше окна: если задача не запустилась, следующий вызов поставит ее снова.
+        if redis.set(FLUSH_KEY.format(kind=kind), 1, nx=True, ex=int(settings.THUMBNAIL_BATCH_WINDOW * 10) + 60):
+            generate_thumbnail_batch.apply_async((kind,), countdown=settings.THUMBNAIL_BATCH_WINDOW)
+
+    transaction.on_commit(enqueue)
+
+
+def pop_pending_thumbnails(kind: str, client=None) -> list[int]:
+    """
+        Забирает все накопленные идентификаторы. Флаг задачи снимается до чтения множества,
+        поэтому объект, добавленный во время обработки, поставит новую задачу.
+
+        Аргументы:
+            - kind (str): Вид изображений ('product' или 'avatar').
+            - client (Redis): Клиент Redis. По умолчанию соединение кеша 'default'.
+
+        Возвращает:
+            - list[int]: Идентификаторы объектов.
+    """
+    redis = client or get_redis_connection('default')
+    redis.delete(FLUSH_KEY.format(kind=kind))
+    pipe = redis.pipeline()
+    pipe.smembers(PENDING_KEY.format(kind=kind))
+    pipe.delete(PENDING_KEY.format(kind=kind))
+    members, _ = pipe.execute()
+    return sorted(int(member) for member in members)
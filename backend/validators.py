@@ -1,5 +1,8 @@
 import re
 from django.core.exceptions import ValidationError
+from PIL import Image
+
+from .images import ImageTooLarge, RENDITION_WIDTHS, check_image
 
 
 def validate_password(password):
@@ -16,4 +19,17 @@ def validate_password(password):
     if not re.search("[0-9]", password):
         raise ValidationError("Пароль должен содержать хотя бы одну цифру.")
 
-    return True
\ No newline at end of file
+    return True
+
+
+def validate_image_size(image):
+    image.seek(0)
+    try:
+        with Image.open(image) as img:
+            check_image(img, max(RENDITION_WIDTHS))
+    except ImageTooLarge as e:
+        raise ValidationError(str(e))
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError("Загрузите корректное изображение.")
+    finally:
+        image.seek(0)
@@ -1,13 +1,16 @@
+import os
 import uuid
 import requests
 import yaml
 
 from typing import Any, Type
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from django.core.exceptions import ValidationError
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.storage import default_storage
 from django.db import transaction
 from django import forms
 from django.shortcuts import render, redirect, get_object_or_404
@@ -16,16 +19,21 @@ from django.utils.decorators import method_decorator
 from django.contrib.auth.models import User
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.views import LogoutView
-from django.db.models import OuterRef, Subquery
+from django.core.paginator import Paginator
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from PIL import Image
 
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 from rest_framework.views import APIView
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.pagination import CursorPagination
 
 from .models import (
     Product,
@@ -36,6 +44,7 @@ from .models import (
     ProductInfo,
     Order,
     OrderProduct,
+    OrderVersionConflict,
     VerificationToken,
     UserProfile,
 )
@@ -50,15 +59,40 @@ from .serializers import (
     UserSerializer,
     ParametersSerializer,
     OrderSerializer,
+    AddProductSerializer,
+    OrderLinesSerializer,
+    SupplierOrderSerializer,
     DeliveryContacts,
     UserProfileSerializer,
 )
+from .cart import RedisCart
+from .db_connections import database_status
+from .idempotency import IdempotentViewMixin
+from .images import make_rendition
+from .media import media_access, media_cache_control, sendfile_response
+from .notifications import queue_order_notifications
+from .rendition_cache import get_rendition_cache, rendition_key
 from .translator import translat_text_en_ru, translat_text_ru_en, translator_key
 from .send_email import smtp_user, smtp_password, send_varif_mail
-from .tasks import import_products_task, generate_product_thumbnail, generate_avatar_thumbnail
+from .tasks import import_products_task
+from .thumbnails import schedule_thumbnail, thumbnail_outdated
 
 
 # Create your views here.
+def annotate_price(queryset):
+    """
+    Аргументы:
+        - queryset (QuerySet[Product]): Набор товаров.
+
+    Возвращает:
+        - QuerySet[Product]: Набор товаров с полем 'price' - цена первой (по id) информации о товаре.
+    """
+    price_subquery = ProductInfo.objects.filter(product=OuterRef("pk")).order_by("pk").values(
+        "price"
+    )[:1]
+    return queryset.annotate(price=Subquery(price_subquery))
+
+
 class ShopViewSet(ModelViewSet):
     """
     ViewSet для управления объектами модели Shop.
@@ -208,37 +242,35 @@ class ProductsViewSet(ModelViewSet):
         Аргументы:
             - serializer (Serializer): Экземпляр сериализатора для валидации и сохранения данных.
         Выполняет:
-            - generate_product_thumbnail.delay(product.id): Задача Celery для генерации миниатюры товара.
+            - schedule_thumbnail('product', product.id): Постановка товара в очередь на создание миниатюры.
         Возвращает:
             - None
         """
-        serializer.save(user=self.request.user)
-        if product.image:
-            generate_product_thumbnail.delay(product.id)
+        product = serializer.save(user=self.request.user)
+        if thumbnail_outdated(product, 'image', 'image_blob', 'thumbnail'):
+            schedule_thumbnail('product', product.id)
 
     def perform_update(self, serializer):
         """
         Аргументы:
             - serializer (Serializer): Экземпляр сериализатора для валидации и сохранения данных.
         Выполняет:
-            - generate_product_thumbnail.delay(product.id): Задача Celery для генерации миниатюры товара.
+            - schedule_thumbnail('product', product.id): Постановка товара в очередь на создание миниатюры,
+              если содержимое изображения изменилось.
         Возвращает:
             - None
         """
+        old_blob_id = serializer.instance.image_blob_id
         product = serializer.save()
-        if product.image:
-            generate_product_thumbnail.delay(product.id)
+        if thumbnail_outdated(product, 'image', 'image_blob', 'thumbnail', old_blob_id):
+            schedule_thumbnail('product', product.id)
 
     def get_queryset(self) -> queryset:
         """
         Returns:
             queryset: QuerySet объектов Product с аннотированным полем 'price'.
         """
-        price_subquery = ProductInfo.objects.filter(product=OuterRef("pk")).values(
-            "price"
-        )[:1]
-
-        queryset = Product.objects.annotate(price=Subquery(price_subquery))
+        queryset = annotate_price(Product.objects.all())
 
         ordering = self.request.query_params.get("ordering")
         if ordering in ["price", "-price"]:
@@ -515,13 +547,15 @@ class CustomUserCreationForm(UserCreationForm):
         return user
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(IdempotentViewMixin, ModelViewSet):
     """
     ViewSet для управления заказами (Order).
 
     Позволяет выполнять CRUD-операции с заказами, а также добавлять товары,
     удалять товары и завершать заказы. Доступ к операциям предоставляется только
     аутентифицированным пользователям (IsAuthenticated) и владельцам заказов (IsOwner).
+    Изменяющие запросы поддерживают заголовок Idempotency-Key (IdempotentViewMixin):
+    повтор запроса с тем же ключом возвращает сохраненный ответ и не списывает товар повторно.
 
     Атрибуты:
         - serializer_class (type[OrderSerializer]): Сериализатор для преобразования данных модели Order.
@@ -532,8 +566,8 @@ class OrderViewSet(ModelViewSet):
         - get_queryset() -> QuerySet[Order]:
             Возвращает набор заказов в зависимости от роли пользователя:
             - Для суперпользователя: все заказы.
-            - Для поставщика: заказы, связанные с товарами, которые они создали.
-            - Для обычных пользователей: только их собственные заказы.
+            - Для остальных пользователей: только их собственные заказы. Заказы поставщика
+              по их магазинам доступны только для чтения через SupplierOrderViewSet.
 
         - create(request: Request, *args: Any, **kwargs: Any) -> Response:
             Создает новый заказ или возвращает существующий заказ пользователя.
@@ -541,14 +575,20 @@ class OrderViewSet(ModelViewSet):
         - add_product(request: Request) -> Response:
             Добавляет товар в заказ пользователя. Если заказа еще не создан, создает его.
             Подсчитывает общую стоимость заказа.
-            Убавляет количество товара на складе на велечину, указанную в заказе.
+            Резервирует товар на складе на велечину, указанную в заказе, на STOCK_RESERVATION_TTL
+            в одной транзакции; поле 'success' ответа сообщает, удалось ли зарезервировать товар.
 
         - delete_product(request: Request) -> Response:
             Удаляет или уменьшает количество товара в заказе пользователя.
-            Возвращает товар на склад при удалении из заказа.
+            Снимает резерв товара при удалении из заказа.
+
+        - update_products(request: Request) -> Response:
+            Пакетно добавляет и удаляет товары в заказе пользователя одной транзакцией.
 
         - place_an_order(request: Request) -> Response:
-            Завершает заказ, обновляет статус и отправляет письмо подтверждения.
+            Завершает заказ, списывает зарезервированные товары со склада, обновляет статус
+            и отправляет письмо подтверждения. Если у пользователя есть корзина в Redis (CartViewSet),
+            ее позиции переносятся в заказ в той же транзакции, что и оформление.
     """
 
     serializer_class = OrderSerializer
@@ -561,10 +601,7 @@ class OrderViewSet(ModelViewSet):
         """
         if self.request.user.is_superuser:
             return Order.objects.all()
-        elif self.request.user.is_staff:
-            return Order.objects.filter(orderitem__product__user=self.request.user)
-        else:
-            return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user, parent__isnull=True)
 
     def create(self, request, *args, **kwargs):
         """
@@ -580,8 +617,6 @@ class OrderViewSet(ModelViewSet):
             order = Order.objects.get(user=self.request.user)
         except Order.DoesNotExist or order.ORDER_STATUS_CHOICES == "done":
             order = Order.objects.create(user=self.request.user)
-            order.update_total_price()
-            order.update_status()
             return Response(
                 {
                     "status": f"Заказ успешно создан. Статус: {order.status_choice}. "
@@ -605,16 +640,16 @@ class OrderViewSet(ModelViewSet):
         Возвращает:
             - Response: Ответ сервера с результатом операции.
         """
+        serializer = AddProductSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         try:
             order = Order.objects.get(
                 user=self.request.user.id, status_choice__in=["empty", "new"]
             )
         except Order.DoesNotExist:
             order = Order.objects.create(user=self.request.user)
-            order.update_total_price()
-            order.update_status()
         if order.status_choice == "new" or order.status_choice == "empty":
-            product_id = request.data.get("product_id")
+            product_id = serializer.validated_data["product_id"]
             try:
                 product = Product.objects.get(id=product_id)
                 if not product.is_available:
@@ -626,41 +661,31 @@ class OrderViewSet(ModelViewSet):
                 return Response(
                     {"status": "Товар не найден"}, status=status.HTTP_400_BAD_REQUEST
                 )
-            shop_product = ShopProduct.objects.get(product=product)
-            order_quantity = request.data.get("quantity")
+            shop_product = ShopProduct.objects.select_related("shop", "product").get(product=product)
+            order_quantity = serializer.validated_data["quantity"]
 
-            existing_order_product = OrderProduct.objects.filter(
-                product=product, order=order
-            ).first()
-            if existing_order_product:
-                try:
-                    existing_order_product.quantity += order_quantity
-                    existing_order_product.update_product_quantity("out_of_stock")
-                    existing_order_product.save()
-                except ValueError as e:
-                    return Response(
-                        {"status": f"{e}"}, status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                order_product = OrderProduct.objects.create(
-                    product=product,
-                    shop_product=shop_product,
-                    order=order,
-                    quantity=order_quantity,
+            def add_line():
+                order.add_line(shop_product, order_quantity)
+                order.update_totals()
+
+            try:
+                order.edit(add_line)
+            except OrderVersionConflict as e:
+                return Response(
+                    {"status": f"{e}", "success": False},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            except ValueError as e:
+                return Response(
+                    {"status": f"{e}", "success": False},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-                try:
-                    order_product.update_product_quantity("out_of_stock")
-                except ValueError as e:
-                    return Response(
-                        {"status": f"{e}"}, status=status.HTTP_400_BAD_REQUEST
-                    )
 
-            order.update_total_price()
-            order.update_status()
             return Response(
                 {
                     "status": f"Товар {product.name} успешно добавлен в заказ. Статус: {order.status_choice}. "
-                    f"Общая сумма заказа {order.total_price} рублей"
+                    f"Общая сумма заказа {order.total_price} рублей",
+                    "success": True,
                 }
             )
         else:
@@ -671,6 +696,45 @@ class OrderViewSet(ModelViewSet):
                 }
             )
 
+    @action(methods=["post"], detail=False)
+    def update_products(self, request):
+        """
+        Аргументы:
+            - request (Request): Объект запроса со списком позиций
+              lines: [{"product_id": int, "quantity": int}, ...].
+              Положительное количество добавляет товар в заказ, отрицательное — убирает.
+
+        Возвращает:
+            - Response: Ответ сервера с результатом операции.
+        """
+        serializer = OrderLinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.get_lines()
+
+        order = (
+            Order.objects.filter(user=self.request.user, status_choice__in=["empty", "new"]).first()
+            or Order.objects.create(user=self.request.user)
+        )
+        try:
+            order.apply_lines(lines)
+        except OrderVersionConflict as e:
+            return Response(
+                {"status": f"{e}", "success": False},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except ValueError as e:
+            return Response(
+                {"status": f"{e}", "success": False},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {
+                "status": f"Заказ обновлен. Статус: {order.status_choice}. "
+                f"Общая сумма заказа {order.total_price} рублей",
+                "success": True,
+            }
+        )
+
     @action(methods=["post"], detail=False)
     def delete_product(self, request):
         """
@@ -680,21 +744,27 @@ class OrderViewSet(ModelViewSet):
         Возвращает:
             - Response: Ответ сервера с результатом операции.
         """
+        serializer = AddProductSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         try:
             order = Order.objects.get(user=self.request.user.id, status_choice="new")
-            product_id = request.data.get("product_id")
+            product_id = serializer.validated_data["product_id"]
             product = Product.objects.get(id=product_id)
             order_product = OrderProduct.objects.filter(
                 product=product, order=order
             ).first()
             if not order_product:
                 return Response({"status": "Продукт не найден в заказе"})
-            order_quantity = request.data.get("quantity")
+            order_quantity = serializer.validated_data["quantity"]
             if order_product.quantity > order_quantity:
-                order_product.quantity -= order_quantity
-                order_product.save()
-                order_product.update_product_quantity("in_stock")
-                order.update_total_price()
+                def decrease_line():
+                    OrderProduct.objects.filter(pk=order_product.pk).update(
+                        quantity=F("quantity") - order_quantity
+                    )
+                    order_product.release(order_quantity)
+                    order.update_total_price()
+
+                order.edit(decrease_line)
                 return Response(
                     {
                         "status": f"Заказ обновлен. Статус: {order.status_choice}. "
@@ -702,10 +772,12 @@ class OrderViewSet(ModelViewSet):
                     }
                 )
             elif order_product.quantity == order_quantity:
-                order_product.delete()
-                order_product.update_product_quantity("in_stock")
-                order.update_total_price()
-                order.update_status()
+                def remove_line():
+                    order_product.release(order_quantity)
+                    OrderProduct.objects.filter(pk=order_product.pk).delete()
+                    order.update_totals()
+
+                order.edit(remove_line)
                 return Response(
                     {
                         "status": f"Продукт {product.name} удален из заказа. Статус: {order.status_choice}. "
@@ -722,6 +794,12 @@ class OrderViewSet(ModelViewSet):
             return Response(
                 {"status": "Заказ не найден"}, status=status.HTTP_404_NOT_FOUND
             )
+        except Product.DoesNotExist:
+            return Response(
+                {"status": "Товар не найден"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except OrderVersionConflict as e:
+            return Response({"status": f"{e}"}, status=status.HTTP_409_CONFLICT)
 
     @action(methods=["post"], detail=False)
     def place_an_order(self, request):
@@ -731,173 +809,287 @@ class OrderViewSet(ModelViewSet):
 
         Возвращает:
             - Response: Ответ сервера с результатом операции.
+
+        Письма поставщику и покупателю не отправляются в запросе: они записываются
+        в таблицу OrderNotification в той же транзакции, что и смена статуса заказа,
+        и отправляются задачей send_order_notifications.
         """
         delivery_choice = request.data.get("delivery_choice")
-        try:
-            order = Order.objects.get(user=self.request.user.id, status_choice="new")
-            order_product = OrderProduct.objects.filter(order=order)
-            if not delivery_choice:
-                order.status_choice = "done"
-                order.save()
-
-                try:
-                    staff_user_id = (
-                        OrderProduct.objects.filter(order=order)
-                        .first()
-                        .shop_product.product.user.id
-                    )
-                    staff_user_email = User.objects.get(id=staff_user_id).email
-                    print(staff_user_email)
-                    email_text = (
-                        f"Поступил новый заказ.\n"
-                        f"'Продукты: {' '.join([item.product.name for item in order_product])}\n"
-                        f"Общая сумма заказа {order.total_price} рублей.\n"
-                        f"Способ получения - самовывоз "
-                    )
-                    print(email_text)
-                    subj_text = "Новый заказ"
-                    send_varif_mail(
-                        host_email=smtp_user,
-                        password=smtp_password,
-                        user_email=staff_user_email,
-                        subj_tex=subj_text,
-                        mail_text=email_text,
-                    )
-                except Exception as e:
-                    print(f"Ошибка при отправке письма: {str(e)}")
-                    messages.error(request, f"Ошибка при отправке письма: {str(e)}")
-
-                try:
-                    email_text = (
-                        f"Поступил новый заказ.\n"
-                        f"'Продукты: {' '.join([item.product.name for item in order_product])}\n"
-                        f"Общая сумма заказа {order.total_price} рублей.\n"
-                        f"Способ получения - самовывоз "
-                    )
-                    print(email_text)
-                    subj_text = "Подтверждение заказа"
-                    send_varif_mail(
-                        host_email=smtp_user,
-                        password=smtp_password,
-                        user_email=order.user.email,
-                        subj_tex=subj_text,
-                        mail_text=email_text,
-                    )
-                except Exception as e:
-                    print(f"Ошибка при отправке письма: {str(e)}")
-                    messages.error(request, f"Ошибка при отправке письма: {str(e)}")
-
+        if delivery_choice:
+            required_fields = [
+                "city",
+                "street",
+                "house_number",
+                "apartment_number",
+                "phone_number",
+            ]
+            missing_fields = [
+                field for field in required_fields if not request.data.get(field)
+            ]
+
+            if missing_fields:
                 return Response(
                     {
-                        "status": f"Заказ успешно завершен. Статус: {order.status_choice}. "
-                        f"Общая сумма заказа {order.total_price} рублей"
-                    }
+                        "status": f'Отсутствуют обязательные поля: {", ".join(missing_fields)}'
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            elif delivery_choice:
-                required_fields = [
-                    "city",
-                    "street",
-                    "house_number",
-                    "apartment_number",
-                    "phone_number",
-                ]
-                missing_fields = [
-                    field for field in required_fields if not request.data.get(field)
-                ]
-
-                if missing_fields:
-                    return Response(
-                        {
-                            "status": f'Отсутствуют обязательные поля: {", ".join(missing_fields)}'
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
+
+        try:
+            with transaction.atomic():
+                RedisCart(request.user.id).materialize()
+                order = Order.objects.get(user=self.request.user.id, status_choice="new")
+                if delivery_choice:
+                    order.delivery_choice = True
+                    order.delivery_contacts = DeliveryContacts.objects.create(
+                        city=request.data.get("city"),
+                        street=request.data.get("street"),
+                        house_number=request.data.get("house_number"),
+                        apartment_number=request.data.get("apartment_number"),
+                        phone_number=request.data.get("phone_number"),
                     )
+                order.place()
+                queue_order_notifications(order)
+        except Order.DoesNotExist:
+            return Response(
+                {"status": "Заказ не найден"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except OrderVersionConflict as e:
+            return Response({"status": f"{e}"}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"status": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-                order.delivery_choice = True
-                city = request.data.get("city")
-                street = request.data.get("street")
-                house_number = request.data.get("house_number")
-                apartment_number = request.data.get("apartment_number")
-                phone_number = request.data.get("phone_number")
-                delivery_contacts = DeliveryContacts.objects.create(
-                    city=city,
-                    street=street,
-                    house_number=house_number,
-                    apartment_number=apartment_number,
-                    phone_number=phone_number,
-                )
-                order.delivery_contacts = delivery_contacts
-                order.status_choice = "done"
-                order.save()
+        if not delivery_choice:
+            return Response(
+                {
+                    "status": f"Заказ успешно завершен. Статус: {order.status_choice}. "
+                    f"Общая сумма заказа {order.total_price} рублей"
+                }
+            )
+        return Response(
+            {
+                "status": f"Заказ успешно завершен. Статус: {order.status_choice}. "
+                f"Общая сумма заказа {order.total_price} рублей. Доставка указана"
+                f"по адресу: город {order.delivery_contacts.city}, "
+                f"улица {order.delivery_contacts.street}, "
+                f"дом {order.delivery_contacts.house_number}"
+                f"квартира {order.delivery_contacts.apartment_number}"
+            }
+        )
 
-                try:
-                    staff_user_id = (
-                        OrderProduct.objects.filter(order=order)
-                        .first()
-                        .shop_product.product.user.id
-                    )
-                    staff_user_email = User.objects.get(id=staff_user_id).email
-                    print(staff_user_email)
-                    email_text = (
-                        f"Поступил новый заказ.\n"
-                        f"'Продукты: {' '.join([item.product.name for item in order_product])}\n"
-                        f"Общая сумма заказа {order.total_price} рублей.\n"
-                        f"Доставка указана по адресу: город {order.delivery_contacts.city}, "
-                        f"улица {order.delivery_contacts.street}, "
-                        f"дом {order.delivery_contacts.house_number}, "
-                        f"квартира {order.delivery_contacts.apartment_number}."
-                    )
-                    print(email_text)
-                    subj_text = "Новый заказ"
-                    send_varif_mail(
-                        host_email=smtp_user,
-                        password=smtp_password,
-                        user_email=staff_user_email,
-                        subj_tex=subj_text,
-                        mail_text=email_text,
-                    )
-                except Exception as e:
-                    print(f"Ошибка при отправке письма: {str(e)}")
-                    messages.error(request, f"Ошибка при отправке письма: {str(e)}")
 
-                try:
-                    email_text = (
-                        f"Поступил новый заказ. \n"
-                        f"'Продукты: {' '.join([item.product.name for item in order_product])}\n"
-                        f"Общая сумма заказа {order.total_price} рублей.\n"
-                        f"Доставка указана по адресу: город {order.delivery_contacts.city}, "
-                        f"улица {order.delivery_contacts.street}, "
-                        f"дом {order.delivery_contacts.house_number}, "
-                        f"квартира {order.delivery_contacts.apartment_number}."
-                    )
-                    print(email_text)
-                    subj_text = "Подтверждение заказа"
-                    send_varif_mail(
-                        host_email=smtp_user,
-                        password=smtp_password,
-                        user_email=order.user.email,
-                        subj_tex=subj_text,
-                        mail_text=email_text,
-                    )
-                except Exception as e:
-                    print(f"Ошибка при отправке письма: {str(e)}")
-                    messages.error(request, f"Ошибка при отправке письма: {str(e)}")
+class SupplierOrderPagination(CursorPagination):
+    """
+    Курсорная пагинация входящих заказов поставщика.
 
-                return Response(
-                    {
-                        "status": f"Заказ успешно завершен. Статус: {order.status_choice}. "
-                        f"Общая сумма заказа {order.total_price} рублей. Доставка указана"
-                        f"по адресу: город {order.delivery_contacts.city}, "
-                        f"улица {order.delivery_contacts.street}, "
-                        f"дом {order.delivery_contacts.house_number}"
-                        f"квартира {order.delivery_contacts.apartment_number}"
-                    }
-                )
-        except Order.DoesNotExist:
+    Позиция страницы задается значением created_at, поэтому запрос следующей страницы
+    читает индекс (shop, -created_at) с нужного места и не зависит от глубины истории,
+    в отличие от OFFSET.
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "-created_at"
+
+
+class SupplierOrderViewSet(ReadOnlyModelViewSet):
+    """
+    ViewSet входящих заказов поставщика.
+
+    Возвращает заказы поставщика (Order.split_by_supplier) по магазинам текущего пользователя
+    с его позициями и контактами доставки. Позиции всей страницы загружаются одним запросом
+    (prefetch_related), список фильтруется по статусу и способу получения и листается курсором.
+
+    Атрибуты:
+        - serializer_class (type[SupplierOrderSerializer]): Сериализатор заказа поставщика.
+        - permission_classes (list[type[BasePermission]]): Список классов разрешений.
+          В данном случае используется IsAuthenticated.
+        - pagination_class (type[SupplierOrderPagination]): Курсорная пагинация по created_at.
+        - filterset_fields (list[str]): Поля для фильтрации: status_choice, delivery_choice, shop.
+    """
+
+    serializer_class = SupplierOrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SupplierOrderPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["status_choice", "delivery_choice", "shop"]
+
+    def get_queryset(self):
+        """
+        Возвращает:
+            - QuerySet[Order]: Заказы поставщика по магазинам текущего пользователя.
+        """
+        return (
+            Order.objects.filter(shop__in=Shop.objects.filter(user=self.request.user).values("id"))
+            .select_related("delivery_contacts")
+            .prefetch_related("supplier_lines")
+        )
+
+
+class CartViewSet(IdempotentViewMixin, ViewSet):
+    """
+    ViewSet для корзины пользователя, которая хранится в Redis (RedisCart).
+
+    Добавление и удаление товаров не обращается к заказам в базе данных:
+    читается только карточка товара, а позиции и снимок цен пишутся в Redis.
+    Заказ и его позиции создаются при оформлении через OrderViewSet.place_an_order.
+    Изменяющие запросы поддерживают заголовок Idempotency-Key (IdempotentViewMixin).
+
+    Атрибуты:
+        - permission_classes (list[type[BasePermission]]): Список классов разрешений.
+          В данном случае используется IsAuthenticated.
+
+    Методы:
+        - list(request: Request) -> Response:
+            Возвращает позиции корзины и ее общую стоимость.
+
+        - add_product(request: Request) -> Response:
+            Добавляет товар в корзину.
+
+        - update_products(request: Request) -> Response:
+            Пакетно добавляет и удаляет товары в корзине; если хотя бы одну позицию применить
+            нельзя, корзина не изменяется.
+
+        - delete_product(request: Request) -> Response:
+            Удаляет или уменьшает количество товара в корзине.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def _cart_response(self, cart, message, status_code=status.HTTP_200_OK):
+        """
+        Аргументы:
+            - cart (RedisCart): Корзина пользователя.
+            - message (str): Сообщение о результате операции.
+            - status_code (int): HTTP-статус ответа.
+
+        Возвращает:
+            - Response: Ответ с сообщением, позициями и общей стоимостью корзины.
+        """
+        lines = cart.lines()
+        return Response(
+            {"status": message, "lines": lines, "total_price": cart.total_price(lines)},
+            status=status_code,
+        )
+
+    def list(self, request):
+        """
+        Аргументы:
+            - request (Request): Объект запроса.
+
+        Возвращает:
+            - Response: Позиции корзины и ее общая стоимость.
+        """
+        return self._cart_response(RedisCart(request.user.id), "Корзина")
+
+    @action(methods=["post"], detail=False)
+    def add_product(self, request):
+        """
+        Аргументы:
+            - request (Request): Объект запроса, содержащий ID товара и его количество.
+
+        Возвращает:
+            - Response: Ответ сервера с результатом операции.
+        """
+        serializer = AddProductSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantity = serializer.validated_data["quantity"]
+        shop_product = (
+            ShopProduct.objects.select_related("shop", "product")
+            .filter(product_id=serializer.validated_data["product_id"])
+            .first()
+        )
+        if shop_product is None:
             return Response(
-                {"status": "Заказ не найден"}, status=status.HTTP_404_NOT_FOUND
+                {"status": "Товар не найден"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not shop_product.product.is_available:
+            return Response(
+                {"status": "Товар недоступен для продажи"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if shop_product.available < quantity:
+            return Response(
+                {"status": "Недостаточно товара на складе"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        cart = RedisCart(request.user.id)
+        cart.add(shop_product, quantity)
+        return self._cart_response(
+            cart, f"Товар {shop_product.product.name} успешно добавлен в корзину"
+        )
+
+    @action(methods=["post"], detail=False)
+    def update_products(self, request):
+        """
+        Аргументы:
+            - request (Request): Объект запроса со списком позиций
+              lines: [{"product_id": int, "quantity": int}, ...].
+              Положительное количество добавляет товар в корзину, отрицательное — убирает.
+
+        Возвращает:
+            - Response: Ответ сервера с позициями и общей стоимостью корзины.
+        """
+        serializer = OrderLinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.get_lines()
+
+        added = [product_id for product_id, quantity in lines.items() if quantity > 0]
+        price = ProductInfo.objects.filter(product=OuterRef("product")).values("price")[:1]
+        shop_products = {}
+        for shop_product in (
+            ShopProduct.objects.select_related("shop", "product")
+            .annotate(price=Subquery(price))
+            .filter(product_id__in=added)
+            .order_by("id")
+        ):
+            shop_products.setdefault(shop_product.product_id, shop_product)
+
+        errors = []
+        for product_id in added:
+            shop_product = shop_products.get(product_id)
+            if shop_product is None:
+                errors.append(f"Товар {product_id} не найден")
+            elif not shop_product.product.is_available:
+                errors.append(f"Товар {shop_product.product.name} недоступен для продажи")
+            elif shop_product.available < lines[product_id]:
+                errors.append(f"Недостаточно товара {shop_product.product.name} на складе")
+
+        cart = RedisCart(request.user.id)
+        if not errors:
+            try:
+                cart.apply_lines(lines, shop_products)
+            except ValueError as e:
+                errors.append(f"{e}")
+        if errors:
+            return self._cart_response(cart, "; ".join(errors), status.HTTP_400_BAD_REQUEST)
+        return self._cart_response(cart, "Корзина обновлена")
+
+    @action(methods=["post"], detail=False)
+    def delete_product(self, request):
+        """
+        Аргументы:
+            - request (Request): Объект запроса, содержащий ID товара и его количество.
+
+        Возвращает:
+            - Response: Ответ сервера с результатом операции.
+        """
+        serializer = AddProductSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = RedisCart(request.user.id)
+        try:
+            cart.remove(serializer.validated_data["product_id"], serializer.validated_data["quantity"])
+        except KeyError:
+            return Response(
+                {"status": "Продукт не найден в корзине"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except ValueError as e:
+            return Response({"status": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return self._cart_response(cart, "Корзина обновлена")
+
 
 def index(request):
     """
@@ -1057,12 +1249,12 @@ class UserProfileViewSet(ModelViewSet):
 
     Методы:
         - perform_create(serializer: UserProfileSerializer) -> None:
-            Сохраняет новый объект UserProfile и запускает задачу Celery
-            для генерации миниатюры аватара, если аватар был загружен.
+            Сохраняет новый объект UserProfile и ставит его в очередь на создание
+            миниатюры аватара, если аватар был загружен.
 
         - perform_update(serializer: UserProfileSerializer) -> None:
-            Обновляет существующий объект UserProfile и запускает задачу Celery
-            для генерации миниатюры аватара, если аватар был загружен или изменён.
+            Обновляет существующий объект UserProfile и ставит его в очередь на создание
+            миниатюры аватара, если содержимое аватара изменилось.
     """
     permission_classes = [IsAuthenticated]
     queryset = UserProfile.objects.all()
@@ -1078,8 +1270,8 @@ class UserProfileViewSet(ModelViewSet):
             - None
         """
         profile = serializer.save()
-        if profile.avatar:
-            generate_avatar_thumbnail.delay(profile.id)
+        if thumbnail_outdated(profile, 'avatar', 'avatar_blob', 'avatar_thumbnail'):
+            schedule_thumbnail('avatar', profile.id)
 
     def perform_update(self, serializer) -> None:
         """
@@ -1090,9 +1282,10 @@ class UserProfileViewSet(ModelViewSet):
         Возвращает:
             - None
         """
+        old_blob_id = serializer.instance.avatar_blob_id
         profile = serializer.save()
-        if profile.avatar:
-            generate_avatar_thumbnail.delay(profile.id)
+        if thumbnail_outdated(profile, 'avatar', 'avatar_blob', 'avatar_thumbnail', old_blob_id):
+            schedule_thumbnail('avatar', profile.id)
 
 
 def shop_categories(request, shop_id):
@@ -1173,8 +1366,11 @@ def profile(request):
     """
     Отображает профиль пользователя с историей его заказов.
 
-    Функция извлекает все заказы текущего пользователя, сортируя их
-    по дате создания в обратном порядке (от новых к старым).
+    Функция извлекает заказы текущего пользователя постранично (параметр page),
+    сортируя их по дате создания в обратном порядке (от новых к старым) по индексу
+    (user, -created_at). Позиции заказов страницы загружаются
+    одним дополнительным запросом и отображаются по сохраненным в них названиям и ценам,
+    поэтому число запросов не зависит ни от числа заказов, ни от числа позиций.
     Полученные данные передаются в контекст шаблона для отображения
     на странице профиля.
 
@@ -1185,10 +1381,18 @@ def profile(request):
     Возвращает:
     - HttpResponse: Отрендеренный HTML-шаблон с контекстом данных.
     """
-    orders = Order.objects.filter(user=request.user).order_by("-created_at")
+    orders = (
+        Order.objects.filter(user=request.user, parent__isnull=True)
+        .prefetch_related(
+            Prefetch("order_products", queryset=OrderProduct.objects.order_by("id"))
+        )
+        .order_by("-created_at")
+    )
+    page = Paginator(orders, 10).get_page(request.GET.get("page"))
 
     context = {
-        "orders": orders,
+        "orders": page.object_list,
+        "page": page,
     }
     return render(request, "backend/profile.html", context)
 
@@ -1222,3 +1426,112 @@ def edit_profile(request):
 class CustomLogoutView(LogoutView):
     next_page = reverse_lazy("index")
     http_method_names = ["get", "post"]
+
+
+RENDITION_CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+def protected_media(request, path):
+    """
+    Отдает файл из MEDIA_ROOT после проверки доступа (media_access).
+
+    Django только проверяет доступ и формирует заголовки; при MEDIA_SENDFILE_BACKEND = 'nginx'
+    или 'x-sendfile' сам файл передает фронтенд-прокси (X-Accel-Redirect на
+    MEDIA_ACCEL_REDIRECT_PREFIX или X-Sendfile), и воркер Python не занят передачей данных.
+
+    Аргументы:
+        - request (HttpRequest): Объект запроса.
+        - path (str): Путь к файлу относительно MEDIA_ROOT.
+
+    Возвращает:
+        - HttpResponse: Файл или ответ с заголовком для прокси.
+
+    Исключения:
+        - Http404: Если файла нет или у пользователя нет к нему доступа.
+    """
+    try:
+        source = default_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    access = media_access(request.user, path)
+    if access is None or not os.path.isfile(source):
+        raise Http404("Файл не найден")
+    response = sendfile_response(source, settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+    media_cache_control(response, access, path)
+    return response
+
+
+def rendition(request, width, height, path):
+    """
+    Отдает версию изображения из MEDIA_ROOT, вписанную в width x height, создавая ее при первом запросе.
+
+    Доступ проверяется так же, как в protected_media. Готовые версии хранятся в локальном
+    дисковом кеше (DiskLRUCache) и отдаются из него без декодирования (через прокси, если задан
+    MEDIA_SENDFILE_BACKEND). Одновременные запросы одной еще не созданной версии ожидают друг друга
+    на блокировке ключа, поэтому изображение уменьшается один раз. Клиентам, которые принимают
+    WebP (заголовок Accept), отдается WebP, остальным — JPEG.
+
+    Аргументы:
+        - request (HttpRequest): Объект запроса.
+        - width (int): Максимальная ширина версии, размер должен входить в RENDITION_SIZES.
+        - height (int): Максимальная высота версии.
+        - path (str): Путь к исходному изображению относительно MEDIA_ROOT.
+
+    Возвращает:
+        - HttpResponse: Файл версии или ответ с заголовком для прокси.
+
+    Исключения:
+        - Http404: Если размер не разрешен, исходного файла нет, у пользователя нет к нему доступа
+          или он не является допустимым изображением.
+    """
+    if (width, height) not in settings.RENDITION_SIZES:
+        raise Http404("Размер версии не поддерживается")
+    image_format = 'WEBP' if 'image/webp' in request.headers.get('Accept', '') else 'JPEG'
+    try:
+        source = default_storage.path(path)
+        key = rendition_key(source, (width, height), image_format)
+    except (SuspiciousFileOperation, FileNotFoundError):
+        raise Http404("Изображение не найдено")
+    access = media_access(request.user, path)
+    if access is None:
+        raise Http404("Изображение не найдено")
+
+    cache = get_rendition_cache()
+    file = cache.get(key)
+    if file is None:
+        with cache.lock(key):
+            file = cache.get(key)
+            if file is None:
+                try:
+                    content = make_rendition(source, (width, height), image_format)
+                except (OSError, ValueError, Image.DecompressionBombError):
+                    raise Http404("Изображение не найдено")
+                file = cache.put(key, content)
+
+    response = sendfile_response(
+        cache.path(key),
+        settings.RENDITION_CACHE_ACCEL_REDIRECT_PREFIX + os.path.relpath(cache.path(key), cache.directory),
+        content_type=RENDITION_CONTENT_TYPES[image_format],
+        file=file,
+    )
+    media_cache_control(response, access, path)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class DatabaseStatusView(APIView):
+    """
+    View для проверки соединения с БД и просмотра статистики пула соединений.
+
+    Доступна только персоналу. Статистика относится к процессу, обработавшему запрос.
+
+    Методы:
+        - get(request: Request) -> Response:
+            Возвращает результат database_status(); статус 503, если БД недоступна.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request) -> Response:
+        data = database_status()
+        return Response(data, status=status.HTTP_200_OK if data["healthy"] else status.HTTP_503_SERVICE_UNAVAILABLE)
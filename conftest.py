@@ -1,8 +1,51 @@
 import os
 import django
+import pytest
 from django.conf import settings
 
 def pytest_configure():
     if not settings.configured:
         os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop_API_service.settings')
+        # Реплика для тестов маршрутизации (backend.db_router): зеркало основной тестовой БД.
+        settings.DATABASES.setdefault('replica', {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}})
         django.setup()
+
+
+@pytest.fixture
+def make_shop_product(db):
+    """
+        Фабрика продукта магазина: магазин, категория, продукт с ценой и остатком на складе.
+    """
+    from backend.models import Shop, ProductCategory, Product, ProductInfo, ShopProduct
+
+    def make(supplier, name="Product", price=100, quantity=50, shop_name="Test Shop"):
+        shop, _ = Shop.objects.get_or_create(name=shop_name, user=supplier)
+        category, _ = ProductCategory.objects.get_or_create(name="Test Category", user=supplier, shop=shop)
+        product = Product.objects.create(name=name, category=category, user=supplier)
+        ProductInfo.objects.create(model=name, price=price, price_rrc=price, product=product, user=supplier)
+        return ShopProduct.objects.create(shop=shop, product=product, quantity=quantity, user=supplier)
+    return make
+
+
+@pytest.fixture
+def add_product():
+    """
+        Добавляет продукт в заказ пользователя запросом POST /order/add_product/.
+    """
+    from rest_framework.test import APIClient
+
+    def add(user, product_id, quantity):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.post("/order/add_product/", {"product_id": product_id, "quantity": quantity}, format="json")
+    return add
+
+
+@pytest.fixture
+def executed_queries():
+    """
+        Запросы из CaptureQueriesContext без служебных запросов EXPLAIN.
+    """
+    def queries(context):
+        return [query for query in context.captured_queries if not query["sql"].startswith("EXPLAIN")]
+    return queries
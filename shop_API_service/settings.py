@@ -58,11 +58,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.db_router.PrimaryStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'silk.middleware.SilkyMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.profiling.ProfilingMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -101,8 +102,60 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
         'PORT': os.getenv('POSTGRES_PORT'),
+        # Соединение переиспользуется между запросами DB_CONN_MAX_AGE секунд (0 - новое соединение
+        # на каждый запрос) и проверяется перед повторным использованием.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
+# Пул соединений psycopg (psycopg_pool) вместо постоянных соединений; CONN_MAX_AGE с пулом не используется,
+# а CONN_HEALTH_CHECKS включает проверку соединения перед выдачей из пула.
+if os.getenv('DB_POOL', '').lower() in ('1', 'true', 'yes'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        # Сколько секунд запрос ждет свободное соединение, прежде чем получить ошибку
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # Соединения сверх min_size закрываются после простоя, любое соединение - после max_lifetime
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+    }
+
+# Реплики для чтения: POSTGRES_REPLICAS="host1:5432,host2:5432" (остальные параметры как у основной БД).
+# Маршрутизацию выполняет backend.db_router.PrimaryReplicaRouter.
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['backend.db_router.PrimaryReplicaRouter']
+# Реплика с задержкой больше REPLICA_MAX_LAG секунд не используется; задержка проверяется
+# не чаще раза в REPLICA_LAG_CHECK_INTERVAL секунд
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 5))
+# Сколько секунд после изменения данных клиент читает из основной БД
+PRIMARY_STICKY_SECONDS = int(os.getenv('PRIMARY_STICKY_SECONDS', 10))
+
+# Профилирование запросов (backend.profiling): время и количество SQL-запросов считаются всегда
+# (заголовок Server-Timing), SQL записывается только для выбранных запросов - доли PROFILING_SAMPLE_RATE,
+# путей с префиксами PROFILING_PATHS, пользователей PROFILING_USERS (id или username), запросов
+# с заголовком X-Profile: PROFILING_HEADER_TOKEN и запросов к пути после ответа дольше PROFILING_SLOW_MS
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_PATHS = [path for path in os.getenv('PROFILING_PATHS', '').split(',') if path]
+PROFILING_USERS = [user for user in os.getenv('PROFILING_USERS', '').split(',') if user]
+PROFILING_HEADER_TOKEN = os.getenv('PROFILING_HEADER_TOKEN')
+PROFILING_SLOW_MS = float(os.getenv('PROFILING_SLOW_MS', 1000))
+# Куда передаются профили: backend.profiling.LoggingSink (журнал backend.profiling),
+# backend.profiling.SilkSink (интерфейс /silk/) или свой класс с методом emit(data)
+PROFILING_SINKS = [sink for sink in os.getenv('PROFILING_SINKS', 'backend.profiling.LoggingSink').split(',') if sink]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,6 +198,11 @@ STATIC_FILES_DIRS = [
 # Media settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Отдача медиафайлов после проверки доступа: '' - файл отдает Django, 'nginx' - X-Accel-Redirect,
+# 'x-sendfile' - X-Sendfile (Apache, lighttpd). Префиксы - internal-location nginx для MEDIA_ROOT и кеша версий.
+MEDIA_SENDFILE_BACKEND = os.getenv("MEDIA_SENDFILE_BACKEND", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+RENDITION_CACHE_ACCEL_REDIRECT_PREFIX = os.getenv("RENDITION_CACHE_ACCEL_REDIRECT_PREFIX", "/protected-renditions/")
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -178,6 +236,60 @@ CELERY_BROKER_URL = "redis://localhost:6379"
 CELERY_RESULT_BACKEND = "redis://localhost:6379"
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'backend.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'send-order-notifications': {
+        'task': 'backend.tasks.send_order_notifications',
+        'schedule': 30.0,
+    },
+    'collect-image-garbage': {
+        'task': 'backend.tasks.collect_image_garbage_task',
+        'schedule': 60 * 60.0,
+    },
+}
+
+# Cart settings
+CART_TTL = int(os.getenv("CART_TTL", 60 * 60 * 24 * 7))
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 30 * 60))
+# Количество повторов изменения заказа при конфликте версий (Order.version)
+ORDER_VERSION_RETRIES = int(os.getenv("ORDER_VERSION_RETRIES", 5))
+ORDER_VERSION_RETRY_DELAY = float(os.getenv("ORDER_VERSION_RETRY_DELAY", 0.01))
+
+# Версии изображений, создаваемые по запросу (/media/r/<ширина>x<высота>/<путь>)
+RENDITION_SIZES = [tuple(int(side) for side in size.split('x')) for size in os.getenv(
+    "RENDITION_SIZES", "1200x1200,600x600,300x300,150x150").split(',')]
+RENDITION_CACHE_DIR = os.getenv("RENDITION_CACHE_DIR", os.path.join(BASE_DIR, 'rendition_cache'))
+RENDITION_CACHE_MAX_SIZE = int(os.getenv("RENDITION_CACHE_MAX_SIZE", 1024 * 1024 * 1024))
+# Размеры версий, которые создаются сразу после загрузки (кроме размера миниатюры, он создается всегда)
+RENDITION_EAGER_WIDTHS = [int(width) for width in os.getenv("RENDITION_EAGER_WIDTHS", "").split(',') if width]
+# Окно в секундах, за которое изменения изображений собираются в одну задачу создания миниатюр
+THUMBNAIL_BATCH_WINDOW = float(os.getenv("THUMBNAIL_BATCH_WINDOW", 2))
+# Изображения без ссылок удаляются не раньше, чем через столько секунд после загрузки
+IMAGE_GC_GRACE_PERIOD = int(os.getenv("IMAGE_GC_GRACE_PERIOD", 60 * 60 * 24))
+
+# Время жизни закешированных ответов асинхронных эндпоинтов каталога в секундах
+# (при изменении каталога кеш сбрасывается сразу, TTL только ограничивает хранение старых версий)
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 60))
+
+# Idempotency-Key settings
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 60))
+
+# Order notification settings
+ORDER_NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("ORDER_NOTIFICATION_MAX_ATTEMPTS", 5))
+ORDER_NOTIFICATION_RETRY_DELAY = int(os.getenv("ORDER_NOTIFICATION_RETRY_DELAY", 60))
+# Время в секундах, на которое воркер захватывает пачку писем для отправки
+ORDER_NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv("ORDER_NOTIFICATION_CLAIM_TIMEOUT", 300))
+# Интервал сводок заказов для поставщиков в минутах; 0 (по умолчанию) - письмо поставщику на каждый заказ
+SUPPLIER_DIGEST_INTERVAL = int(os.getenv("SUPPLIER_DIGEST_INTERVAL", 0))
+if SUPPLIER_DIGEST_INTERVAL:
+    CELERY_BEAT_SCHEDULE['send-supplier-digests'] = {
+        'task': 'backend.tasks.send_supplier_digests',
+        'schedule': SUPPLIER_DIGEST_INTERVAL * 60.0,
+    }
 
 # Goole auth settings
 AUTHENTICATION_BACKENDS = (
@@ -196,10 +308,9 @@ sentry_sdk.init(
    dsn=os.getenv("SENTRY_DSN"),
    integrations=[DjangoIntegration()],
 
-   # Set traces_sample_rate to 1.0 to capture 100%
-   # of transactions for performance monitoring.
-   # We recommend adjusting this value in production,
-   traces_sample_rate=1.0,
+   # Доля транзакций, отправляемых для мониторинга производительности
+   # (1.0 - каждый запрос; слишком дорого для продакшена).
+   traces_sample_rate=float(os.getenv('SENTRY_TRACES_SAMPLE_RATE', 0.01)),
 
    # If you wish to associate users to errors (assuming you are using
    # django.contrib.auth) you may enable sending PII data.
@@ -290,3 +401,6 @@ CACHES = {
         }
     }
 }
+# Cachalot сбрасывает кеш запросов только той БД, в которую идет запись, поэтому запросы к репликам
+# не кешируются: иначе после записи в основную БД чтение из реплики отдавало бы устаревший результат.
+CACHALOT_DATABASES = ['default']
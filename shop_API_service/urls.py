@@ -26,10 +26,11 @@ def trigger_error(request):
 from backend.views import (ShopViewSet, ShopProductViewSet,
                            ProductCategoryViewSet, ProductsViewSet,
                            CreateProductCardViewSet, ImportProductsView,
-                           UserViewSet, ParamsViewSet, OrderViewSet,
+                           UserViewSet, ParamsViewSet, OrderViewSet, CartViewSet, SupplierOrderViewSet,
                            index, register, shop_categories, category_products,
                            product_detail, user_login, verify_email, profile, edit_profile,
-                           CustomLogoutView)
+                           rendition, protected_media, CustomLogoutView, DatabaseStatusView)
+from backend import async_views
 
 
 router = DefaultRouter()
@@ -41,6 +42,8 @@ router.register('create', CreateProductCardViewSet, basename='create')
 router.register('account/registration', UserViewSet, basename='registration')
 router.register('params', ParamsViewSet)
 router.register('order', OrderViewSet, basename='order')
+router.register('cart', CartViewSet, basename='cart')
+router.register('supplier/orders', SupplierOrderViewSet, basename='supplier/orders')
 
 
 urlpatterns = [
@@ -58,9 +61,17 @@ urlpatterns = [
     path('product_detail/<int:product_id>/', product_detail, name='product_detail'),
     path('verify/<str:token>/', verify_email, name='verify_email'),
     path('profile/', profile, name='profile'),
+    path('media/r/<int:width>x<int:height>/<path:path>', rendition, name='rendition'),
+    path('media/<path:path>', protected_media, name='protected_media'),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/docs/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('health/db/', DatabaseStatusView.as_view(), name='database_status'),
     path('sentry-debug/', trigger_error),
     path('silk/', include('silk.urls', namespace='silk')),
+    # Асинхронные эндпоинты чтения каталога; остальные методы этих URL обрабатывают ViewSet роутера.
+    path('shops/', async_views.shop_list, name='shop-list'),
+    path('category/', async_views.category_list, name='category-list'),
+    path('products/', async_views.product_list, name='product-list'),
+    path('products/<int:pk>/', async_views.product_detail, name='product-detail'),
 ] + router.urls
@@ -0,0 +1,155 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from backend.cart import RedisCart
+from backend.models import Order, OrderProduct, ProductInfo
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def buyer(db):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    yield buyer
+    RedisCart(buyer.id).clear()
+
+
+@pytest.fixture
+def client(buyer):
+    client = APIClient()
+    client.force_authenticate(user=buyer)
+    return client
+
+
+@pytest.mark.django_db
+def test_cart_does_not_touch_orders_or_stock(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=10)
+    response = client.post("/cart/add_product/", {"product_id": shop_product.product_id, "quantity": 3}, format="json")
+    assert response.status_code == 200
+    client.post("/cart/add_product/", {"product_id": shop_product.product_id, "quantity": 2}, format="json")
+    response = client.post("/cart/delete_product/", {"product_id": shop_product.product_id, "quantity": 1}, format="json")
+
+    assert response.data["lines"][0]["quantity"] == 4
+    assert response.data["total_price"] == 400
+    assert not Order.objects.filter(user=buyer).exists()
+    shop_product.refresh_from_db()
+    assert shop_product.quantity == 10
+
+
+@pytest.mark.django_db
+def test_place_an_order_materializes_cart(
+        client, buyer, supplier, django_capture_on_commit_callbacks, make_shop_product):
+    first = make_shop_product(supplier, name="First", price=100, quantity=10)
+    second = make_shop_product(supplier, name="Second", price=30, quantity=10)
+    client.post("/cart/add_product/", {"product_id": first.product_id, "quantity": 2}, format="json")
+    client.post("/cart/add_product/", {"product_id": second.product_id, "quantity": 1}, format="json")
+    ProductInfo.objects.filter(product=first.product).update(price=999)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post("/order/place_an_order/", {"delivery_choice": False}, format="json")
+
+    assert response.status_code == 200
+    order = Order.objects.get(user=buyer, parent__isnull=True)
+    assert order.status_choice == "done"
+    assert order.total_price == 2 * 100 + 30
+    assert OrderProduct.objects.filter(order=order).count() == 2
+    first.refresh_from_db()
+    assert first.quantity == 8
+    assert RedisCart(buyer.id).lines() == []
+
+
+@pytest.mark.django_db
+def test_place_an_order_keeps_cart_when_stock_is_short(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=5)
+    client.post("/cart/add_product/", {"product_id": shop_product.product_id, "quantity": 5}, format="json")
+    shop_product.reserved = 4
+    shop_product.save()
+
+    response = client.post("/order/place_an_order/", {"delivery_choice": False}, format="json")
+
+    assert response.status_code == 400
+    assert not Order.objects.filter(user=buyer).exists()
+    assert RedisCart(buyer.id).lines()[0]["quantity"] == 5
+
+
+@pytest.mark.django_db
+def test_place_an_order_validates_delivery_before_materializing_cart(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=5)
+    client.post("/cart/add_product/", {"product_id": shop_product.product_id, "quantity": 2}, format="json")
+
+    response = client.post("/order/place_an_order/", {"delivery_choice": True, "city": "Moscow"}, format="json")
+
+    assert response.status_code == 400
+    assert not Order.objects.filter(user=buyer).exists()
+    shop_product.refresh_from_db()
+    assert shop_product.reserved == 0
+    assert RedisCart(buyer.id).lines()[0]["quantity"] == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("action", ["add_product", "delete_product"])
+@pytest.mark.parametrize("quantity", [-5, 0, None])
+def test_cart_rejects_non_positive_quantity(client, buyer, supplier, action, quantity, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=10)
+    client.post("/cart/add_product/", {"product_id": shop_product.product_id, "quantity": 2}, format="json")
+
+    response = client.post(f"/cart/{action}/", {"product_id": shop_product.product_id, "quantity": quantity},
+                           format="json")
+
+    assert response.status_code == 400
+    assert "quantity" in response.data
+    assert RedisCart(buyer.id).lines()[0]["quantity"] == 2
+
+
+@pytest.mark.django_db
+def test_cart_rejects_missing_quantity(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=10)
+
+    response = client.post("/cart/add_product/", {"product_id": shop_product.product_id}, format="json")
+
+    assert response.status_code == 400
+    assert RedisCart(buyer.id).lines() == []
+    with pytest.raises(ValueError):
+        RedisCart(buyer.id).add(shop_product, -5)
+
+
+@pytest.mark.django_db
+def test_cart_update_products_changes_redis_cart_only(client, buyer, supplier, make_shop_product):
+    first = make_shop_product(supplier, name="First", price=100, quantity=10)
+    second = make_shop_product(supplier, name="Second", price=30, quantity=10)
+    client.post("/cart/add_product/", {"product_id": second.product_id, "quantity": 2}, format="json")
+
+    response = client.post("/cart/update_products/", {"lines": [
+        {"product_id": first.product_id, "quantity": 3},
+        {"product_id": second.product_id, "quantity": -2},
+    ]}, format="json")
+
+    assert response.status_code == 200
+    cart = RedisCart(buyer.id)
+    assert cart.client.hgetall(cart.quantities_key) == {str(first.product_id).encode(): b"3"}
+    assert list(cart.client.hgetall(cart.items_key)) == [str(first.product_id).encode()]
+    assert response.data["total_price"] == 300
+    assert not Order.objects.filter(user=buyer).exists()
+    first.refresh_from_db()
+    assert (first.quantity, first.reserved) == (10, 0)
+
+
+@pytest.mark.django_db
+def test_cart_update_products_rolls_back_on_any_failure(client, buyer, supplier, make_shop_product):
+    first = make_shop_product(supplier, name="First", quantity=10)
+    second = make_shop_product(supplier, name="Second", quantity=10)
+    client.post("/cart/add_product/", {"product_id": second.product_id, "quantity": 1}, format="json")
+
+    for lines in (
+        [{"product_id": first.product_id, "quantity": 3}, {"product_id": second.product_id, "quantity": -2}],
+        [{"product_id": first.product_id, "quantity": 11}],
+    ):
+        response = client.post("/cart/update_products/", {"lines": lines}, format="json")
+        assert response.status_code == 400
+
+    cart = RedisCart(buyer.id)
+    assert cart.client.hgetall(cart.quantities_key) == {str(second.product_id).encode(): b"1"}
@@ -0,0 +1,145 @@
+import json
+
+import pytest
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django_redis import get_redis_connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import SimpleRateThrottle
+
+from backend import db_router
+from backend.catalog_cache import CHANGED_KEY, bump_catalog_version
+from backend.models import Product, ProductInfo
+from backend.views import ProductCategoryViewSet, ProductsViewSet, ShopViewSet
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def catalog(supplier, make_shop_product):
+    cache.delete_pattern("throttle_*")
+    # Изменения внутри тестовой транзакции не фиксируются, поэтому кеш прошлых тестов сбрасывается явно.
+    bump_catalog_version()
+    return [
+        make_shop_product(supplier, name="Phone", price=300).product,
+        make_shop_product(supplier, name="Laptop", price=900).product,
+        make_shop_product(supplier, name="Phone case", price=20, shop_name="Other Shop").product,
+    ]
+
+
+def sync_response(viewset, actions, path, **kwargs):
+    response = viewset.as_view(actions)(APIRequestFactory().get(path), **kwargs)
+    return json.loads(response.render().content)
+
+
+@pytest.mark.parametrize("path", ["/products/", "/products/1/", "/category/", "/shops/"])
+def test_catalog_read_views_are_async(path):
+    assert iscoroutinefunction(resolve(path).func)
+
+
+@pytest.mark.parametrize("viewset, path", [
+    (ProductsViewSet, "/products/?ordering=-price"),
+    (ProductsViewSet, "/products/?search=phone"),
+    (ProductsViewSet, "/products/?name=Laptop"),
+    (ProductCategoryViewSet, "/category/"),
+    (ProductCategoryViewSet, "/category/?search=test"),
+    (ProductCategoryViewSet, "/category/?search=missing"),
+    (ShopViewSet, "/shops/?search=other"),
+])
+def test_async_list_matches_viewset(client, catalog, viewset, path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert response.json() == sync_response(viewset, {"get": "list"}, path)
+
+
+def test_async_detail_matches_viewset(client, catalog):
+    product = catalog[0]
+    response = client.get(f"/products/{product.pk}/")
+
+    assert response.status_code == 200
+    assert response.json() == sync_response(
+        ProductsViewSet, {"get": "retrieve"}, f"/products/{product.pk}/", pk=product.pk
+    )
+    assert response.json()["product_info"][0]["price"] == "300.00"
+    assert client.get("/products/0/").status_code == 404
+    assert client.get("/category/?shop=abc").status_code == 400
+
+
+def test_catalog_responses_are_cached_until_catalog_changes(client, catalog, django_capture_on_commit_callbacks):
+    assert [p["name"] for p in client.get("/products/?ordering=name").json()] == ["Laptop", "Phone", "Phone case"]
+
+    # Обход сигналов: без сброса версии ответ отдается из кеша.
+    Product.objects.filter(pk=catalog[1].pk).update(name="Tablet")
+    assert [p["name"] for p in client.get("/products/?ordering=name").json()] == ["Laptop", "Phone", "Phone case"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductInfo.objects.filter(product=catalog[0]).update(price=1)
+        catalog[0].save()
+    assert [p["name"] for p in client.get("/products/?ordering=name").json()] == ["Phone", "Phone case", "Tablet"]
+    assert client.get("/products/?name=Phone").json()[0]["price"] == 1.0
+
+
+def test_catalog_writes_go_to_viewset(client, catalog, supplier):
+    token = Token.objects.get(user=supplier)
+    response = client.patch(
+        f"/products/{catalog[0].pk}/", {"name": "Smartphone"},
+        content_type="application/json", HTTP_AUTHORIZATION=f"Token {token.key}",
+    )
+
+    assert response.status_code == 200
+    assert Product.objects.get(pk=catalog[0].pk).name == "Smartphone"
+    response = client.post(
+        "/shops/", {"name": "New"}, content_type="application/json", HTTP_AUTHORIZATION=f"Token {token.key}"
+    )
+    assert response.status_code == 201
+
+
+def test_catalog_authentication_and_throttling(client, catalog, supplier, monkeypatch):
+    monkeypatch.setattr(SimpleRateThrottle, "THROTTLE_RATES", {"anon": "3/minute", "user": "3/minute"})
+    token = Token.objects.get(user=supplier)
+
+    assert client.get("/shops/", HTTP_AUTHORIZATION="Token wrong").status_code == 401
+    # Асинхронные и синхронные запросы расходуют один лимит DRF.
+    assert client.get("/shops/").status_code == 200
+    assert client.get("/shops/", {"format": "json"}).status_code == 200
+    assert [client.get("/shops/").status_code for _ in range(2)] == [200, 429]
+    assert "Retry-After" in client.get("/shops/")
+    responses = [client.get("/shops/", HTTP_AUTHORIZATION=f"Token {token.key}") for _ in range(4)]
+    assert [response.status_code for response in responses] == [200, 200, 200, 429]
+
+
+def test_catalog_cache_is_keyed_by_host(client, catalog, settings):
+    settings.ALLOWED_HOSTS = ["first.example.com", "second.example.com"]
+    Product.objects.filter(pk=catalog[0].pk).update(image="products/phone.png")
+
+    for host in settings.ALLOWED_HOSTS:
+        response = client.get("/products/?name=Phone", HTTP_HOST=host)
+        assert response.json()[0]["image"] == f"http://{host}/media/products/phone.png"
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_catalog_cache_is_filled_from_primary_after_change(client, settings, make_shop_product):
+    settings.DATABASE_REPLICAS = ["replica"]
+    db_router._replica_lag.clear()
+    supplier = User.objects.create_user(username="supplier", password="pass1234")
+    make_shop_product(supplier, name="Phone")
+
+    with CaptureQueriesContext(connections["replica"]) as on_replica:
+        assert client.get("/products/?name=Phone").status_code == 200
+    assert not [query for query in on_replica.captured_queries if "backend_product" in query["sql"]]
+
+    get_redis_connection("default").delete(CHANGED_KEY)
+    with CaptureQueriesContext(connections["replica"]) as on_replica:
+        assert client.get("/products/?name=Laptop").status_code == 200
+    assert [query for query in on_replica.captured_queries if "backend_product" in query["sql"]]
+    db_router._replica_lag.clear()
@@ -0,0 +1,54 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from rest_framework.test import APIClient
+
+from backend.db_connections import benchmark_connections, benchmark_settings
+
+
+def test_benchmark_settings_per_mode():
+    assert benchmark_settings("new")["CONN_MAX_AGE"] == 0
+    assert benchmark_settings("persistent")["CONN_MAX_AGE"] is None
+    pooled = benchmark_settings("pool")
+    assert pooled["CONN_MAX_AGE"] == 0 and pooled["OPTIONS"]["pool"]
+    assert "pool" not in benchmark_settings("persistent")["OPTIONS"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["new", "persistent", "pool"])
+def test_benchmark_connections_reports_percentiles(mode):
+    result = benchmark_connections(mode, requests=20, threads=2)
+
+    assert result["requests"] == 20
+    assert 0 < result["p50_ms"] <= result["p99_ms"]
+    if mode == "pool":
+        assert result["pool"]["requests_num"] == 20
+    else:
+        assert result["pool"] is None
+
+
+@pytest.mark.django_db
+def test_benchmark_command_compares_modes():
+    out = StringIO()
+    call_command("benchmark_db_connections", "--requests", "10", stdout=out)
+
+    lines = out.getvalue().splitlines()
+    assert [line.split()[0] for line in lines[1:] if not line.startswith(" ")] == ["new", "persistent", "pool"]
+
+
+@pytest.mark.django_db
+def test_database_status_is_staff_only():
+    client = APIClient()
+    assert client.get("/health/db/").status_code == 401
+
+    client.force_authenticate(User.objects.create_user(username="admin", password="pass1234", is_staff=True))
+    response = client.get("/health/db/")
+
+    assert response.status_code == 200
+    assert response.data["healthy"] is True
+    assert response.data["health_checks"] is True
+    assert response.data["conn_max_age"] == connection.settings_dict["CONN_MAX_AGE"]
+    assert response.data["pool"] is None
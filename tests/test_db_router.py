@@ -0,0 +1,82 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from backend import db_router
+from backend.models import Product, Shop
+
+
+@pytest.fixture
+def replica(settings):
+    # Реплика "replica" (conftest.py) - отдельное соединение с той же тестовой БД.
+    settings.DATABASE_REPLICAS = ["replica"]
+    db_router._replica_lag.clear()
+    yield connections["replica"]
+    db_router._replica_lag.clear()
+
+
+def table_queries(context, table):
+    return [query for query in context.captured_queries
+            if table in query["sql"] and not query["sql"].startswith("EXPLAIN")]
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_reads_use_replica_outside_write_transactions(replica):
+    supplier = User.objects.create_user(username="supplier", password="pass1234")
+    Shop.objects.create(name="Shop", user=supplier)
+
+    with CaptureQueriesContext(replica) as on_replica:
+        assert list(Shop.objects.values_list("name", flat=True)) == ["Shop"]
+        with transaction.atomic():
+            Shop.objects.select_for_update().get(name="Shop")
+            Shop.objects.filter(name="Shop").update(name="Shop 2")
+            assert Shop.objects.get().name == "Shop 2"
+
+    assert len(table_queries(on_replica, "backend_shop")) == 1
+    assert db_router.PrimaryReplicaRouter().db_for_write(Shop) == "default"
+
+
+@pytest.mark.parametrize("lag, expected", [(0.5, "replica"), (30, "default"), (None, "default")])
+def test_lagging_replica_falls_back_to_primary(settings, monkeypatch, lag, expected):
+    settings.DATABASE_REPLICAS = ["replica"]
+    settings.REPLICA_MAX_LAG = 5
+    monkeypatch.setattr(db_router, "replica_lag", lambda alias: lag)
+
+    assert db_router.PrimaryReplicaRouter().db_for_read(Product) == expected
+    with db_router.use_primary():
+        assert db_router.PrimaryReplicaRouter().db_for_read(Product) == "default"
+
+
+@pytest.mark.django_db
+def test_replica_lag_is_checked_periodically(settings, django_assert_num_queries):
+    settings.REPLICA_LAG_CHECK_INTERVAL = 60
+    db_router._replica_lag.clear()
+
+    with django_assert_num_queries(1):
+        assert db_router.replica_lag("default") == 0.0
+        assert db_router.replica_lag("default") == 0.0
+    db_router._replica_lag.clear()
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_reads_stick_to_primary_after_write(client, replica, settings):
+    settings.PRIMARY_STICKY_SECONDS = 30
+    supplier = User.objects.create_user(username="supplier", password="pass1234")
+    headers = {"HTTP_AUTHORIZATION": f"Token {Token.objects.get_or_create(user=supplier)[0].key}"}
+
+    with CaptureQueriesContext(replica) as on_replica:
+        assert client.get("/shop/product/", **headers).status_code == 200
+    assert table_queries(on_replica, "backend_shopproduct")
+
+    response = client.post("/shops/", {"name": "New"}, content_type="application/json", **headers)
+    assert response.status_code == 201
+    assert db_router.STICKY_COOKIE in response.cookies
+
+    with CaptureQueriesContext(replica) as on_replica:
+        # Браузер с cookie и клиент API без cookie, но с тем же токеном, читают из основной БД.
+        assert client.get("/shop/product/").status_code == 200
+        client.cookies.clear()
+        assert client.get("/shop/product/", **headers).status_code == 200
+    assert not table_queries(on_replica, "backend_shopproduct")
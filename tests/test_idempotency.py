@@ -0,0 +1,78 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from backend.idempotency import IdempotencyStore, request_fingerprint
+from backend.models import OrderProduct
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def buyer(db):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    yield buyer
+    store = IdempotencyStore()
+    for key in store.client.keys(f"{store.key_prefix}:{buyer.pk}:*"):
+        store.client.delete(key)
+
+
+@pytest.fixture
+def client(buyer):
+    client = APIClient()
+    client.force_authenticate(user=buyer)
+    return client
+
+
+@pytest.mark.django_db
+def test_retry_with_same_key_replays_response(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier)
+    data = {"product_id": shop_product.product_id, "quantity": 2}
+
+    first = client.post("/order/add_product/", data, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+    with CaptureQueriesContext(connection) as context:
+        second = client.post("/order/add_product/", data, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+
+    assert second.status_code == first.status_code == 200
+    assert second.data == first.data
+    assert second["Idempotent-Replayed"] == "true"
+    assert not [query for query in context.captured_queries if "backend_" in query["sql"]]
+    assert OrderProduct.objects.get(order__user=buyer).quantity == 2
+    shop_product.refresh_from_db()
+    assert shop_product.reserved == 2
+
+
+@pytest.mark.django_db
+def test_key_cannot_be_reused_for_another_request(client, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier)
+    data = {"product_id": shop_product.product_id, "quantity": 1}
+    client.post("/order/add_product/", data, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+
+    response = client.post("/order/delete_product/", data, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+    assert response.status_code == 422
+
+    response = client.post(
+        "/order/add_product/", {**data, "quantity": 5}, format="json", HTTP_IDEMPOTENCY_KEY="retry-2"
+    )
+    assert response.status_code == 422
+    assert OrderProduct.objects.get().quantity == 1
+
+
+@pytest.mark.django_db
+def test_request_in_flight_is_rejected(client, buyer, supplier, make_shop_product):
+    shop_product = make_shop_product(supplier)
+    data = {"product_id": shop_product.product_id, "quantity": 1}
+    request = APIRequestFactory().post("/order/add_product/", data, format="json")
+    IdempotencyStore().begin(f"{buyer.pk}:retry-3", request_fingerprint(Request(request, parsers=[JSONParser()])))
+
+    response = client.post("/order/add_product/", data, format="json", HTTP_IDEMPOTENCY_KEY="retry-3")
+
+    assert response.status_code == 409
+    assert not OrderProduct.objects.exists()
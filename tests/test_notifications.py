@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.models import Order, OrderNotification, SupplierOrderEvent
+from backend.tasks import send_order_notifications, send_supplier_digests
+
+
+@pytest.fixture
+def place_order(add_product):
+    def place(buyer, *shop_products):
+        for shop_product in shop_products:
+            add_product(buyer, shop_product.product_id, 2)
+        client = APIClient()
+        client.force_authenticate(user=buyer)
+        response = client.post("/order/place_an_order/", {}, format="json")
+        assert response.status_code == 200
+        return Order.objects.get(user=buyer, status_choice="done", parent__isnull=True)
+    return place
+
+
+@pytest.fixture
+def placed_order(db, settings, make_shop_product, place_order):
+    settings.SUPPLIER_DIGEST_INTERVAL = 0
+    supplier = User.objects.create_user(username="supplier", email="supplier@example.com", is_staff=True)
+    buyer = User.objects.create_user(username="buyer", email="buyer@example.com")
+    return place_order(buyer, make_shop_product(supplier))
+
+
+def test_place_an_order_queues_notifications(placed_order, monkeypatch):
+    monkeypatch.setattr("backend.tasks.send_mails", pytest.fail)
+
+    notifications = OrderNotification.objects.order_by("id")
+    assert [(n.recipient, n.subject, n.status) for n in notifications] == [
+        ("supplier@example.com", "Новый заказ", "pending"),
+        ("buyer@example.com", "Подтверждение заказа", "pending"),
+    ]
+    assert notifications[0].order.parent == placed_order
+    assert notifications[1].order == placed_order
+    assert "Общая сумма заказа 200.00 рублей" in notifications[0].text
+
+
+def test_send_order_notifications_marks_sent(placed_order, monkeypatch):
+    sent = []
+
+    def send(mails):
+        sent.extend(recipient for recipient, _, _ in mails)
+        return [{"recipient": recipient, "sent": True, "error": None} for recipient, _, _ in mails]
+
+    monkeypatch.setattr("backend.tasks.send_mails", send)
+
+    assert send_order_notifications(batch_size=1) == 2
+    assert sent == ["supplier@example.com", "buyer@example.com"]
+    assert set(OrderNotification.objects.values_list("status", flat=True)) == {"sent"}
+    assert send_order_notifications() == 0
+
+
+def test_failed_notifications_are_retried_with_backoff(placed_order, monkeypatch, settings):
+    settings.ORDER_NOTIFICATION_MAX_ATTEMPTS = 2
+    settings.ORDER_NOTIFICATION_RETRY_DELAY = 60
+
+    def fail(mails):
+        return [{"recipient": recipient, "sent": False, "error": "connection refused"} for recipient, _, _ in mails]
+
+    monkeypatch.setattr("backend.tasks.send_mails", fail)
+    assert send_order_notifications() == 0
+    notification = OrderNotification.objects.first()
+    assert (notification.status, notification.attempts) == ("pending", 1)
+    assert notification.next_attempt_at > timezone.now() + timedelta(seconds=50)
+    assert send_order_notifications() == 0
+
+    OrderNotification.objects.update(next_attempt_at=timezone.now())
+    send_order_notifications()
+    notification.refresh_from_db()
+    assert (notification.status, notification.attempts) == ("failed", 2)
+    assert notification.last_error == "connection refused"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notifications_are_sent_outside_transaction(monkeypatch, settings, make_shop_product, place_order):
+    settings.SUPPLIER_DIGEST_INTERVAL = 0
+    supplier = User.objects.create_user(username="supplier", email="supplier@example.com", is_staff=True)
+    place_order(User.objects.create_user(username="buyer", email="buyer@example.com"), make_shop_product(supplier))
+    claimed = []
+
+    def send(mails):
+        assert not transaction.get_connection().in_atomic_block
+        claimed.append(send_order_notifications())
+        return [{"recipient": recipient, "sent": True, "error": None} for recipient, _, _ in mails]
+
+    monkeypatch.setattr("backend.tasks.send_mails", send)
+
+    assert send_order_notifications() == 2
+    assert claimed == [0]
+    assert set(OrderNotification.objects.values_list("status", flat=True)) == {"sent"}
+
+
+@pytest.mark.django_db
+def test_supplier_digest_groups_orders_per_supplier(settings, make_shop_product, place_order):
+    settings.SUPPLIER_DIGEST_INTERVAL = 15
+    first = User.objects.create_user(username="first", email="first@example.com", is_staff=True)
+    second = User.objects.create_user(username="second", email="second@example.com", is_staff=True)
+    phone = make_shop_product(first, name="Phone", price=100, shop_name="First Shop")
+    case = make_shop_product(first, name="Case", price=10, shop_name="First Shop")
+    tv = make_shop_product(second, name="TV", price=300, shop_name="Second Shop")
+    for i in range(3):
+        buyer = User.objects.create_user(username=f"buyer{i}", email=f"buyer{i}@example.com")
+        place_order(buyer, phone, tv) if i else place_order(buyer, phone, case)
+
+    assert not OrderNotification.objects.filter(recipient__in=["first@example.com", "second@example.com"]).exists()
+    assert SupplierOrderEvent.objects.count() == 5
+
+    assert send_supplier_digests() == 2
+    digests = {n.recipient: n.text for n in OrderNotification.objects.filter(subject="Сводка новых заказов")}
+    assert digests["first@example.com"] == (
+        "Поступили новые заказы: 3.\n"
+        "Продукты:\n"
+        "Case - 2 шт. на сумму 20.00 рублей\n"
+        "Phone - 6 шт. на сумму 600.00 рублей\n"
+        "Общая сумма заказов 620.00 рублей.\n"
+    )
+    assert "TV - 4 шт. на сумму 1200.00 рублей" in digests["second@example.com"]
+    assert send_supplier_digests() == 0
+
+
+@pytest.mark.django_db
+def test_each_supplier_is_notified_about_own_lines(settings, make_shop_product, place_order):
+    settings.SUPPLIER_DIGEST_INTERVAL = 0
+    first = User.objects.create_user(username="first", email="first@example.com", is_staff=True)
+    second = User.objects.create_user(username="second", email="second@example.com", is_staff=True)
+    buyer = User.objects.create_user(username="buyer", email="buyer@example.com")
+    order = place_order(
+        buyer,
+        make_shop_product(first, name="Phone", price=100, shop_name="First Shop"),
+        make_shop_product(second, name="TV", price=300, shop_name="Second Shop"),
+    )
+
+    texts = {n.recipient: n.text for n in OrderNotification.objects.filter(subject="Новый заказ")}
+    assert set(texts) == {"first@example.com", "second@example.com"}
+    assert "Phone" in texts["first@example.com"] and "TV" not in texts["first@example.com"]
+    assert "Общая сумма заказа 600.00 рублей" in texts["second@example.com"]
+    buyer_text = OrderNotification.objects.get(order=order).text
+    assert "Общая сумма заказа 800.00 рублей" in buyer_text
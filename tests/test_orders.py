@@ -0,0 +1,363 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.models import ProductInfo, Order, OrderProduct, OrderVersionConflict, StockReservation
+from backend.tasks import release_expired_reservations
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def shop_product(supplier, make_shop_product):
+    return make_shop_product(supplier)
+
+
+@pytest.fixture
+def add_product_in_thread(add_product):
+    def add(user, product_id, quantity):
+        try:
+            return add_product(user, product_id, quantity)
+        finally:
+            connection.close()
+    return add
+
+
+@pytest.mark.django_db
+def test_add_product_reserves_stock(shop_product, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    response = add_product(buyer, shop_product.product_id, 3)
+    assert response.status_code == 200
+    assert response.data["success"] is True
+
+    response = add_product(buyer, shop_product.product_id, 2)
+    assert response.status_code == 200
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (50, 5)
+    assert StockReservation.objects.get(shop_product=shop_product).quantity == 5
+    assert OrderProduct.objects.get(order__user=buyer).quantity == 5
+
+
+@pytest.mark.django_db
+def test_add_product_reports_out_of_stock(shop_product, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    response = add_product(buyer, shop_product.product_id, 51)
+    assert response.status_code == 400
+    assert response.data["success"] is False
+    shop_product.refresh_from_db()
+    assert shop_product.quantity == 50
+    assert not OrderProduct.objects.filter(order__user=buyer).exists()
+
+
+@pytest.mark.django_db
+def test_order_total_uses_price_of_each_line(supplier, shop_product, add_product, make_shop_product):
+    other = make_shop_product(supplier, name="Other", price=30)
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 2)
+    add_product(buyer, other.product_id, 3)
+
+    order = Order.objects.get(user=buyer)
+    assert order.total_price == 2 * 100 + 3 * 30
+    assert order.status_choice == "new"
+
+
+@pytest.mark.django_db
+def test_order_line_keeps_price_snapshot(supplier, shop_product, add_product, make_shop_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 2)
+    ProductInfo.objects.filter(product=shop_product.product).update(price=500)
+    other = make_shop_product(supplier, name="Other", price=30)
+    add_product(buyer, other.product_id, 1)
+
+    line = OrderProduct.objects.get(order__user=buyer, product=shop_product.product)
+    assert (line.unit_price, line.product_name, line.shop_name) == (100, "Product", "Test Shop")
+    assert Order.objects.get(user=buyer).total_price == 2 * 100 + 30
+
+
+@pytest.mark.django_db
+def test_update_totals_is_constant_in_queries(supplier, shop_product, executed_queries, make_shop_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    order = Order.objects.create(user=buyer)
+    for i in range(5):
+        line = make_shop_product(supplier, name=f"Line {i}", price=10)
+        OrderProduct.objects.create(
+            product=line.product, shop_product=line, order=order, quantity=1, **OrderProduct.snapshot(line)
+        )
+
+    with CaptureQueriesContext(connection) as context:
+        order.update_totals()
+    assert len(executed_queries(context)) == 2
+    order.refresh_from_db()
+    assert order.total_price == 50
+    assert order.status_choice == "new"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_add_product_does_not_oversell(shop_product, add_product_in_thread):
+    buyers = User.objects.bulk_create(User(username=f"buyer{i}") for i in range(200))
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        responses = list(executor.map(lambda buyer: add_product_in_thread(buyer, shop_product.product_id, 1), buyers))
+
+    succeeded = [response for response in responses if response.status_code == 200]
+    shop_product.refresh_from_db()
+    ordered = OrderProduct.objects.filter(shop_product=shop_product).aggregate(total=Sum("quantity"))["total"]
+    assert len(succeeded) == 50
+    assert (shop_product.quantity, shop_product.reserved) == (50, 50)
+    assert ordered == 50
+
+
+@pytest.mark.django_db
+def test_update_products_applies_all_lines(supplier, shop_product, add_product, make_shop_product):
+    other = make_shop_product(supplier, name="Other", price=30, quantity=5)
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, other.product_id, 2)
+    client = APIClient()
+    client.force_authenticate(user=buyer)
+
+    response = client.post("/order/update_products/", {"lines": [
+        {"product_id": shop_product.product_id, "quantity": 4},
+        {"product_id": other.product_id, "quantity": -1},
+        {"product_id": shop_product.product_id, "quantity": 1},
+    ]}, format="json")
+
+    assert response.status_code == 200
+    order = Order.objects.get(user=buyer)
+    assert order.total_price == 5 * 100 + 30
+    shop_product.refresh_from_db()
+    other.refresh_from_db()
+    assert (shop_product.available, other.available) == (45, 4)
+    assert StockReservation.objects.get(shop_product=other).quantity == 1
+
+
+@pytest.mark.django_db
+def test_update_products_rolls_back_on_any_failure(supplier, shop_product, make_shop_product):
+    other = make_shop_product(supplier, name="Other", price=30, quantity=1)
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    client = APIClient()
+    client.force_authenticate(user=buyer)
+
+    response = client.post("/order/update_products/", {"lines": [
+        {"product_id": shop_product.product_id, "quantity": 4},
+        {"product_id": other.product_id, "quantity": 2},
+    ]}, format="json")
+
+    assert response.status_code == 400
+    assert response.data["success"] is False
+    shop_product.refresh_from_db()
+    assert shop_product.quantity == 50
+    assert not OrderProduct.objects.filter(order__user=buyer).exists()
+
+
+@pytest.mark.django_db
+def test_place_converts_reservations_into_stock_movements(shop_product, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 5)
+    order = Order.objects.get(user=buyer)
+
+    order.place()
+
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (45, 0)
+    assert order.status_choice == "done"
+    assert not StockReservation.objects.exists()
+
+
+@pytest.mark.django_db
+def test_expired_reservations_are_released(shop_product, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 5)
+    StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    assert release_expired_reservations(batch_size=1) == 1
+
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (50, 0)
+    order = Order.objects.get(user=buyer)
+    order.place()
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (45, 0)
+
+
+@pytest.mark.django_db
+def test_place_fails_when_released_stock_was_taken(supplier, add_product, make_shop_product):
+    shop_product = make_shop_product(supplier, quantity=5)
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 5)
+    StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+    release_expired_reservations()
+    other = User.objects.create_user(username="other", password="pass1234")
+    assert add_product(other, shop_product.product_id, 5).status_code == 200
+
+    with pytest.raises(ValueError):
+        Order.objects.get(user=buyer).place()
+    assert Order.objects.get(user=buyer).status_choice == "new"
+
+
+@pytest.mark.django_db
+def test_place_splits_order_per_shop_in_constant_queries(
+        supplier, shop_product, add_product, executed_queries, make_shop_product):
+    other_supplier = User.objects.create_user(username="other_supplier", password="pass1234", is_staff=True)
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    other_lines = [make_shop_product(other_supplier, name=f"Other {i}", price=30, shop_name="Other Shop")
+                   for i in range(3)]
+    for line in [shop_product, *other_lines]:
+        add_product(buyer, line.product_id, 2)
+    order = Order.objects.get(user=buyer)
+
+    with CaptureQueriesContext(connection) as context:
+        sub_orders = order.split_by_supplier()
+    assert len(executed_queries(context)) == 3
+
+    assert {(sub_order.shop.user, sub_order.total_price) for sub_order in sub_orders} == {
+        (supplier, 200), (other_supplier, 180),
+    }
+    other_order = next(sub_order for sub_order in sub_orders if sub_order.shop.user == other_supplier)
+    assert sorted(other_order.supplier_lines.values_list("product_name", flat=True)) == [
+        "Other 0", "Other 1", "Other 2",
+    ]
+    assert order.order_products.count() == 4
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stale_order_recomputes_totals_after_version_conflict(supplier, shop_product, add_product, make_shop_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 2)
+    stale = Order.objects.get(user=buyer)
+    other = make_shop_product(supplier, name="Other", price=30)
+    add_product(buyer, other.product_id, 1)
+
+    stale.update_totals()
+
+    order = Order.objects.get(user=buyer)
+    assert order.total_price == 2 * 100 + 30
+    assert order.version == stale.version
+
+
+@pytest.mark.django_db
+def test_placed_order_rejects_stale_changes(shop_product, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 2)
+    stale = Order.objects.get(user=buyer)
+    Order.objects.get(user=buyer).place()
+
+    with pytest.raises(OrderVersionConflict):
+        stale.update_totals()
+    with pytest.raises(OrderVersionConflict):
+        stale.place()
+    shop_product.refresh_from_db()
+    assert shop_product.quantity == 48
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_changes_keep_order_totals_consistent(supplier, add_product_in_thread, make_shop_product):
+    buyer = User.objects.create_user(username="buyer")
+    Order.objects.create(user=buyer)
+    shop_products = [make_shop_product(supplier, name=f"Line {i}", price=10) for i in range(20)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(
+            lambda line: add_product_in_thread(buyer, line.product_id, 1), shop_products
+        ))
+
+    assert all(response.status_code == 200 for response in responses)
+    order = Order.objects.get(user=buyer)
+    assert order.total_price == 20 * 10
+    assert order.version >= 20
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("quantity", [-5, 0, None])
+def test_add_product_rejects_non_positive_quantity(shop_product, quantity, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    response = add_product(buyer, shop_product.product_id, quantity)
+
+    assert response.status_code == 400
+    assert "quantity" in response.data
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (50, 0)
+    assert not OrderProduct.objects.filter(order__user=buyer).exists()
+
+
+@pytest.mark.django_db
+def test_reserve_rejects_non_positive_quantity(shop_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    order = Order.objects.create(user=buyer)
+
+    with pytest.raises(ValueError):
+        order.add_line(shop_product, -5)
+    shop_product.refresh_from_db()
+    assert shop_product.reserved == 0
+    assert not OrderProduct.objects.filter(order=order).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("quantity", [-100, 0, None, "two"])
+def test_delete_product_rejects_invalid_quantity(shop_product, quantity, add_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    add_product(buyer, shop_product.product_id, 2)
+    client = APIClient()
+    client.force_authenticate(user=buyer)
+
+    response = client.post(
+        "/order/delete_product/", {"product_id": shop_product.product_id, "quantity": quantity}, format="json"
+    )
+
+    assert response.status_code == 400
+    assert "quantity" in response.data
+    shop_product.refresh_from_db()
+    assert (shop_product.quantity, shop_product.reserved) == (50, 2)
+    assert OrderProduct.objects.get(order__user=buyer).quantity == 2
+
+
+@pytest.mark.django_db
+def test_release_rejects_non_positive_quantity(shop_product):
+    buyer = User.objects.create_user(username="buyer", password="pass1234")
+    order = Order.objects.create(user=buyer)
+    order_product = order.add_line(shop_product, 2)
+
+    with pytest.raises(ValueError):
+        order_product.release(-100)
+    shop_product.refresh_from_db()
+    assert shop_product.reserved == 2
+
+
+def conflicting_change(calls, failures):
+    def change():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise OrderVersionConflict("Заказ был изменен другим запросом, повторите попытку")
+        return "done"
+    return change
+
+
+@pytest.mark.django_db
+def test_version_conflict_inside_transaction_fails_without_sleeping(monkeypatch):
+    order = Order.objects.create(user=User.objects.create_user(username="buyer"))
+    monkeypatch.setattr("backend.models.time.sleep", lambda delay: pytest.fail("slept holding row locks"))
+    calls = []
+
+    with pytest.raises(OrderVersionConflict):
+        order.edit(conflicting_change(calls, failures=1))
+    assert calls == [1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_edit_retries_whole_transaction_outside_atomic(monkeypatch):
+    order = Order.objects.create(user=User.objects.create_user(username="buyer"))
+    delays = []
+    monkeypatch.setattr("backend.models.time.sleep", delays.append)
+    calls = []
+
+    assert order.edit(conflicting_change(calls, failures=2)) == "done"
+    assert len(calls) == 3 and len(delays) == 2
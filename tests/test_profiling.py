@@ -0,0 +1,110 @@
+import pytest
+from asgiref.sync import async_to_sync
+from cachalot.api import cachalot_disabled
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from silk.models import Request, SQLQuery
+
+from backend import profiling
+
+emitted = []
+
+
+class ListSink:
+    def emit(self, data):
+        emitted.append(data)
+
+
+class FailingSink:
+    def emit(self, data):
+        raise ValueError("sink is down")
+
+
+@pytest.fixture
+def profiled(db, settings):
+    settings.PROFILING_SINKS = ["tests.test_profiling.ListSink"]
+    settings.PROFILING_SAMPLE_RATE = 0
+    settings.PROFILING_PATHS = []
+    settings.PROFILING_USERS = []
+    settings.PROFILING_HEADER_TOKEN = "secret"
+    settings.PROFILING_SLOW_MS = 10000
+    cache.delete_pattern("throttle_*")
+    emitted.clear()
+    profiling._slow_paths.clear()
+    # Ответы cachalot из кеша не выполняют SQL-запросов.
+    with cachalot_disabled():
+        yield emitted
+    profiling._slow_paths.clear()
+
+
+def test_every_response_has_server_timing_without_capture(client, profiled):
+    response = client.get("/shop/product/")
+
+    timing = response["Server-Timing"]
+    assert timing.startswith("app;dur=") and "db;dur=" in timing and "queries" in timing
+    assert profiled == []
+
+
+def test_header_captures_sql(client, profiled):
+    client.get("/shop/product/", HTTP_X_PROFILE="wrong")
+    assert profiled == []
+
+    response = client.get("/shop/product/?page=1", HTTP_X_PROFILE="secret")
+
+    [data] = profiled
+    assert data["reason"] == "header" and data["status"] == response.status_code
+    assert data["query_params"] == {"page": "1"}
+    assert data["queries"] == len(data["sql"]) > 0
+    assert any("backend_shopproduct" in query["sql"] for query in data["sql"])
+
+
+def test_path_and_user_rules(client, profiled, settings):
+    settings.PROFILING_PATHS = ["/shop/"]
+    client.get("/shop/product/")
+    client.get("/category/")
+    assert [data["reason"] for data in profiled] == ["path"]
+
+    user = User.objects.create_user(username="profiled", password="pass1234")
+    token = Token.objects.get_or_create(user=user)[0]
+    settings.PROFILING_USERS = ["profiled"]
+    client.get("/category/", HTTP_AUTHORIZATION=f"Token {token.key}")
+    client.get("/category/", HTTP_AUTHORIZATION="Token wrong")
+    assert [data["reason"] for data in profiled] == ["path", "user"]
+
+
+def test_slow_request_arms_capture_of_next_request(client, profiled, settings):
+    settings.PROFILING_SLOW_MS = 0
+    client.get("/shop/product/")
+    [slow] = profiled
+    assert slow["reason"] is None and slow["sql"] is None and slow["queries"] > 0
+
+    settings.PROFILING_SLOW_MS = 10000
+    client.get("/shop/product/")
+    client.get("/shop/product/")
+    assert [data["reason"] for data in profiled] == [None, "slow"]
+    assert profiled[1]["sql"]
+
+
+def test_silk_sink_stores_sampled_requests(client, profiled, settings):
+    settings.PROFILING_SINKS = ["backend.profiling.SilkSink"]
+    settings.PROFILING_SAMPLE_RATE = 1
+
+    assert client.get("/shop/product/").status_code == 200
+    request = Request.objects.get(path="/shop/product/")
+    assert request.num_sql_queries == SQLQuery.objects.filter(request=request).count() > 0
+    assert request.response.status_code == 200
+
+
+def test_sink_errors_do_not_break_response(client, profiled, settings):
+    settings.PROFILING_SINKS = ["tests.test_profiling.FailingSink", "tests.test_profiling.ListSink"]
+
+    assert client.get("/shop/product/", HTTP_X_PROFILE="secret").status_code == 200
+    assert len(profiled) == 1
+
+
+def test_async_requests_are_profiled(async_client, profiled):
+    response = async_to_sync(async_client.get)("/category/", headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200 and "Server-Timing" in response
+    assert [data["reason"] for data in profiled] == ["header"]
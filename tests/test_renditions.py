@@ -0,0 +1,170 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import RequestFactory
+from PIL import Image
+
+from backend import views
+from backend.models import Product, UserProfile
+from backend.rendition_cache import DiskLRUCache
+from backend.tasks import generate_product_thumbnail
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def media(supplier, settings, tmp_path, make_shop_product):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    settings.RENDITION_CACHE_DIR = str(tmp_path / "cache")
+    settings.MEDIA_SENDFILE_BACKEND = ""
+    (tmp_path / "media" / "products").mkdir(parents=True)
+    Image.new("RGB", (1200, 800), (20, 120, 220)).save(tmp_path / "media" / "products" / "photo.png")
+    product = make_shop_product(supplier).product
+    product.image = "products/photo.png"
+    product.save()
+    return tmp_path
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+    original = views.make_rendition
+    monkeypatch.setattr(views, "make_rendition", lambda *args: calls.append(args) or original(*args))
+    return calls
+
+
+def read(response):
+    return Image.open(BytesIO(b"".join(response.streaming_content)))
+
+
+def test_rendition_is_created_once_and_served_from_cache(client, media, renders):
+    first = client.get("/media/r/300x300/products/photo.png")
+    second = client.get("/media/r/300x300/products/photo.png")
+
+    assert first.status_code == second.status_code == 200
+    assert first["Content-Type"] == "image/jpeg"
+    assert "Accept" in first["Vary"]
+    assert read(second).size == (300, 200)
+    assert len(renders) == 1
+
+
+def test_rendition_format_follows_accept_header(client, media, renders):
+    response = client.get("/media/r/150x150/products/photo.png", HTTP_ACCEPT="image/webp,image/*")
+
+    assert response["Content-Type"] == "image/webp"
+    image = read(response)
+    assert (image.format, image.size) == ("WEBP", (150, 100))
+
+
+@pytest.mark.parametrize("url", [
+    "/media/r/301x300/products/photo.png",
+    "/media/r/300x300/products/missing.png",
+    "/media/r/300x300/../settings.py",
+    "/media/r/300x300/products",
+])
+def test_rendition_rejects_unknown_sizes_and_paths(client, media, renders, url):
+    assert client.get(url).status_code == 404
+    assert renders == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_requests_for_one_rendition_are_coalesced(media, renders):
+    factory = RequestFactory()
+
+    def fetch(_):
+        request = factory.get("/")
+        request.user = AnonymousUser()
+        try:
+            return read(views.rendition(request, 600, 600, "products/photo.png")).size
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sizes = list(executor.map(fetch, range(16)))
+
+    assert sizes == [(600, 400)] * 16
+    assert len(renders) == 1
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_size=350)
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put(key, b"x" * 100).close()
+        os.utime(tmp_path / key[:2] / key, (i, i))
+    cache.get("aa1").close()
+
+    cache.put("dd4", b"x" * 100).close()
+
+    assert cache.get("bb2") is None
+    assert all(cache.get(key) is not None for key in ["aa1", "cc3", "dd4"])
+
+
+def test_upload_only_generates_thumbnail_size_up_front(media):
+    product = Product.objects.get()
+
+    generate_product_thumbnail(product.pk)
+
+    product.refresh_from_db()
+    assert sorted(product.renditions.values_list("width", "format")) == [(300, "JPEG"), (300, "WEBP")]
+    with Image.open(product.thumbnail.path) as thumbnail:
+        assert thumbnail.size == (300, 200)
+
+
+def test_product_media_is_public_and_hashed_names_are_immutable(client, media, tmp_path):
+    response = client.get("/media/products/photo.png")
+    assert response.status_code == 200
+    assert response["Cache-Control"] == "public, max-age=3600"
+    assert b"".join(response.streaming_content) == (tmp_path / "media" / "products" / "photo.png").read_bytes()
+
+    product = Product.objects.get()
+    generate_product_thumbnail(product.pk)
+    product.refresh_from_db()
+    response = client.get(f"/media/{product.thumbnail.name}")
+    assert response.status_code == 200
+    assert response["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert client.get("/media/products/unreferenced.png").status_code == 404
+
+
+def test_media_transfer_is_handed_to_proxy(client, media, settings):
+    settings.MEDIA_SENDFILE_BACKEND = "nginx"
+    response = client.get("/media/products/photo.png")
+    assert response.status_code == 200
+    assert response["X-Accel-Redirect"] == "/protected-media/products/photo.png"
+    assert response["Content-Type"] == "image/png"
+    assert response.content == b""
+
+    response = client.get("/media/r/300x300/products/photo.png")
+    assert response["X-Accel-Redirect"].startswith("/protected-renditions/")
+    assert response["Content-Type"] == "image/jpeg"
+    assert response.content == b""
+    cached = media / "cache" / response["X-Accel-Redirect"].removeprefix("/protected-renditions/")
+    assert Image.open(cached).size == (300, 200)
+
+    settings.MEDIA_SENDFILE_BACKEND = "x-sendfile"
+    response = client.get("/media/products/photo.png")
+    assert response["X-Sendfile"] == str(media / "media" / "products" / "photo.png")
+
+
+def test_avatar_is_only_served_to_its_owner(client, media, supplier):
+    owner = User.objects.create_user(username="owner", password="pass1234")
+    other = User.objects.create_user(username="other", password="pass1234")
+    (media / "media" / "avatars").mkdir()
+    Image.new("RGB", (200, 200)).save(media / "media" / "avatars" / "me.png")
+    UserProfile.objects.create(user=owner, avatar="avatars/me.png")
+
+    assert client.get("/media/avatars/me.png").status_code == 404
+    client.force_login(other)
+    assert client.get("/media/avatars/me.png").status_code == 404
+    client.force_login(owner)
+    response = client.get("/media/avatars/me.png")
+    assert response.status_code == 200
+    assert response["Cache-Control"] == "private, max-age=3600"
+    client.force_login(supplier)
+    assert client.get("/media/r/150x150/avatars/me.png").status_code == 200
@@ -0,0 +1,85 @@
+import socket
+
+import pytest
+
+from backend.send_email import SMTPConnectionPool, build_message
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.sessions = []
+        self.recipients = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rejected"):
+            return "550 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if session.peer not in self.sessions:
+            self.sessions.append(session.peer)
+        self.recipients.extend(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+@pytest.fixture
+def pool(smtp_server):
+    controller, _ = smtp_server
+    pool = SMTPConnectionPool(host=controller.hostname, port=controller.port,
+                              user=None, use_tls=False, size=4, timeout=5)
+    yield pool
+    pool.close()
+
+
+def messages(recipients):
+    return [build_message("shop@example.com", recipient, "Тест", "Текст") for recipient in recipients]
+
+
+def test_send_many_reuses_pooled_sessions(smtp_server, pool):
+    _, handler = smtp_server
+    recipients = [f"user{i}@example.com" for i in range(1000)]
+
+    results = pool.send_many(messages(recipients))
+
+    assert [result["recipient"] for result in results] == recipients
+    assert all(result["sent"] for result in results)
+    assert sorted(handler.recipients) == sorted(recipients)
+    assert len(handler.sessions) <= pool.size
+
+
+def test_send_many_reports_per_message_results(pool):
+    results = pool.send_many(messages(["ok@example.com", "rejected@example.com", "next@example.com"]))
+
+    assert [result["sent"] for result in results] == [True, False, True]
+    assert "550" in results[1]["error"]
+
+
+def test_pool_reconnects_after_dropped_connection(smtp_server, pool):
+    _, handler = smtp_server
+    pool.send_many(messages(["first@example.com"]))
+    with pool.connection() as server:
+        server.sock.shutdown(socket.SHUT_RDWR)
+
+    results = pool.send_many(messages(["second@example.com"]))
+
+    assert results[0]["sent"] is True
+    assert handler.recipients == ["first@example.com", "second@example.com"]
+    assert len(handler.sessions) == 2
@@ -0,0 +1,80 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.models import Order
+
+
+@pytest.fixture
+def suppliers(db):
+    first = User.objects.create_user(username="first", password="pass1234", is_staff=True)
+    second = User.objects.create_user(username="second", password="pass1234", is_staff=True)
+    return first, second
+
+
+@pytest.fixture
+def place_orders(add_product):
+    def place(count, *shop_products):
+        for i in range(count):
+            buyer = User.objects.create_user(username=f"buyer{i}", password="pass1234")
+            for shop_product in shop_products:
+                add_product(buyer, shop_product.product_id, 1)
+            Order.objects.get(user=buyer).place()
+    return place
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_inbox_lists_only_own_lines_with_cursor(suppliers, make_shop_product, place_orders):
+    first, second = suppliers
+    phone = make_shop_product(first, name="Phone", shop_name="First Shop")
+    tv = make_shop_product(second, name="TV", shop_name="Second Shop")
+    place_orders(5, phone, tv)
+
+    response = client_for(first).get("/supplier/orders/", {"page_size": 3})
+    assert response.status_code == 200
+    assert len(response.data["results"]) == 3
+    assert {line["product_name"] for order in response.data["results"] for line in order["lines"]} == {"Phone"}
+
+    response = client_for(first).get(response.data["next"])
+    assert len(response.data["results"]) == 2
+    assert response.data["next"] is None
+
+
+def test_inbox_filters_by_status_in_constant_queries(suppliers, executed_queries, make_shop_product, place_orders):
+    first, _ = suppliers
+    products = [make_shop_product(first, name=f"Product {i}", shop_name="First Shop") for i in range(3)]
+    place_orders(10, *products)
+    Order.objects.create(user=first, shop=products[0].shop, status_choice="new")
+
+    with CaptureQueriesContext(connection) as context:
+        response = client_for(first).get("/supplier/orders/", {"status_choice": "done", "page_size": 10})
+    assert response.status_code == 200
+    assert len(response.data["results"]) == 10
+    assert all(len(order["lines"]) == 3 for order in response.data["results"])
+    queries = [
+        query["sql"] for query in executed_queries(context)
+        if query["sql"].startswith("SELECT") and '"backend_' in query["sql"]
+    ]
+    assert len(queries) == 2, queries
+
+
+def test_suppliers_cannot_change_customer_orders(suppliers, make_shop_product, place_orders):
+    first, second = suppliers
+    place_orders(1, make_shop_product(first, shop_name="First Shop"), make_shop_product(second, name="TV"))
+    sub_order = Order.objects.get(shop__user=first)
+    client = client_for(first)
+
+    response = client.get("/order/")
+    assert response.status_code == 200
+    assert response.data == []
+    assert client.patch(f"/order/{sub_order.pk}/", {"delivery_choice": True}, format="json").status_code == 404
+    assert client.delete(f"/order/{sub_order.pk}/").status_code == 404
+    assert client.delete(f"/supplier/orders/{sub_order.pk}/").status_code == 405
+    assert Order.objects.filter(pk=sub_order.pk, delivery_choice=False).exists()
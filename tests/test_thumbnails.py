@@ -0,0 +1,353 @@
+from io import BytesIO, StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DataError
+from PIL import Image
+
+from backend.models import ImageRendition, Product
+from backend.tasks import generate_product_thumbnail, regenerate_thumbnail_chunk, thumbnail_checkpoint_key
+
+
+@pytest.fixture
+def supplier(db):
+    return User.objects.create_user(username="supplier", password="pass1234", is_staff=True)
+
+
+@pytest.fixture
+def products(supplier, settings, tmp_path, make_shop_product):
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "products").mkdir()
+    cache.delete(thumbnail_checkpoint_key("product"))
+    products = []
+    for i in range(5):
+        Image.new("RGBA", (1200, 800), (i * 40, 80, 160, 255)).save(tmp_path / "products" / f"p{i}.png")
+        product = make_shop_product(supplier, name=f"Product {i}").product
+        product.image = f"products/p{i}.png"
+        product.save()
+        products.append(product)
+    yield products
+    cache.delete(thumbnail_checkpoint_key("product"))
+
+
+def test_regenerate_thumbnails_uses_process_pool(products):
+    out = StringIO()
+    call_command("regenerate_thumbnails", "--kind", "product", "--chunk-size", "2", "--workers", "2", stdout=out)
+
+    for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+        with Image.open(product.thumbnail.path) as thumbnail:
+            assert thumbnail.format == "JPEG"
+            assert thumbnail.size == (300, 200)
+    assert "Пересоздано миниатюр: 5, ошибок: 0" in out.getvalue()
+    assert cache.get(thumbnail_checkpoint_key("product")) is None
+
+
+def test_regenerate_thumbnails_resumes_from_checkpoint(products):
+    cache.set(thumbnail_checkpoint_key("product"), products[2].pk, None)
+    products[4].image = "products/missing.png"
+    products[4].save()
+
+    out = StringIO()
+    call_command("regenerate_thumbnails", "--kind", "product", "--workers", "1", "--resume", stdout=out)
+
+    regenerated = [bool(product.thumbnail) for product in Product.objects.filter(
+        pk__in=[p.pk for p in products]).order_by("pk")]
+    assert regenerated == [False, False, False, True, False]
+    assert "Пересоздано миниатюр: 1, ошибок: 1" in out.getvalue()
+
+
+def test_task_checkpoint_advances_only_over_finished_chunks(products, monkeypatch):
+    from django_redis import get_redis_connection
+
+    from backend import tasks
+
+    redis = get_redis_connection("default")
+    key = thumbnail_checkpoint_key("product", "task")
+    redis.delete(key, f"{key}:done", f"{key}:end")
+    cache.set(thumbnail_checkpoint_key("product"), products[4].pk, None)
+    queued = []
+    monkeypatch.setattr(tasks.regenerate_thumbnail_chunk_task, "delay", lambda *args: queued.append(args))
+    ids = [product.pk for product in products]
+
+    assert tasks.regenerate_thumbnails_task("product", chunk_size=2, resume=False) == 3
+    assert [chunk for _, chunk, _ in queued] == [ids[0:2], ids[2:4], ids[4:]]
+    # Вторая пачка упала: контрольная точка не проходит дальше первой пачки.
+    tasks.regenerate_thumbnail_chunk_task(*queued[2])
+    tasks.regenerate_thumbnail_chunk_task(*queued[0])
+    assert int(redis.get(key)) == ids[1]
+    assert cache.get(thumbnail_checkpoint_key("product")) == ids[4]
+
+    queued.clear()
+    assert tasks.regenerate_thumbnails_task("product", chunk_size=2) == 2
+    assert [chunk for _, chunk, _ in queued] == [ids[2:4], ids[4:]]
+    for args in queued:
+        tasks.regenerate_thumbnail_chunk_task(*args)
+    assert not redis.exists(key, f"{key}:done", f"{key}:end")
+
+
+def test_regeneration_never_overwrites_hashed_renditions(products, settings, monkeypatch,
+                                                         django_capture_on_commit_callbacks):
+    from backend import images
+
+    products[1].image = "products/p0.png"
+    products[1].save()
+    ids = [products[0].pk, products[1].pk]
+    regenerate_thumbnail_chunk("product", ids)
+    first = Product.objects.get(pk=products[0].pk).thumbnail.name
+    assert Product.objects.get(pk=products[1].pk).thumbnail.name == first
+    path = settings.MEDIA_ROOT / first
+    written = path.stat().st_mtime_ns
+
+    regenerate_thumbnail_chunk("product", ids)
+    assert Product.objects.get(pk=products[0].pk).thumbnail.name == first
+    assert path.stat().st_mtime_ns == written
+
+    monkeypatch.setitem(images.RENDITION_SAVE_OPTIONS, "JPEG", {"quality": 40})
+    with django_capture_on_commit_callbacks(execute=True):
+        assert regenerate_thumbnail_chunk("product", ids[:1]) == (1, 0)
+
+    second = Product.objects.get(pk=products[0].pk).thumbnail.name
+    assert second != first and not path.exists()
+    assert Product.objects.get(pk=products[1].pk).thumbnail.name == second
+    rendition = Product.objects.get(pk=products[0].pk).renditions.get(width=300, format="JPEG")
+    assert rendition.file.name == second
+    with Image.open(rendition.file.path) as thumbnail:
+        assert thumbnail.size == (300, 200)
+    assert ImageRendition.objects.filter(file=first).count() == 0
+
+
+def test_make_renditions_decodes_source_once(tmp_path, monkeypatch):
+    from backend import images
+
+    source = tmp_path / "large.jpg"
+    Image.new("RGB", (3000, 2000), (200, 100, 50)).save(source, quality=90)
+    opened = []
+    original_open = images.Image.open
+    monkeypatch.setattr(images.Image, "open", lambda *args: opened.append(args) or original_open(*args))
+
+    renditions = images.make_renditions(str(source))
+
+    assert len(opened) == 1
+    assert set(renditions) == {(width, fmt) for width in (1200, 600, 300, 150) for fmt in ("JPEG", "WEBP")}
+    for (width, fmt), content in renditions.items():
+        with Image.open(BytesIO(content)) as rendition:
+            assert rendition.format == fmt
+            assert rendition.size == (width, width * 2 // 3)
+
+
+def test_generate_product_thumbnail_stores_renditions(products, settings):
+    settings.RENDITION_EAGER_WIDTHS = [1200, 600, 300, 150]
+    product = products[0]
+    generate_product_thumbnail(product.pk)
+
+    product.refresh_from_db()
+    assert sorted(product.renditions.values_list("width", "format")) == sorted(
+        (width, fmt) for width in (1200, 600, 300, 150) for fmt in ("JPEG", "WEBP")
+    )
+    with Image.open(product.thumbnail.path) as thumbnail:
+        assert thumbnail.size == (300, 200)
+    with Image.open(product.renditions.get(width=1200, format="WEBP").file.path) as rendition:
+        assert rendition.size == (1200, 800)
+
+
+def test_open_image_rejects_oversized_png_before_decoding(tmp_path, monkeypatch):
+    from backend import images
+
+    source = tmp_path / "bomb.png"
+    Image.new("L", (4000, 4000)).save(source)
+    monkeypatch.setattr(Image.Image, "load", lambda self: pytest.fail("decoded an oversized image"))
+
+    with pytest.raises(images.ImageTooLarge):
+        images.open_image(str(source), 1200, max_pixels=10_000_000)
+    with pytest.raises(images.ImageTooLarge):
+        images.open_image(str(source), 1200, max_memory=32 * 1024 * 1024)
+
+
+def test_open_image_decodes_large_jpeg_in_draft_mode(tmp_path):
+    from backend import images
+
+    source = tmp_path / "large.jpg"
+    Image.new("RGB", (6000, 4500), (10, 20, 30)).save(source)
+
+    # Полный размер (6000x4500) превышает бюджет памяти, но draft() декодирует JPEG в масштабе 1/4.
+    img = images.open_image(str(source), 1200, max_memory=32 * 1024 * 1024)
+
+    assert img.mode == "RGB"
+    assert img.size == (1500, 1125)
+
+
+def test_open_image_reduces_large_png(tmp_path):
+    from backend import images
+
+    source = tmp_path / "large.png"
+    Image.new("P", (6000, 3000)).save(source)
+
+    img = images.open_image(str(source), 600)
+
+    assert img.mode == "RGB"
+    assert img.size == (1200, 600)
+
+
+def test_oversized_upload_is_rejected():
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    from backend.serializers import UserProfileSerializer
+
+    upload = BytesIO()
+    Image.new("L", (8000, 6000)).save(upload, format="PNG")
+    serializer = UserProfileSerializer(data={
+        "avatar": SimpleUploadedFile("huge.png", upload.getvalue(), content_type="image/png"),
+    })
+
+    assert not serializer.is_valid()
+    assert "пикселей" in str(serializer.errors["avatar"])
+
+
+def upload(name, color=(10, 20, 30)):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    content = BytesIO()
+    Image.new("RGB", (800, 600), color).save(content, format="JPEG")
+    return SimpleUploadedFile(name, content.getvalue(), content_type="image/jpeg")
+
+
+def test_identical_uploads_are_stored_and_processed_once(supplier, settings, tmp_path, monkeypatch, make_shop_product):
+    from backend import tasks
+    from backend.models import ImageBlob
+
+    settings.MEDIA_ROOT = tmp_path
+    settings.RENDITION_EAGER_WIDTHS = [1200, 600, 300, 150]
+    calls = []
+    original = tasks.make_renditions
+    monkeypatch.setattr(tasks, "make_renditions", lambda path, **kwargs: calls.append(path) or original(path, **kwargs))
+    products = []
+    for i, name in enumerate(["red.jpg", "blue.jpg", "other.jpg"]):
+        product = make_shop_product(supplier, name=f"Variant {i}").product
+        product.image = upload(name, color=(10, 20, 30) if i < 2 else (200, 0, 0))
+        product.save()
+        products.append(product)
+
+    assert products[0].image.name == products[1].image.name != products[2].image.name
+    assert sorted(ImageBlob.objects.values_list("ref_count", flat=True)) == [1, 2]
+    assert len(list((tmp_path / "images").rglob("*.jpg"))) == 2
+
+    for product in products:
+        generate_product_thumbnail(product.pk)
+
+    assert len(calls) == 2
+    first, second, _ = Product.objects.filter(pk__in=[p.pk for p in products]).order_by("pk")
+    assert first.thumbnail.name == second.thumbnail.name
+    assert first.renditions.count() == 8
+
+
+def test_unreferenced_images_are_garbage_collected(supplier, settings, tmp_path, make_shop_product):
+    from backend.image_storage import collect_image_garbage
+    from backend.models import ImageBlob, ImageRendition
+
+    settings.MEDIA_ROOT = tmp_path
+    products = []
+    for i in range(2):
+        product = make_shop_product(supplier, name=f"Variant {i}").product
+        product.image = upload(f"variant{i}.jpg")
+        product.save()
+        products.append(product)
+    generate_product_thumbnail(products[0].pk)
+    blob = ImageBlob.objects.get()
+
+    products[0].delete()
+    assert collect_image_garbage(grace_period=0) == 0
+    assert ImageBlob.objects.get().ref_count == 1
+
+    products[1].image = upload("replacement.jpg", color=(0, 0, 200))
+    products[1].save()
+    assert collect_image_garbage(grace_period=3600) == 0
+    assert collect_image_garbage(grace_period=0) == 1
+
+    assert not ImageBlob.objects.filter(pk=blob.pk).exists()
+    assert not ImageRendition.objects.exists()
+    assert not (tmp_path / blob.file.name).exists()
+    assert not list((tmp_path / "renditions").iterdir())
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    from django_redis import get_redis_connection
+
+    from backend import tasks
+
+    redis = get_redis_connection("default")
+    for key in redis.keys("thumbnails:*"):
+        redis.delete(key)
+    calls = []
+    monkeypatch.setattr(tasks.generate_thumbnail_batch, "apply_async", lambda args, countdown: calls.append(args))
+    yield calls
+    for key in redis.keys("thumbnails:*"):
+        redis.delete(key)
+
+
+def test_unchanged_image_content_enqueues_nothing(supplier, settings, tmp_path, batches,
+                                                  django_capture_on_commit_callbacks, make_shop_product):
+    from rest_framework.test import APIClient
+
+    from backend.thumbnails import pop_pending_thumbnails
+
+    settings.MEDIA_ROOT = tmp_path
+    product = make_shop_product(supplier).product
+    client = APIClient()
+    client.force_authenticate(user=supplier)
+
+    def patch(data):
+        with django_capture_on_commit_callbacks(execute=True):
+            assert client.patch(f"/products/{product.pk}/", data, format="multipart").status_code == 200
+
+    patch({"image": upload("photo.jpg")})
+    assert batches == [("product",)]
+    assert pop_pending_thumbnails("product") == [product.pk]
+    Product.objects.filter(pk=product.pk).update(thumbnail="products/thumbnails/photo.jpg")
+
+    patch({"image": upload("same_photo_again.jpg")})
+    patch({"name": "Renamed"})
+    assert batches == [("product",)]
+    assert pop_pending_thumbnails("product") == []
+
+
+def test_thumbnail_requests_are_coalesced_into_one_batch(products, batches, django_capture_on_commit_callbacks):
+    from backend.tasks import generate_thumbnail_batch
+    from backend.thumbnails import schedule_thumbnail
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for product in products:
+            schedule_thumbnail("product", product.pk)
+            schedule_thumbnail("product", product.pk)
+    assert batches == [("product",)]
+
+    assert generate_thumbnail_batch("product") == 5
+    for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+        with Image.open(product.thumbnail.path) as thumbnail:
+            assert thumbnail.size == (300, 200)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        schedule_thumbnail("product", products[0].pk)
+    assert batches == [("product",), ("product",)]
+
+
+def test_reuploading_same_image_keeps_reference_count(supplier, settings, tmp_path, make_shop_product):
+    from backend.models import ImageBlob
+
+    settings.MEDIA_ROOT = tmp_path
+    product = make_shop_product(supplier, name="Variant").product
+    for _ in range(3):
+        product.image = upload("same.jpg")
+        product.save()
+    assert ImageBlob.objects.get().ref_count == 1
+
+    product.image = upload("other.jpg", color=(0, 0, 200))
+    product.name = "x" * 101
+    with pytest.raises(DataError):
+        product.save()
+    assert list(ImageBlob.objects.values_list("ref_count", flat=True)) == [1]
+
+    Product.objects.get(pk=product.pk).delete()
+    assert ImageBlob.objects.get().ref_count == 0
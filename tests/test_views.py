@@ -1,8 +1,10 @@
 import pytest
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
-from backend.models import Shop, ProductCategory, Product
+from backend.models import Shop, ProductCategory, Product, Order, OrderProduct
 
 @pytest.fixture
 def client():
@@ -70,4 +72,34 @@ def test_product_detail_view(client, db, user):
     category = ProductCategory.objects.create(name="Test Category", user=user, shop=shop)
     product = Product.objects.create(name="Product", category=category, user=user)
     response = client.get(reverse('product_detail', args=[product.id]))
-    assert response.status_code in [200, 404]
\ No newline at end of file
+    assert response.status_code in [200, 404]
+
+
+@pytest.mark.django_db
+def test_profile_view_is_paginated_in_constant_queries(client, user, make_shop_product):
+    client.force_login(user)
+    shop_products = [make_shop_product(user, name=f"Product {i}") for i in range(3)]
+
+    def orders_page_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse('profile'))
+        assert response.status_code == 200
+        return [query for query in context.captured_queries if '"backend_' in query["sql"]
+                and query["sql"].startswith("SELECT")]
+
+    Order.objects.create(user=user, status_choice="done")
+    baseline = len(orders_page_queries())
+    for _ in range(25):
+        order = Order.objects.create(user=user, status_choice="done")
+        OrderProduct.objects.bulk_create(
+            OrderProduct(order=order, product=line.product, shop_product=line, quantity=1,
+                         **OrderProduct.snapshot(line))
+            for line in shop_products
+        )
+
+    queries = orders_page_queries()
+    assert len(queries) == baseline
+    # Позиции выводятся по снимку, текущая карточка товара не читается.
+    assert not any('"backend_product"' in query["sql"] for query in queries)
+    response = client.get(reverse('profile'), {"page": 3})
+    assert len(response.context["orders"]) == 6